@@ -3,6 +3,7 @@
 """
 import asyncio
 from db.session import async_session_maker, init_db
+from services.workout_catalog import catalog_reload_notice
 from services.workouts import create_workout_template
 
 # Тренировки для недостающих дней (Вт=1, Чт=3, Сб=5)
@@ -132,6 +133,7 @@ async def add_missing_workouts():
     
     print(f"\n✅ Загружено: {loaded}")
     print(f"⏭ Пропущено: {skipped}")
+    print(catalog_reload_notice())
 
 
 if __name__ == "__main__":
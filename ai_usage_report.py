@@ -0,0 +1,22 @@
+"""
+Отчет о расходе токенов AI по функциям и пользователям
+
+Запуск: python ai_usage_report.py [дней]
+"""
+import asyncio
+import sys
+
+from db.session import async_session_maker, init_db
+from services.ai_usage import get_token_usage_report, render_token_usage_report
+
+
+async def main():
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 7
+    await init_db()
+    async with async_session_maker() as session:
+        report = await get_token_usage_report(session, days=days)
+    print(render_token_usage_report(report))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
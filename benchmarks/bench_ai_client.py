@@ -0,0 +1,89 @@
+"""
+Бенчмарк HTTP-клиента AI: новая ClientSession на каждый вызов (как было)
+против общего GroqClient с пулом соединений.
+
+Локальный stub-сервер отвечает в формате chat/completions, поэтому
+измеряется только стоимость соединений, а не генерация.
+
+Запуск: python -m benchmarks.bench_ai_client [параллельных запросов] [раундов]
+"""
+import asyncio
+import statistics
+import sys
+import time
+
+import aiohttp
+from aiohttp import web
+
+from services.ai_providers import GroqClient
+
+STUB_RESPONSE = {"choices": [{"message": {"content": "Тамаша жұмыс!"}}]}
+
+
+async def stub_handler(request: web.Request) -> web.Response:
+    await request.json()
+    await asyncio.sleep(0.005)
+    return web.json_response(STUB_RESPONSE)
+
+
+async def start_stub() -> tuple[web.AppRunner, str]:
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", stub_handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/v1/chat/completions"
+
+
+async def call_with_new_session(url: str, messages: list) -> str:
+    """Старый вариант _call_groq: сессия и соединение на каждый вызов"""
+    async with aiohttp.ClientSession() as session:
+        async with session.post(url, json={"messages": messages}) as response:
+            data = await response.json()
+            return data["choices"][0]["message"]["content"]
+
+
+async def measure(call, concurrency: int, rounds: int) -> list[float]:
+    latencies = []
+
+    async def one():
+        started = time.perf_counter()
+        await call()
+        latencies.append(time.perf_counter() - started)
+
+    for _ in range(rounds):
+        await asyncio.gather(*(one() for _ in range(concurrency)))
+    return latencies
+
+
+def report(name: str, latencies: list[float]):
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(
+        f"{name:<22} mean {statistics.mean(latencies) * 1000:6.1f} мс, "
+        f"p95 {p95 * 1000:6.1f} мс"
+    )
+
+
+async def main(concurrency: int, rounds: int):
+    runner, url = await start_stub()
+    messages = [{"role": "user", "content": "Сәлем"}]
+
+    latencies = await measure(lambda: call_with_new_session(url, messages), concurrency, rounds)
+    report("Новая сессия на вызов", latencies)
+
+    client = GroqClient(api_url=url, limit_per_host=concurrency)
+    await client.chat(messages)  # прогрев пула
+    latencies = await measure(lambda: client.chat(messages), concurrency, rounds)
+    report("Общий GroqClient", latencies)
+    await client.close()
+
+    await runner.cleanup()
+
+
+if __name__ == "__main__":
+    concurrency = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    asyncio.run(main(concurrency, rounds))
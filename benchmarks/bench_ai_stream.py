@@ -0,0 +1,81 @@
+"""
+Бенчмарк потокового ответа AI на локальном SSE stub-сервере.
+
+Сервер генерирует ответ по токену с задержкой, как настоящая модель.
+Сравнивается время до первых слов при потоковом режиме и время
+до полного ответа в обычном режиме.
+
+Запуск: python -m benchmarks.bench_ai_stream [токенов] [мс на токен]
+"""
+import asyncio
+import json
+import sys
+import time
+
+from aiohttp import web
+
+from services.ai_providers import GroqClient
+
+
+def make_stub(tokens: int, delay: float):
+    async def handler(request: web.Request) -> web.StreamResponse:
+        payload = await request.json()
+        words = [f"сөз{i} " for i in range(tokens)]
+
+        if not payload.get("stream"):
+            await asyncio.sleep(tokens * delay)
+            return web.json_response(
+                {"choices": [{"message": {"content": "".join(words)}}]}
+            )
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for word in words:
+            await asyncio.sleep(delay)
+            chunk = {"choices": [{"delta": {"content": word}}]}
+            await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode())
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    return handler
+
+
+async def main(tokens: int, delay: float):
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", make_stub(tokens, delay))
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    client = GroqClient(api_url=f"http://127.0.0.1:{port}/v1/chat/completions")
+    messages = [{"role": "user", "content": "Сәлем"}]
+
+    started = time.perf_counter()
+    full = await client.chat(messages)
+    blocking = time.perf_counter() - started
+
+    started = time.perf_counter()
+    first_chunk = None
+    streamed = ""
+    async for chunk in client.chat_stream(messages):
+        if first_chunk is None:
+            first_chunk = time.perf_counter() - started
+        streamed += chunk
+    streaming_total = time.perf_counter() - started
+
+    assert streamed.strip() == full
+    print(f"Обычный режим: ответ через {blocking * 1000:.0f} мс")
+    print(f"Поток: первые слова через {first_chunk * 1000:.0f} мс, "
+          f"весь ответ через {streaming_total * 1000:.0f} мс")
+
+    await client.close()
+    await runner.cleanup()
+
+
+if __name__ == "__main__":
+    tokens = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    delay_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+    asyncio.run(main(tokens, delay_ms / 1000))
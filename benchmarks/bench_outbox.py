@@ -0,0 +1,75 @@
+"""
+Бенчмарк очереди исходящих сообщений на фейковом боте.
+
+Проверяет, что устойчивая скорость отправки держится у глобального лимита,
+ни один чат не получает больше TELEGRAM_CHAT_RATE сообщений в секунду,
+а интерактивные сообщения обгоняют массовую рассылку.
+
+Запуск: python -m benchmarks.bench_outbox [сообщений] [чатов]
+(по умолчанию 200 сообщений на 10 чатов: по 20 на чат - больше burst, а чатов
+меньше глобального лимита, иначе скорость чата ограничит общий лимит, а не лимит чата)
+"""
+import asyncio
+import sys
+import time
+from collections import defaultdict
+
+from services.outbox import Outbox, PRIORITY_BULK, PRIORITY_INTERACTIVE
+
+
+class FakeBot:
+    """Бот, который только записывает время каждой отправки"""
+
+    def __init__(self, latency: float = 0.02):
+        self.latency = latency
+        self.sent: list[tuple[float, int]] = []
+
+    async def send_message(self, chat_id: int, text: str, **kwargs):
+        await asyncio.sleep(self.latency)
+        self.sent.append((time.monotonic(), chat_id))
+        return text
+
+
+async def run(total: int, chats: int):
+    bot = FakeBot()
+    outbox = Outbox(bot)
+    outbox.start()
+
+    started = time.monotonic()
+    bulk = [
+        outbox.enqueue(i % chats, f"bulk {i}", priority=PRIORITY_BULK)
+        for i in range(total)
+    ]
+    # Интерактивный ответ, поставленный после всей рассылки
+    await asyncio.sleep(0.5)
+    interactive_start = time.monotonic()
+    await outbox.send(chats + 1, "reply", priority=PRIORITY_INTERACTIVE)
+    interactive_latency = time.monotonic() - interactive_start
+
+    await asyncio.gather(*bulk)
+    elapsed = time.monotonic() - started
+    await outbox.stop()
+
+    per_chat = defaultdict(list)
+    for at, chat_id in bot.sent:
+        per_chat[chat_id].append(at)
+    chat_rates = [
+        (len(times) - outbox.chat_burst) / (times[-1] - times[0])
+        for times in per_chat.values()
+        if len(times) > outbox.chat_burst and times[-1] > times[0]
+    ]
+
+    print(f"Сообщений: {len(bot.sent)}, чатов: {chats}")
+    print(f"Время: {elapsed:.2f} с, устойчивая скорость: {len(bot.sent) / elapsed:.1f} msg/s")
+    if chat_rates:
+        print(f"Худшая скорость на чат после burst: {max(chat_rates):.2f} msg/s")
+    else:
+        print(f"Лимит чата не проверен: ни один чат не получил больше {outbox.chat_burst} сообщений")
+    print(f"Задержка интерактивного ответа: {interactive_latency * 1000:.0f} мс")
+    print(f"Статистика: {outbox.stats}")
+
+
+if __name__ == "__main__":
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    chats = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    asyncio.run(run(total, chats))
@@ -0,0 +1,106 @@
+"""
+Бенчмарк профиля SQLite под нагрузкой записи: параллельные завершения
+тренировок (complete_workout_transaction) на движке без настроек
+(как было: без пула, rollback-журнал, synchronous=FULL), на движке
+db.session.create_engine (WAL, synchronous=NORMAL, busy_timeout, пул)
+и через единственного писателя db.writer с групповым commit.
+
+Считаются завершения в секунду и ошибки "database is locked".
+
+Запуск: python -m benchmarks.bench_sqlite_profile [завершений] [параллельно]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from sqlalchemy import select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from db.models import Base, User, Workout
+from db.session import create_engine
+from db.writer import DBWriter
+from services.achievements import init_achievements
+from services.workout_catalog import load_workout_catalog
+from services.workouts import complete_workout_transaction
+
+
+async def prepare(engine, users: int) -> tuple[async_sessionmaker, list[int], int]:
+    session_maker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with session_maker() as session:
+        workout = Workout(
+            code="bench_full_body",
+            title="Бүкіл денеге жаттығу",
+            goal="stay_fit",
+            level="beginner",
+            workout_type="home",
+            day_index=0,
+            exercises_json=[]
+        )
+        session.add(workout)
+        session.add_all(User(telegram_id=1000 + i, goal="stay_fit") for i in range(users))
+        await session.commit()
+        await init_achievements(session)
+        await load_workout_catalog(session)
+        result = await session.execute(select(User.id).order_by(User.id))
+        return session_maker, list(result.scalars()), workout.id
+
+
+async def run(name: str, engine, completions: int, concurrency: int, writer: DBWriter | None = None):
+    session_maker, user_ids, workout_id = await prepare(engine, completions)
+    if writer is not None:
+        writer.start()
+    queue = asyncio.Queue()
+    for user_id in user_ids:
+        queue.put_nowait(user_id)
+    locked = 0
+
+    async def worker():
+        nonlocal locked
+        while not queue.empty():
+            user_id = queue.get_nowait()
+            try:
+                if writer is None:
+                    async with session_maker() as session:
+                        await complete_workout_transaction(session, user_id, workout_id, "normal")
+                else:
+                    await writer.submit(
+                        lambda s: complete_workout_transaction(s, user_id, workout_id, "normal")
+                    )
+            except OperationalError as e:
+                if "locked" not in str(e):
+                    raise
+                locked += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    done = completions - locked
+    line = f"{name:<16} {done / elapsed:7.1f} завершений/сек, database is locked: {locked}"
+    if writer is not None:
+        await writer.stop()
+        line += f", записей на commit: {writer.avg_batch():.1f}"
+    print(line)
+    await engine.dispose()
+
+
+async def main(completions: int, concurrency: int):
+    directory = tempfile.mkdtemp()
+    print(f"{completions} завершений, {concurrency} параллельно")
+    default = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(directory, 'default.db')}")
+    await run("Без настроек", default, completions, concurrency)
+    tuned = create_engine(f"sqlite+aiosqlite:///{os.path.join(directory, 'tuned.db')}")
+    await run("Профиль SQLite", tuned, completions, concurrency)
+    url = f"sqlite+aiosqlite:///{os.path.join(directory, 'queue.db')}"
+    writer = DBWriter(engine=create_engine(url, pool_size=1, max_overflow=0, begin_immediate=True))
+    await run("Очередь записи", writer.engine, completions, concurrency, writer)
+
+
+if __name__ == "__main__":
+    completions = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    asyncio.run(main(completions, concurrency))
@@ -0,0 +1,105 @@
+"""
+Бенчмарк кэша профилей: SQL-запросов на апдейт при загрузке профиля
+в каждом хендлере (как было) и через user_profile_middleware с кэшем.
+
+Поток апдейтов: у активных пользователей подряд идет несколько апдейтов
+(меню, план, прогресс), часть апдейтов - завершение тренировки, которое
+пишет streak (update_streak кладет в кэш свежий снимок).
+БД - временный SQLite-файл, запросы считаются по событию before_cursor_execute.
+
+Запуск: python -m benchmarks.bench_user_cache [пользователей] [апдейтов]
+"""
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from db.models import Base, User
+from services.achievements import update_streak
+from services.user_cache import UserProfileCache, get_user_profile
+from services.users import get_user_by_telegram_id
+import services.user_cache as user_cache
+
+# Доля апдейтов, которые пишут профиль (завершение тренировки)
+WRITE_RATIO = 0.05
+
+
+def make_updates(users: int, updates: int) -> list[tuple[int, bool]]:
+    """(telegram_id, пишет ли апдейт) - пользователи приходят сериями апдейтов"""
+    rng = random.Random(42)
+    stream = []
+    while len(stream) < updates:
+        telegram_id = 1000 + int(rng.paretovariate(1.2)) % users
+        for _ in range(rng.randint(1, 6)):
+            stream.append((telegram_id, rng.random() < WRITE_RATIO))
+    return stream[:updates]
+
+
+async def run(session_maker, stream, cached: bool, counter: dict) -> float:
+    started = time.perf_counter()
+    for telegram_id, writes in stream:
+        counter["phase"] = "profile"
+        if cached:
+            profile = await get_user_profile(session_maker, telegram_id)
+        else:
+            async with session_maker() as session:
+                profile = await get_user_by_telegram_id(session, telegram_id)
+        assert profile is not None
+        if writes:
+            # Запросы записи одинаковы в обоих вариантах - считаются отдельно
+            counter["phase"] = "write"
+            async with session_maker() as session:
+                user = await session.get(User, profile.id)
+                user.last_workout_date = None
+                await update_streak(session, user)
+    return time.perf_counter() - started
+
+
+async def main(users: int, updates: int):
+    path = os.path.join(tempfile.mkdtemp(), "bench_user_cache.db")
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    session_maker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with session_maker() as session:
+        session.add_all(
+            User(telegram_id=1000 + i, goal="stay_fit", level="beginner", workout_type="home")
+            for i in range(users)
+        )
+        await session.commit()
+
+    counter = {"phase": "profile", "profile": 0, "write": 0}
+
+    def count(*args):
+        counter[counter["phase"]] += 1
+
+    event.listen(engine.sync_engine, "before_cursor_execute", count)
+    stream = make_updates(users, updates)
+    writes = sum(1 for _, w in stream if w)
+    print(f"{len(stream)} апдейтов, {users} пользователей, записей профиля: {writes}")
+
+    for name, cached in (("Загрузка в хендлере", False), ("Middleware + кэш", True)):
+        user_cache._cache = UserProfileCache()
+        counter["profile"] = counter["write"] = 0
+        elapsed = await run(session_maker, stream, cached, counter)
+        line = (
+            f"{name:<20} запросов профиля на апдейт {counter['profile'] / len(stream):.3f}, "
+            f"{elapsed * 1000:7.1f} мс"
+        )
+        if cached:
+            cache = user_cache.get_user_profile_cache()
+            line += f", hit rate {cache.hit_rate():.1%}"
+        print(line)
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    updates = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    asyncio.run(main(users, updates))
@@ -0,0 +1,98 @@
+"""
+Бенчмарк завершения тренировки: цепочка сервисов с commit после каждого
+шага (как было в process_feeling) против complete_workout_transaction
+с одним commit.
+
+БД - временный SQLite-файл (каждый commit - запись на диск).
+Каждое завершение - отдельный пользователь, чтобы streak обновлялся.
+
+Запуск: python -m benchmarks.bench_workout_completion [завершений]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from db.models import Base, User, Workout
+from services.achievements import check_and_award_achievements, init_achievements, update_streak
+from services.users import get_user_by_telegram_id
+from services.workout_catalog import load_workout_catalog
+from services.workouts import complete_workout_transaction, mark_workout_completed
+
+
+async def complete_legacy(session_maker, telegram_id: int, workout_id: int):
+    """Старый process_feeling: четыре сервиса, три commit"""
+    async with session_maker() as session:
+        user = await get_user_by_telegram_id(session, telegram_id)
+        await mark_workout_completed(session, user.id, workout_id, feeling="normal")
+        await update_streak(session, user)
+        await check_and_award_achievements(session, user)
+        workout = await session.get(Workout, workout_id)
+        return workout.title
+
+
+async def complete_transaction(session_maker, user_id: int, workout_id: int):
+    async with session_maker() as session:
+        completion = await complete_workout_transaction(session, user_id, workout_id, "normal")
+        return completion.workout_title
+
+
+async def main(completions: int):
+    path = os.path.join(tempfile.mkdtemp(), "bench_workout_completion.db")
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    session_maker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with session_maker() as session:
+        workout = Workout(
+            code="bench_full_body",
+            title="Бүкіл денеге жаттығу",
+            goal="stay_fit",
+            level="beginner",
+            workout_type="home",
+            day_index=0,
+            exercises_json=[]
+        )
+        session.add(workout)
+        session.add_all(User(telegram_id=1000 + i, goal="stay_fit") for i in range(completions * 2))
+        await session.commit()
+        workout_id = workout.id
+        await init_achievements(session)
+        await load_workout_catalog(session)
+        result = await session.execute(select(User.id, User.telegram_id).order_by(User.id))
+        users = result.all()
+
+    statements = 0
+
+    def count(*args):
+        nonlocal statements
+        statements += 1
+
+    event.listen(engine.sync_engine, "before_cursor_execute", count)
+
+    runs = (
+        ("Commit на каждом шаге", lambda u: complete_legacy(session_maker, u.telegram_id, workout_id)),
+        ("Одна транзакция", lambda u: complete_transaction(session_maker, u.id, workout_id)),
+    )
+    for index, (name, complete) in enumerate(runs):
+        batch = users[index * completions:(index + 1) * completions]
+        statements = 0
+        started = time.perf_counter()
+        for user in batch:
+            await complete(user)
+        elapsed = time.perf_counter() - started
+        print(
+            f"{name:<22} {completions / elapsed:7.1f} завершений/сек, "
+            f"{statements / completions:.1f} SQL-запросов на завершение"
+        )
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    completions = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    asyncio.run(main(completions))
@@ -1,6 +1,7 @@
 """
 Конфигурация бота
 """
+import hashlib
 import os
 from dotenv import load_dotenv
 
@@ -16,10 +17,89 @@ class Config:
     
     # Database
     DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///fitness_bot.db")
+    # Пул соединений: постоянных, сверх них и ожидание свободного (сек).
+    # SQLite пишет в один поток, поэтому большой пул ему не нужен
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+    DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+    # Профиль SQLite (PRAGMA на каждом подключении): журнал, синхронизация,
+    # кэш страниц (отрицательное - в КиБ), mmap (байт), временные таблицы,
+    # ожидание блокировки (мс)
+    SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL").upper()
+    SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL").upper()
+    SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-65536"))
+    SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+    SQLITE_TEMP_STORE = os.getenv("SQLITE_TEMP_STORE", "MEMORY").upper()
+    SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", "5000"))
+    # Запись в SQLite: direct - каждая сессия пишет сама; queue - записи хендлеров
+    # идут через один поток записи (db.writer) с групповым commit, а сессии
+    # апдейтов берутся из отдельного пула соединений только для чтения.
+    # Пачка: ожидание попутных записей (сек), записей в пачке, длина очереди
+    DB_WRITE_MODE = os.getenv("DB_WRITE_MODE", "direct")
+    DB_WRITER_BATCH_DELAY = float(os.getenv("DB_WRITER_BATCH_DELAY", "0.002"))
+    DB_WRITER_BATCH_SIZE = int(os.getenv("DB_WRITER_BATCH_SIZE", "100"))
+    DB_WRITER_QUEUE_SIZE = int(os.getenv("DB_WRITER_QUEUE_SIZE", "10000"))
+    # Сколько секунд при остановке дописывать очередь, потом записи отклоняются
+    DB_WRITER_STOP_TIMEOUT = float(os.getenv("DB_WRITER_STOP_TIMEOUT", "10"))
     
-    # Webhook (для production)
+    # Каталог тренировок в памяти: через сколько секунд перечитать шаблоны
+    # (подхватывает load_workouts.py / add_workouts.py, запущенные отдельно; 0 - никогда)
+    WORKOUT_CATALOG_TTL = int(os.getenv("WORKOUT_CATALOG_TTL", "300"))
+    
+    # Исходящие сообщения: лимиты Telegram (сообщений/сек) и число воркеров очереди
+    TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "30"))
+    TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))
+    TELEGRAM_CHAT_BURST = int(os.getenv("TELEGRAM_CHAT_BURST", "3"))
+    OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", "30"))
+    
+    # Фоновые задачи (AI-совет после тренировки): воркеров и размер очереди
+    BACKGROUND_WORKERS = int(os.getenv("BACKGROUND_WORKERS", "4"))
+    BACKGROUND_QUEUE_SIZE = int(os.getenv("BACKGROUND_QUEUE_SIZE", "1000"))
+    # Сколько секунд при остановке ждать оставшиеся задачи, потом они отменяются
+    BACKGROUND_DRAIN_TIMEOUT = float(os.getenv("BACKGROUND_DRAIN_TIMEOUT", "30"))
+    
+    # Недельный отчет: день недели (mon..sun) и время рассылки
+    WEEKLY_REPORT_DAY = os.getenv("WEEKLY_REPORT_DAY", "sun")
+    WEEKLY_REPORT_TIME = os.getenv("WEEKLY_REPORT_TIME", "20:00")
+    
+    # Webhook (для production): если задан WEBHOOK_URL (https://host), бот
+    # принимает обновления на WEBHOOK_URL + WEBHOOK_PATH вместо long polling
     WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
     WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+    # Секрет заголовка X-Telegram-Bot-Api-Secret-Token; по умолчанию выводится
+    # из токена, чтобы у всех воркеров за балансировщиком он совпадал
+    WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or (
+        hashlib.sha256(BOT_TOKEN.encode()).hexdigest()[:32] if BOT_TOKEN else ""
+    )
+    WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+    # Снимать webhook при остановке (не включать, если воркеров несколько)
+    WEBHOOK_DELETE_ON_SHUTDOWN = os.getenv("WEBHOOK_DELETE_ON_SHUTDOWN", "false").lower() == "true"
+    # Сколько секунд при остановке ждать обработку уже принятых обновлений
+    WEBHOOK_DRAIN_TIMEOUT = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", "30"))
+    WEBAPP_HOST = os.getenv("WEBAPP_HOST", "0.0.0.0")
+    WEBAPP_PORT = int(os.getenv("WEBAPP_PORT", "8080"))
+    HEALTH_PATH = os.getenv("HEALTH_PATH", "/health")
+    
+    # Планировщик напоминаний и отчетов: включать только в одном воркере
+    SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "true").lower() == "true"
+    
+    # FSM-хранилище (шаги диалогов): db - таблица fsm_states, memory - в памяти процесса
+    FSM_STORAGE = os.getenv("FSM_STORAGE", "db").lower()
+    FSM_DATABASE_URL = os.getenv("FSM_DATABASE_URL", "")  # пусто - основная БД
+    # Через сколько секунд без активности состояние считается брошенным
+    FSM_TTL = int(os.getenv("FSM_TTL", str(7 * 24 * 3600)))
+    # Кэш чтения в процессе: сколько секунд доверять кэшу и сколько ключей держать.
+    # По умолчанию 0: воркеры не видят чужих изменений, поэтому включать кэш
+    # (например, 300) можно только при одном воркере или привязке пользователя к воркеру
+    FSM_CACHE_TTL = float(os.getenv("FSM_CACHE_TTL", "0"))
+    FSM_CACHE_SIZE = int(os.getenv("FSM_CACHE_SIZE", "10000"))
+    # Изменения пишутся в конце обработки апдейта и не реже раза в FSM_FLUSH_INTERVAL сек
+    FSM_FLUSH_INTERVAL = float(os.getenv("FSM_FLUSH_INTERVAL", "1"))
+
+    # Кэш профилей пользователей: сколько секунд доверять снимку и сколько держать.
+    # При нескольких воркерах снимок другого воркера устаревает не дольше USER_CACHE_TTL
+    USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "300"))
+    USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
     
     # Ollama AI (deprecated)
     OLLAMA_API_KEY = os.getenv("OLLAMA_API_KEY", "")
@@ -27,6 +107,81 @@ class Config:
     # Groq AI (fast & free) - set via environment variable
     GROQ_API_KEY = os.getenv("GROQ_API_KEY", "")
     
+    # HTTP-клиент AI: соединений на хост, keep-alive (сек), кэш DNS (сек)
+    AI_CONNECTION_LIMIT = int(os.getenv("AI_CONNECTION_LIMIT", "20"))
+    AI_KEEPALIVE_TIMEOUT = float(os.getenv("AI_KEEPALIVE_TIMEOUT", "60"))
+    AI_DNS_CACHE_TTL = int(os.getenv("AI_DNS_CACHE_TTL", "300"))
+    
+    # Шлюз AI: одновременных запросов и размер очереди ожидания (дальше - fallback)
+    AI_MAX_CONCURRENCY = int(os.getenv("AI_MAX_CONCURRENCY", "10"))
+    AI_MAX_WAITING = int(os.getenv("AI_MAX_WAITING", "50"))
+    
+    # Кэш ответов AI: записей в памяти, TTL (сек), вариантов ответа на ключ,
+    # шаг округления веса (кг), файл SQLite для кэша на диске ("" - только память)
+    AI_CACHE_SIZE = int(os.getenv("AI_CACHE_SIZE", "1000"))
+    AI_CACHE_TTL = int(os.getenv("AI_CACHE_TTL", str(7 * 24 * 3600)))
+    AI_CACHE_VARIANTS = int(os.getenv("AI_CACHE_VARIANTS", "3"))
+    AI_CACHE_WEIGHT_STEP = int(os.getenv("AI_CACHE_WEIGHT_STEP", "5"))
+    AI_CACHE_PATH = os.getenv("AI_CACHE_PATH", "ai_cache.db")
+    
+    # Потоковый ответ AI-тренера: правка сообщения раз в AI_STREAM_EDIT_INTERVAL сек;
+    # накопилось AI_STREAM_EDIT_CHARS новых символов - раньше, но не чаще
+    # раза в AI_STREAM_EDIT_MIN_INTERVAL сек (лимит правок Telegram)
+    AI_STREAM_EDIT_INTERVAL = float(os.getenv("AI_STREAM_EDIT_INTERVAL", "2.0"))
+    AI_STREAM_EDIT_MIN_INTERVAL = float(os.getenv("AI_STREAM_EDIT_MIN_INTERVAL", "1.0"))
+    AI_STREAM_EDIT_CHARS = int(os.getenv("AI_STREAM_EDIT_CHARS", "400"))
+    
+    # Время на один ответ AI (сек), включая все повторы
+    AI_TIMEOUT = float(os.getenv("AI_TIMEOUT", "30"))
+    
+    # Провайдер AI: auto (groq при наличии ключа, иначе local), groq, openai, local
+    AI_PROVIDER = os.getenv("AI_PROVIDER", "auto").lower()
+    GROQ_MODEL = os.getenv("GROQ_MODEL", "llama-3.3-70b-versatile")  # Лучшая поддержка казахского
+    # OpenAI-совместимый endpoint (AI_PROVIDER=openai)
+    AI_API_URL = os.getenv("AI_API_URL", "")
+    AI_API_KEY = os.getenv("AI_API_KEY", "")
+    AI_MODEL = os.getenv("AI_MODEL", "")
+    
+    # Таймауты по типу вызова (сек): совет после тренировки, питание, AI-тренер
+    AI_ADVICE_TIMEOUT = float(os.getenv("AI_ADVICE_TIMEOUT", str(AI_TIMEOUT)))
+    AI_NUTRITION_TIMEOUT = float(os.getenv("AI_NUTRITION_TIMEOUT", str(AI_TIMEOUT)))
+    AI_TRAINER_TIMEOUT = float(os.getenv("AI_TRAINER_TIMEOUT", str(AI_TIMEOUT)))
+    
+    # Лимит длины ответа по функциям (для AI-тренера - верхняя граница,
+    # фактический лимит подбирается по длине и типу вопроса)
+    AI_MAX_TOKENS_ADVICE = int(os.getenv("AI_MAX_TOKENS_ADVICE", "600"))
+    AI_MAX_TOKENS_NUTRITION = int(os.getenv("AI_MAX_TOKENS_NUTRITION", "1000"))
+    AI_MAX_TOKENS_TRAINER = int(os.getenv("AI_MAX_TOKENS_TRAINER", "1000"))
+    
+    # Учет токенов: дневная квота на пользователя (0 - без квоты),
+    # сколько дней хранить статистику и как часто сбрасывать ее в БД (сек)
+    AI_DAILY_TOKEN_QUOTA = int(os.getenv("AI_DAILY_TOKEN_QUOTA", "20000"))
+    AI_USAGE_RETENTION_DAYS = int(os.getenv("AI_USAGE_RETENTION_DAYS", "30"))
+    AI_USAGE_FLUSH_INTERVAL = float(os.getenv("AI_USAGE_FLUSH_INTERVAL", "30"))
+    
+    # Память диалога AI-тренера: обменов в буфере, порог сворачивания (токены),
+    # длина краткого содержания и одного сообщения (символы), диалогов в памяти,
+    # время простоя до удаления (сек) и отдельный SQLite-файл
+    AI_MEMORY_TURNS = int(os.getenv("AI_MEMORY_TURNS", "6"))
+    AI_MEMORY_SUMMARY_TOKENS = int(os.getenv("AI_MEMORY_SUMMARY_TOKENS", "1500"))
+    AI_MEMORY_SUMMARY_CHARS = int(os.getenv("AI_MEMORY_SUMMARY_CHARS", "1000"))
+    AI_MEMORY_SUMMARY_MAX_TOKENS = int(os.getenv("AI_MEMORY_SUMMARY_MAX_TOKENS", "300"))
+    AI_MEMORY_TURN_CHARS = int(os.getenv("AI_MEMORY_TURN_CHARS", "2000"))
+    AI_MEMORY_MAX_USERS = int(os.getenv("AI_MEMORY_MAX_USERS", "2000"))
+    AI_MEMORY_IDLE_TTL = int(os.getenv("AI_MEMORY_IDLE_TTL", str(24 * 3600)))
+    AI_MEMORY_PATH = os.getenv("AI_MEMORY_PATH", "ai_memory.db")
+    
+    # Устойчивость AI: повторы и backoff (сек), максимальный Retry-After, который
+    # ждем; hedging после p95 задержки; circuit breaker (ошибок подряд, пауза в сек)
+    AI_MAX_RETRIES = int(os.getenv("AI_MAX_RETRIES", "2"))
+    AI_BACKOFF_BASE = float(os.getenv("AI_BACKOFF_BASE", "0.5"))
+    AI_BACKOFF_MAX = float(os.getenv("AI_BACKOFF_MAX", "8"))
+    AI_RETRY_AFTER_MAX = float(os.getenv("AI_RETRY_AFTER_MAX", "10"))
+    AI_HEDGE_ENABLED = os.getenv("AI_HEDGE_ENABLED", "false").lower() == "true"
+    AI_HEDGE_MIN_DELAY = float(os.getenv("AI_HEDGE_MIN_DELAY", "2"))
+    AI_BREAKER_THRESHOLD = int(os.getenv("AI_BREAKER_THRESHOLD", "5"))
+    AI_BREAKER_COOLDOWN = float(os.getenv("AI_BREAKER_COOLDOWN", "30"))
+    
     # Fitness Center Info
     CENTER_NAME = "Fitnesss"
     CENTER_ADDRESS = "Алматы қ., Абай к-сі, 190/1"
@@ -47,6 +202,24 @@ class Config:
         """Проверка обязательных настроек"""
         if not cls.BOT_TOKEN:
             raise ValueError("BOT_TOKEN не установлен в .env файле")
+        if cls.WEBHOOK_URL and not cls.WEBHOOK_URL.startswith("https://"):
+            raise ValueError("WEBHOOK_URL должен начинаться с https://")
+        if cls.SQLITE_JOURNAL_MODE not in ("WAL", "DELETE", "TRUNCATE", "PERSIST", "MEMORY", "OFF"):
+            raise ValueError(f"Неизвестный SQLITE_JOURNAL_MODE: {cls.SQLITE_JOURNAL_MODE}")
+        if cls.SQLITE_SYNCHRONOUS not in ("OFF", "NORMAL", "FULL", "EXTRA"):
+            raise ValueError(f"Неизвестный SQLITE_SYNCHRONOUS: {cls.SQLITE_SYNCHRONOUS}")
+        if cls.SQLITE_TEMP_STORE not in ("DEFAULT", "FILE", "MEMORY"):
+            raise ValueError(f"Неизвестный SQLITE_TEMP_STORE: {cls.SQLITE_TEMP_STORE}")
+        if cls.DB_WRITE_MODE not in ("direct", "queue"):
+            raise ValueError(f"Неизвестный DB_WRITE_MODE: {cls.DB_WRITE_MODE}")
+        if cls.DB_WRITE_MODE == "queue" and not cls.DATABASE_URL.startswith("sqlite"):
+            raise ValueError("DB_WRITE_MODE=queue поддерживается только для SQLite")
+        if cls.FSM_STORAGE not in ("db", "memory"):
+            raise ValueError(f"Неизвестный FSM_STORAGE: {cls.FSM_STORAGE}")
+        if cls.AI_PROVIDER not in ("auto", "groq", "openai", "local"):
+            raise ValueError(f"Неизвестный AI_PROVIDER: {cls.AI_PROVIDER}")
+        if cls.AI_PROVIDER == "openai" and not cls.AI_API_URL:
+            raise ValueError("AI_PROVIDER=openai требует AI_API_URL")
         return True
 
 
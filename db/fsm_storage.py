@@ -0,0 +1,237 @@
+"""
+FSM-хранилище aiogram в базе данных.
+
+Состояния диалогов (онбординг, настройка напоминаний, вопрос AI-тренеру)
+переживают перезапуск и доступны всем воркерам, работающим с одной БД.
+Изменения за время обработки апдейта копятся в памяти и пишутся одной
+транзакцией в конце апдейта (flush_middleware) или фоновым сбросом.
+Чтения обслуживаются из кэша процесса не дольше FSM_CACHE_TTL секунд
+(по умолчанию 0 - кэшируются только еще не записанные изменения).
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+from sqlalchemy import delete, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+
+from config import config
+from db.models import FSMState
+from db.session import create_engine, engine as main_engine
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Entry:
+    state: str | None
+    data: dict
+    loaded_at: float = field(default_factory=time.monotonic)
+    dirty: bool = False
+
+
+class SQLStorage(BaseStorage):
+    """BaseStorage поверх таблицы fsm_states с кэшем чтения и отложенной записью"""
+
+    # Как часто удалять просроченные состояния (сек)
+    PURGE_INTERVAL = 3600
+
+    def __init__(
+        self,
+        engine: AsyncEngine | None = None,
+        key_builder: KeyBuilder | None = None,
+        ttl: int | None = None,
+        cache_ttl: float | None = None,
+        cache_size: int | None = None,
+        flush_interval: float | None = None
+    ):
+        # Отдельная БД для состояний - свой движок, иначе общий
+        self._own_engine = engine is None and bool(config.FSM_DATABASE_URL)
+        if engine is None:
+            engine = create_engine(config.FSM_DATABASE_URL) if self._own_engine else main_engine
+        self.engine = engine
+        self._session_maker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self.ttl = ttl or config.FSM_TTL
+        self.cache_ttl = config.FSM_CACHE_TTL if cache_ttl is None else cache_ttl
+        self.cache_size = cache_size or config.FSM_CACHE_SIZE
+        self.flush_interval = flush_interval or config.FSM_FLUSH_INTERVAL
+
+        self._cache: OrderedDict[str, _Entry] = OrderedDict()
+        self._dirty: set[str] = set()
+        self._flush_lock = asyncio.Lock()
+        self._flusher: asyncio.Task | None = None
+        self._purged_at = 0.0
+        self.stats = {"hits": 0, "misses": 0, "flushes": 0, "writes": 0}
+
+    async def start(self):
+        """Создать таблицу (если ее нет) и запустить фоновый сброс"""
+        async with self.engine.begin() as conn:
+            await conn.run_sync(FSMState.__table__.create, checkfirst=True)
+        self._flusher = asyncio.create_task(self._flush_loop(), name="fsm-flush")
+
+    async def close(self):
+        """Записать несохраненное и остановить фоновый сброс"""
+        if self._flusher:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        await self.flush()
+        if self._own_engine:
+            await self.engine.dispose()
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        entry = await self._entry(key)
+        entry.state = state.state if isinstance(state, State) else state
+        self._mark_dirty(key, entry)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._entry(key)).state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        entry = await self._entry(key)
+        entry.data = data.copy()
+        self._mark_dirty(key, entry)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return (await self._entry(key)).data.copy()
+
+    async def flush_middleware(
+        self,
+        handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]],
+        event: Any,
+        data: Dict[str, Any]
+    ) -> Any:
+        """Outer middleware апдейта: все изменения апдейта - одной записью в конце"""
+        try:
+            return await handler(event, data)
+        finally:
+            try:
+                await self.flush()
+            except Exception as e:
+                # Изменения остались помеченными - их запишет фоновый сброс
+                logger.error(f"FSM flush error: {e}")
+
+    async def flush(self):
+        """Записать измененные состояния одной транзакцией"""
+        if not self._dirty:
+            return
+        async with self._flush_lock:
+            names, self._dirty = self._dirty, set()
+            expires_at = time.time() + self.ttl
+            upserts, deletes = [], []
+            for name in names:
+                entry = self._cache.get(name)
+                if entry is None:
+                    continue
+                entry.dirty = False
+                if entry.state is None and not entry.data:
+                    deletes.append(name)
+                else:
+                    upserts.append({
+                        "key": name,
+                        "state": entry.state,
+                        "data": entry.data.copy(),
+                        "expires_at": expires_at
+                    })
+
+            try:
+                async with self._session_maker() as session:
+                    if upserts:
+                        await self._upsert(session, upserts)
+                    if deletes:
+                        await session.execute(delete(FSMState).where(FSMState.key.in_(deletes)))
+                    await session.commit()
+            except Exception:
+                # Вернуть пометки, чтобы запись повторилась
+                for name in names:
+                    entry = self._cache.get(name)
+                    if entry is not None:
+                        entry.dirty = True
+                self._dirty |= names
+                raise
+
+            self.stats["flushes"] += 1
+            self.stats["writes"] += len(upserts) + len(deletes)
+
+    async def purge_expired(self):
+        """Удалить брошенные состояния"""
+        async with self._session_maker() as session:
+            await session.execute(delete(FSMState).where(FSMState.expires_at < time.time()))
+            await session.commit()
+        self._purged_at = time.monotonic()
+
+    def _mark_dirty(self, key: StorageKey, entry: _Entry):
+        entry.dirty = True
+        self._dirty.add(self.key_builder.build(key))
+
+    async def _entry(self, key: StorageKey) -> _Entry:
+        name = self.key_builder.build(key)
+        entry = self._cache.get(name)
+        if entry is not None and (entry.dirty or time.monotonic() - entry.loaded_at < self.cache_ttl):
+            self._cache.move_to_end(name)
+            self.stats["hits"] += 1
+            return entry
+
+        self.stats["misses"] += 1
+        async with self._session_maker() as session:
+            result = await session.execute(
+                select(FSMState.state, FSMState.data).where(
+                    FSMState.key == name,
+                    FSMState.expires_at > time.time()
+                )
+            )
+            row = result.first()
+
+        # Пока читали, запись могла изменить кэш - она новее прочитанного
+        current = self._cache.get(name)
+        if current is not None and current.dirty:
+            return current
+
+        entry = _Entry(row.state, dict(row.data or {})) if row else _Entry(None, {})
+        self._cache[name] = entry
+        self._cache.move_to_end(name)
+        while len(self._cache) > self.cache_size:
+            oldest, oldest_entry = next(iter(self._cache.items()))
+            if oldest_entry.dirty:
+                # Несохраненное не вытесняем - после сброса освободится
+                break
+            del self._cache[oldest]
+        return entry
+
+    @staticmethod
+    async def _upsert(session: AsyncSession, rows: list[dict]):
+        dialect = session.bind.dialect.name
+        if dialect in ("sqlite", "postgresql"):
+            dialect_insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+            stmt = dialect_insert(FSMState).values(rows)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[FSMState.key],
+                set_={
+                    "state": stmt.excluded.state,
+                    "data": stmt.excluded.data,
+                    "expires_at": stmt.excluded.expires_at
+                }
+            )
+            await session.execute(stmt)
+            return
+
+        for row in rows:
+            await session.merge(FSMState(**row))
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                if time.monotonic() - self._purged_at >= self.PURGE_INTERVAL:
+                    await self.purge_expired()
+            except Exception as e:
+                logger.error(f"FSM flush error: {e}")
@@ -2,7 +2,7 @@
 Модели базы данных
 """
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, JSON, Date
+from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, JSON, Date, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 
@@ -12,6 +12,10 @@ Base = declarative_base()
 class User(Base):
     """Модель пользователя"""
     __tablename__ = "users"
+    __table_args__ = (
+        # Рассылка напоминаний выбирает пользователей по минутному слоту
+        Index("ix_users_reminder_slot", "reminder_time", "reminder_enabled"),
+    )
     
     id = Column(Integer, primary_key=True, autoincrement=True)
     telegram_id = Column(Integer, unique=True, nullable=False, index=True)
@@ -77,6 +81,11 @@ class Workout(Base):
 class UserWorkout(Base):
     """Выполненная тренировка пользователя"""
     __tablename__ = "user_workouts"
+    __table_args__ = (
+        # Статистика, отчеты, достижения и история фильтруют по user_id + диапазону дат
+        Index("ix_user_workouts_user_date", "user_id", "date"),
+        Index("ix_user_workouts_user_completed_date", "user_id", "completed", "date"),
+    )
     
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -117,6 +126,10 @@ class Achievement(Base):
 class UserAchievement(Base):
     """Достижение пользователя"""
     __tablename__ = "user_achievements"
+    __table_args__ = (
+        # Каждое достижение выдается пользователю только один раз
+        Index("ux_user_achievements_user_achievement", "user_id", "achievement_id", unique=True),
+    )
     
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -129,3 +142,35 @@ class UserAchievement(Base):
     
     def __repr__(self):
         return f"<UserAchievement(user_id={self.user_id}, achievement_id={self.achievement_id})>"
+
+
+class AITokenUsage(Base):
+    """
+    Расход токенов AI за день: пользователь x функция.
+    Одна строка на (день, пользователь, функция), старые дни удаляются.
+    """
+    __tablename__ = "ai_token_usage"
+    
+    day = Column(Date, primary_key=True)
+    user_id = Column(Integer, primary_key=True)  # 0 - вызов без пользователя
+    feature = Column(String(20), primary_key=True)  # advice, nutrition, trainer
+    
+    requests = Column(Integer, nullable=False, default=0)
+    prompt_tokens = Column(Integer, nullable=False, default=0)
+    completion_tokens = Column(Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f"<AITokenUsage(day={self.day}, user_id={self.user_id}, feature={self.feature})>"
+
+
+class FSMState(Base):
+    """Состояние FSM (шаг диалога) и его данные"""
+    __tablename__ = "fsm_states"
+    
+    key = Column(String(255), primary_key=True)  # bot:chat:user:destiny
+    state = Column(String(255))
+    data = Column(JSON)
+    expires_at = Column(Float, nullable=False, index=True)  # unix time; брошенные состояния удаляются
+    
+    def __repr__(self):
+        return f"<FSMState(key={self.key}, state={self.state})>"
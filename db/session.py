@@ -1,16 +1,92 @@
 """
 Управление сессиями базы данных
 """
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict
+
+from sqlalchemy import event, inspect, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncSession, async_sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from db.models import Base
 from config import config
 
+logger = logging.getLogger(__name__)
+
+
+def _apply_sqlite_profile(dbapi_connection, connection_record):
+    """PRAGMA профиля SQLite для нового подключения (config.SQLITE_*)"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA busy_timeout={config.SQLITE_BUSY_TIMEOUT}")
+    cursor.execute(f"PRAGMA journal_mode={config.SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={config.SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA cache_size={config.SQLITE_CACHE_SIZE}")
+    cursor.execute(f"PRAGMA mmap_size={config.SQLITE_MMAP_SIZE}")
+    cursor.execute(f"PRAGMA temp_store={config.SQLITE_TEMP_STORE}")
+    cursor.close()
+
+
+def _apply_read_only(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA query_only=ON")
+    cursor.close()
+
+
+def _disable_driver_transactions(dbapi_connection, connection_record):
+    # Драйвер не открывает транзакции сам (иначе SAVEPOINT вне BEGIN
+    # фиксируется при RELEASE) - BEGIN выдает _begin_immediate
+    dbapi_connection.isolation_level = None
+
+
+def _begin_immediate(conn):
+    # Блокировка записи берется сразу, а не при первом изменении
+    conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+def create_engine(
+    url: str,
+    pool_size: int | None = None,
+    max_overflow: int | None = None,
+    read_only: bool = False,
+    begin_immediate: bool = False
+) -> AsyncEngine:
+    """
+    Движок БД с настройками пула из config.
+    Для SQLite на каждом подключении применяется профиль производительности:
+    WAL (чтения не ждут записи), synchronous=NORMAL (fsync только
+    на checkpoint), кэш страниц и mmap, ожидание блокировки вместо
+    немедленной ошибки "database is locked".
+    read_only - соединения только для чтения (PRAGMA query_only),
+    begin_immediate - транзакции BEGIN IMMEDIATE с рабочими SAVEPOINT (для db.writer).
+    """
+    kwargs = {}
+    if make_url(url).database not in (None, "", ":memory:"):
+        # aiosqlite по умолчанию без пула (новое соединение и поток на каждую
+        # сессию); для БД в памяти SQLAlchemy сам выбирает пул с одним соединением
+        kwargs.update(
+            poolclass=AsyncAdaptedQueuePool,
+            pool_size=config.DB_POOL_SIZE if pool_size is None else pool_size,
+            max_overflow=config.DB_MAX_OVERFLOW if max_overflow is None else max_overflow,
+            pool_timeout=config.DB_POOL_TIMEOUT,
+        )
+    engine = create_async_engine(
+        url,
+        echo=False,  # Логирование SQL-запросов (для отладки можно включить)
+        **kwargs
+    )
+    if engine.dialect.name == "sqlite":
+        event.listen(engine.sync_engine, "connect", _apply_sqlite_profile)
+        if read_only:
+            event.listen(engine.sync_engine, "connect", _apply_read_only)
+        if begin_immediate:
+            event.listen(engine.sync_engine, "connect", _disable_driver_transactions)
+            event.listen(engine.sync_engine, "begin", _begin_immediate)
+    return engine
+
 
 # Создание движка
-engine = create_async_engine(
-    config.DATABASE_URL,
-    echo=False,  # Логирование SQL-запросов (для отладки можно включить)
-)
+engine = create_engine(config.DATABASE_URL)
 
 # Фабрика сессий
 async_session_maker = async_sessionmaker(
@@ -19,14 +95,169 @@ async_session_maker = async_sessionmaker(
     expire_on_commit=False
 )
 
+# Пул только для чтения (DB_WRITE_MODE=queue): из него берутся сессии апдейтов,
+# а запись идет через db.writer
+_read_engine: AsyncEngine | None = None
+_read_session_maker: async_sessionmaker | None = None
+
+
+def open_read_pool():
+    """Переключить сессии апдейтов на отдельный пул соединений только для чтения"""
+    global _read_engine, _read_session_maker
+    if _read_engine is None:
+        _read_engine = create_engine(config.DATABASE_URL, read_only=True)
+        _read_session_maker = async_sessionmaker(
+            _read_engine,
+            class_=AsyncSession,
+            expire_on_commit=False
+        )
+
+
+def read_session_maker() -> async_sessionmaker:
+    """Фабрика сессий для чтения: пул только для чтения в режиме queue, иначе основной"""
+    return _read_session_maker or async_session_maker
+
+
+async def close_read_pool():
+    global _read_engine, _read_session_maker
+    if _read_engine is not None:
+        await _read_engine.dispose()
+        _read_engine = _read_session_maker = None
+
 
 async def init_db():
     """Инициализация базы данных (создание таблиц)"""
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+    await upgrade_schema()
+
+
+async def upgrade_schema():
+    """
+    Идемпотентное обновление схемы существующей БД.
+    create_all не добавляет индексы в уже созданные таблицы,
+    поэтому недостающие индексы создаются здесь.
+    """
+    async with engine.begin() as conn:
+        await conn.run_sync(_upgrade_schema)
+
+
+def _upgrade_schema(conn):
+    """Синхронная часть upgrade_schema (выполняется через run_sync)"""
+    existing = {
+        index["name"] for index in inspect(conn).get_indexes("user_achievements")
+    }
+    if "ux_user_achievements_user_achievement" not in existing:
+        # Уникальный индекс не создастся, если уже есть дубликаты - удаляем их
+        conn.execute(text(
+            "DELETE FROM user_achievements WHERE id NOT IN ("
+            "SELECT MIN(id) FROM user_achievements GROUP BY user_id, achievement_id)"
+        ))
+    
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
 
 
 async def get_session() -> AsyncSession:
     """Получение новой сессии базы данных"""
     async with async_session_maker() as session:
         yield session
+
+
+# Ключи session.info: сессия апдейта (фиксируется один раз в session_middleware)
+# и сессия группового commit (фиксирует db.writer после пачки записей)
+_UNIT_OF_WORK = "unit_of_work"
+_GROUP_COMMIT = "group_commit"
+_AFTER_COMMIT = "after_commit"
+
+
+async def commit(session: AsyncSession):
+    """
+    Зафиксировать изменения сервиса.
+    В сессии апдейта изменения только отправляются в БД (flush),
+    commit выполнит session_middleware в конце апдейта.
+    """
+    if session.info.get(_UNIT_OF_WORK):
+        await session.flush()
+    else:
+        await session.commit()
+
+
+def after_commit(session: AsyncSession, callback: Callable[[], Any]):
+    """Выполнить callback после фиксации (сразу, если сессия не апдейтная)"""
+    if session.info.get(_UNIT_OF_WORK):
+        session.info.setdefault(_AFTER_COMMIT, []).append(callback)
+    else:
+        callback()
+
+
+def run_after_commit(session: AsyncSession):
+    """Выполнить отложенные after_commit-обработчики (после фактического commit)"""
+    for callback in session.info.pop(_AFTER_COMMIT, ()):
+        try:
+            callback()
+        except Exception as e:
+            logger.error(f"After-commit callback error: {e}")
+
+
+def start_group_commit(session: AsyncSession) -> list:
+    """
+    Пометить сессию как сессию группового commit: сервисы и transaction()
+    в ней только отправляют изменения, commit и run_after_commit - за владельцем.
+    Возвращает список отложенных обработчиков (для отката неудавшейся записи).
+    """
+    session.info[_UNIT_OF_WORK] = True
+    session.info[_GROUP_COMMIT] = True
+    return session.info.setdefault(_AFTER_COMMIT, [])
+
+
+@asynccontextmanager
+async def transaction(session: AsyncSession) -> AsyncIterator[AsyncSession]:
+    """
+    Вызовы сервисов внутри блока - одна транзакция с одним commit в конце блока.
+    after_commit-обработчики выполняются сразу после этого commit (и в сессии
+    апдейта): если хендлер упадет позже, например на ответе в Telegram,
+    зафиксированные изменения все равно попадут в кэши. В сессии группового
+    commit блок только отправляет изменения (flush), фиксирует их владелец сессии.
+    """
+    if session.info.get(_GROUP_COMMIT):
+        yield session
+        await session.flush()
+        return
+    
+    nested = session.info.get(_UNIT_OF_WORK, False)
+    session.info[_UNIT_OF_WORK] = True
+    try:
+        yield session
+        await session.commit()
+    except BaseException:
+        await session.rollback()
+        raise
+    finally:
+        if not nested:
+            session.info.pop(_UNIT_OF_WORK, None)
+    # commit фиксирует все изменения сессии - их обработчики больше не ждут
+    run_after_commit(session)
+
+
+async def session_middleware(
+    handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]],
+    event: Any,
+    data: Dict[str, Any]
+) -> Any:
+    """
+    Outer middleware апдейта: одна AsyncSession на апдейт (аргумент session).
+    Соединение берется из пула только при первом запросе к БД, поэтому
+    апдейты без работы с БД его не занимают. Commit - один, в конце апдейта;
+    при исключении в хендлере изменения откатываются.
+    В режиме DB_WRITE_MODE=queue сессия только для чтения - запись через db.writer.write.
+    """
+    async with read_session_maker()() as session:
+        session.info[_UNIT_OF_WORK] = True
+        data["session"] = session
+        result = await handler(event, data)
+        if session.in_transaction():
+            await session.commit()
+        run_after_commit(session)
+        return result
@@ -0,0 +1,202 @@
+"""
+Единственный писатель SQLite (DB_WRITE_MODE=queue).
+
+SQLite допускает одну транзакцию записи за раз: параллельные commit из
+разных хендлеров ждут блокировку друг друга и под нагрузкой падают
+с "database is locked". В режиме queue записи хендлеров ставятся в очередь
+и выполняются одной задачей на одном соединении: накопившиеся за
+DB_WRITER_BATCH_DELAY записи фиксируются общим commit (групповой commit),
+каждая - в своем SAVEPOINT, чтобы ошибка одной не отменяла остальные.
+Вызывающий получает результат своей записи через await после commit пачки.
+"""
+import asyncio
+import logging
+from typing import Awaitable, Callable, TypeVar
+
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+
+from config import config
+from db.session import close_read_pool, create_engine, open_read_pool, run_after_commit, start_group_commit
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+WriteJob = Callable[[AsyncSession], Awaitable[T]]
+
+
+class DBWriter:
+    """Очередь записей с групповым commit на одном соединении"""
+
+    def __init__(
+        self,
+        engine: AsyncEngine | None = None,
+        batch_delay: float | None = None,
+        batch_size: int | None = None,
+        max_size: int | None = None
+    ):
+        self._own_engine = engine is None
+        if engine is None:
+            engine = create_engine(
+                config.DATABASE_URL,
+                pool_size=1,
+                max_overflow=0,
+                begin_immediate=True
+            )
+        self.engine = engine
+        self._session_maker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+        self.batch_delay = config.DB_WRITER_BATCH_DELAY if batch_delay is None else batch_delay
+        self.batch_size = batch_size or config.DB_WRITER_BATCH_SIZE
+        self._queue: asyncio.Queue[tuple[WriteJob, asyncio.Future]] = asyncio.Queue(
+            max_size or config.DB_WRITER_QUEUE_SIZE
+        )
+        self._task: asyncio.Task | None = None
+        self.stats = {"writes": 0, "failed": 0, "commits": 0}
+
+    def start(self):
+        self._task = asyncio.create_task(self._run(), name="db-writer")
+
+    async def stop(self, timeout: float | None = None):
+        """
+        Дописать очередь и остановить писателя. Дольше timeout
+        (DB_WRITER_STOP_TIMEOUT) секунд не ждем: прерванная пачка и
+        оставшиеся записи завершаются ошибкой, а не висят у вызывающих.
+        """
+        if self._task:
+            timeout = config.DB_WRITER_STOP_TIMEOUT if timeout is None else timeout
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"DB writer: очередь не дописана за {timeout}с")
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+            dropped = 0
+            while not self._queue.empty():
+                _, future = self._queue.get_nowait()
+                self._queue.task_done()
+                if not future.done():
+                    future.set_exception(RuntimeError("DB writer остановлен"))
+                    dropped += 1
+            if dropped:
+                logger.warning(f"DB writer остановлен, отклонено записей: {dropped}")
+        if self._own_engine:
+            await self.engine.dispose()
+
+    async def submit(self, job: WriteJob) -> T:
+        """
+        Выполнить job(session) в очереди записи и вернуть его результат
+        после commit пачки. job не должен вызывать session.commit().
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((job, future))
+        return await future
+
+    def avg_batch(self) -> float:
+        return self.stats["writes"] / self.stats["commits"] if self.stats["commits"] else 0.0
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            if self._queue.empty() and self.batch_delay > 0:
+                # Ждем попутные записи: один commit (fsync) на всю пачку
+                await asyncio.sleep(self.batch_delay)
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                await self._commit_batch(batch)
+            except Exception as e:
+                logger.error(f"DB writer error: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _commit_batch(self, batch: list[tuple[WriteJob, asyncio.Future]]):
+        try:
+            await self._commit_jobs(batch)
+        finally:
+            # Пачка прервана (отмена писателя при остановке, BaseException
+            # из записи): ее future не должны висеть у вызывающих
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(RuntimeError("Пачка записей DB writer прервана"))
+
+    async def _commit_jobs(self, batch: list[tuple[WriteJob, asyncio.Future]]):
+        done = []
+        async with self._session_maker() as session:
+            callbacks = start_group_commit(session)
+            for job, future in batch:
+                if future.cancelled():
+                    continue
+                mark = len(callbacks)
+                try:
+                    async with session.begin_nested():
+                        result = await job(session)
+                    done.append((future, result, None))
+                except BaseException as e:
+                    # Остановку писателя и выход процесса пробрасываем; CancelledError
+                    # из самой записи - ошибка только этой записи
+                    stopping = isinstance(e, asyncio.CancelledError) and asyncio.current_task().cancelling()
+                    if stopping or isinstance(e, (KeyboardInterrupt, SystemExit)):
+                        raise
+                    # Откатилась только эта запись; ее after_commit не выполняются
+                    del callbacks[mark:]
+                    done.append((future, None, e))
+
+            try:
+                await session.commit()
+            except Exception as e:
+                self.stats["failed"] += len(done)
+                for future, _, _ in done:
+                    if not future.done():
+                        future.set_exception(e)
+                raise
+
+        self.stats["commits"] += 1
+        run_after_commit(session)
+        for future, result, error in done:
+            if error is None:
+                self.stats["writes"] += 1
+            else:
+                self.stats["failed"] += 1
+            if future.done():
+                continue
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+
+_writer: DBWriter | None = None
+
+
+def get_db_writer() -> DBWriter | None:
+    """Писатель процесса (None - режим direct)"""
+    return _writer
+
+
+async def start_db_writer() -> DBWriter:
+    """Включить режим queue: писатель и пул только для чтения для апдейтов"""
+    global _writer
+    if _writer is None:
+        _writer = DBWriter()
+        _writer.start()
+        open_read_pool()
+    return _writer
+
+
+async def stop_db_writer():
+    global _writer
+    if _writer is not None:
+        await _writer.stop()
+        _writer = None
+        await close_read_pool()
+
+
+async def write(session: AsyncSession, job: WriteJob) -> T:
+    """
+    Выполнить запись job(session): через очередь писателя, если он запущен,
+    иначе в переданной сессии (как обычный вызов сервиса).
+    """
+    if _writer is not None:
+        return await _writer.submit(job)
+    return await job(session)
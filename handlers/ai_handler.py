@@ -1,17 +1,21 @@
 """
 Обработчики AI функций
 """
+import asyncio
+import time
+
 from aiogram import Router, F
+from aiogram.exceptions import TelegramAPIError, TelegramRetryAfter
 from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
+from config import config
 from keyboards import get_main_menu_keyboard
 from texts_kk import MENU, AI, ERRORS
-from services.users import get_user_by_telegram_id
-from services.ai_service import ask_ai_trainer
+from services.user_cache import UserProfile
+from services.ai_service import stream_ai_trainer
 from nutrition_kk import get_nutrition_for_goal, get_all_recipes, NUTRITION_TIPS
-from db.session import async_session_maker
 
 router = Router()
 
@@ -32,14 +36,11 @@ def get_nutrition_keyboard() -> InlineKeyboardMarkup:
 
 
 @router.message(F.text == MENU["ai_trainer"])
-async def ai_trainer_menu(message: Message, state: FSMContext):
+async def ai_trainer_menu(message: Message, state: FSMContext, user: UserProfile | None):
     """Открыть AI тренера"""
-    async with async_session_maker() as session:
-        user = await get_user_by_telegram_id(session, message.from_user.id)
-        
-        if not user:
-            await message.answer(ERRORS["no_profile"])
-            return
+    if not user:
+        await message.answer(ERRORS["no_profile"])
+        return
     
     await state.set_state(AIStates.waiting_for_question)
     
@@ -53,8 +54,39 @@ async def ai_trainer_menu(message: Message, state: FSMContext):
     )
 
 
+async def _edit_progress(msg: Message, text: str) -> float:
+    """
+    Промежуточная правка потокового ответа (ошибки правки не критичны).
+    Возвращает, сколько секунд Telegram просит не править (RetryAfter).
+    """
+    try:
+        await msg.edit_text(text)
+    except TelegramRetryAfter as e:
+        return e.retry_after
+    except TelegramAPIError:
+        pass
+    return 0.0
+
+
+async def _edit_final(msg: Message, text: str, reply_markup: InlineKeyboardMarkup):
+    """
+    Итоговая правка с клавиатурой: после RetryAfter ждем и повторяем,
+    а если правка так и не прошла - отправляем ответ новым сообщением,
+    чтобы не оставить обрезанный текст с курсором.
+    """
+    try:
+        await msg.edit_text(text, reply_markup=reply_markup)
+        return
+    except TelegramRetryAfter as e:
+        await asyncio.sleep(e.retry_after)
+    try:
+        await msg.edit_text(text, reply_markup=reply_markup)
+    except TelegramAPIError:
+        await msg.answer(text, reply_markup=reply_markup)
+
+
 @router.message(AIStates.waiting_for_question)
-async def process_ai_question(message: Message, state: FSMContext):
+async def process_ai_question(message: Message, state: FSMContext, user: UserProfile | None):
     """Обработка вопроса к AI"""
     # Проверяем, не нажал ли пользователь кнопку меню
     if message.text in [MENU["today_workout"], MENU["my_progress"], MENU["edit_plan"], 
@@ -63,121 +95,125 @@ async def process_ai_question(message: Message, state: FSMContext):
         await state.clear()
         return
     
-    async with async_session_maker() as session:
-        user = await get_user_by_telegram_id(session, message.from_user.id)
-        
-        if not user:
-            await state.clear()
-            await message.answer(ERRORS["no_profile"])
-            return
-        
-        # Показываем, что обрабатываем
-        loading_msg = await message.answer(AI["ai_loading"])
-        
-        # Формируем профиль для AI
-        user_profile = {
-            "age": user.age,
-            "goal": user.goal,
-            "level": user.level,
-            "gender": user.gender
-        }
-        
-        # Получаем ответ от AI
-        answer = await ask_ai_trainer(message.text, user_profile)
-        
-        # Удаляем сообщение о загрузке
-        await loading_msg.delete()
-        
-        # Кнопка для продолжения диалога или выхода
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="◀️ Басты мәзірге оралу", callback_data="ai:back")]
-        ])
-        
-        await message.answer(
-            AI["ai_advice"].format(advice=answer),
-            reply_markup=keyboard
+    if not user:
+        await state.clear()
+        await message.answer(ERRORS["no_profile"])
+        return
+    
+    # Формируем профиль для AI
+    user_id = user.id
+    user_profile = {
+        "age": user.age,
+        "goal": user.goal,
+        "level": user.level,
+        "gender": user.gender
+    }
+    
+    # Показываем, что обрабатываем
+    loading_msg = await message.answer(AI["ai_loading"])
+    
+    # Ответ приходит потоком: правим сообщение по мере генерации раз в
+    # AI_STREAM_EDIT_INTERVAL; большой прирост текста сокращает ожидание,
+    # но не меньше AI_STREAM_EDIT_MIN_INTERVAL (лимит правок Telegram)
+    answer = ""
+    edited_len = 0
+    last_edit = 0.0
+    blocked_until = 0.0
+    async for chunk in stream_ai_trainer(message.text, user_profile, user_id, remember=True):
+        answer += chunk
+        now = time.monotonic()
+        elapsed = now - last_edit
+        due = elapsed >= config.AI_STREAM_EDIT_INTERVAL or (
+            elapsed >= config.AI_STREAM_EDIT_MIN_INTERVAL
+            and len(answer) - edited_len >= config.AI_STREAM_EDIT_CHARS
         )
+        if due and now >= blocked_until:
+            retry_after = await _edit_progress(loading_msg, AI["ai_advice"].format(advice=answer + " ▌"))
+            last_edit = now
+            edited_len = len(answer)
+            blocked_until = now + retry_after
+    
+    # Кнопка для продолжения диалога или выхода
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="◀️ Басты мәзірге оралу", callback_data="ai:back")]
+    ])
+    
+    await _edit_final(loading_msg, AI["ai_advice"].format(advice=answer), keyboard)
     
     # НЕ очищаем state - остаёмся в режиме диалога!
 
 
 @router.message(F.text == MENU["nutrition"])
-async def nutrition_menu(message: Message):
+async def nutrition_menu(message: Message, user: UserProfile | None):
     """Открыть раздел питания"""
-    async with async_session_maker() as session:
-        user = await get_user_by_telegram_id(session, message.from_user.id)
-        
-        if not user:
-            await message.answer(ERRORS["no_profile"])
-            return
-        
-        # Получаем советы для цели пользователя
-        nutrition_data = NUTRITION_TIPS.get(user.goal, NUTRITION_TIPS["stay_fit"])
-        tips_text = "\n".join(nutrition_data["tips"])
-        
-        text = f"""
+    if not user:
+        await message.answer(ERRORS["no_profile"])
+        return
+    
+    # Получаем советы для цели пользователя
+    nutrition_data = NUTRITION_TIPS.get(user.goal, NUTRITION_TIPS["stay_fit"])
+    tips_text = "\n".join(nutrition_data["tips"])
+    
+    text = f"""
 {nutrition_data["title"]}
 
 {tips_text}
 
 👇 Толық ақпарат алу үшін таңдаңыз:
 """
-        await message.answer(text.strip(), reply_markup=get_nutrition_keyboard())
+    await message.answer(text.strip(), reply_markup=get_nutrition_keyboard())
 
 
 @router.callback_query(F.data.startswith("nutrition:"))
-async def handle_nutrition_action(callback: CallbackQuery):
+async def handle_nutrition_action(callback: CallbackQuery, user: UserProfile | None):
     """Обработка действий раздела питания"""
     action = callback.data.split(":")[1]
     
-    async with async_session_maker() as session:
-        user = await get_user_by_telegram_id(session, callback.from_user.id)
+    if not user:
+        await callback.answer("Профиль табылмады", show_alert=True)
+        return
+    
+    if action == "menu":
+        # Показать пример меню
+        nutrition_data = NUTRITION_TIPS.get(user.goal, NUTRITION_TIPS["stay_fit"])
+        await callback.message.answer(
+            nutrition_data["meal_example"],
+            reply_markup=get_main_menu_keyboard()
+        )
         
-        if not user:
-            await callback.answer("Профиль табылмады", show_alert=True)
-            return
+    elif action == "recipes":
+        # Показать рецепты
+        recipes = get_all_recipes()
+        await callback.message.answer(
+            recipes,
+            reply_markup=get_main_menu_keyboard()
+        )
+        
+    elif action == "ai":
+        # AI совет
+        from services.ai_service import get_nutrition_advice
+        
+        loading_msg = await callback.message.answer("🤖 AI кеңесін дайындап жатырмын...")
+        
+        user_profile = {
+            "weight_kg": user.weight_kg,
+            "height_cm": user.height_cm,
+            "goal": user.goal,
+            "gender": user.gender
+        }
+        
+        advice = await get_nutrition_advice(user_profile, user.id)
+        await loading_msg.delete()
+        await callback.message.answer(
+            f"🤖 AI тамақтану кеңесі:\n\n{advice}",
+            reply_markup=get_main_menu_keyboard()
+        )
         
-        if action == "menu":
-            # Показать пример меню
-            nutrition_data = NUTRITION_TIPS.get(user.goal, NUTRITION_TIPS["stay_fit"])
-            await callback.message.answer(
-                nutrition_data["meal_example"],
-                reply_markup=get_main_menu_keyboard()
-            )
-            
-        elif action == "recipes":
-            # Показать рецепты
-            recipes = get_all_recipes()
-            await callback.message.answer(
-                recipes,
-                reply_markup=get_main_menu_keyboard()
-            )
-            
-        elif action == "ai":
-            # AI совет
-            from services.ai_service import get_nutrition_advice
-            
-            loading_msg = await callback.message.answer("🤖 AI кеңесін дайындап жатырмын...")
-            
-            user_profile = {
-                "weight_kg": user.weight_kg,
-                "height_cm": user.height_cm,
-                "goal": user.goal,
-                "gender": user.gender
-            }
-            
-            advice = await get_nutrition_advice(user_profile)
-            await loading_msg.delete()
-            await callback.message.answer(
-                f"🤖 AI тамақтану кеңесі:\n\n{advice}",
-                reply_markup=get_main_menu_keyboard()
-            )
-            
-        elif action == "back":
-            await callback.message.answer(
-                "📱 Басты мәзір",
-                reply_markup=get_main_menu_keyboard()
-            )
+    elif action == "back":
+        await callback.message.answer(
+            "📱 Басты мәзір",
+            reply_markup=get_main_menu_keyboard()
+        )
     
     await callback.answer()
 
@@ -3,13 +3,16 @@
 """
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
 
 from keyboards import get_main_menu_keyboard, get_reminders_keyboard, get_days_selection_keyboard
 from texts_kk import MENU, REMINDERS, BUTTONS
-from services.users import get_user_by_telegram_id, update_reminder_settings
+from services.users import update_reminder_settings
+from services.user_cache import UserProfile
 from utils.validators import validate_time
-from db.session import async_session_maker
+from db.session import transaction
+from db.writer import write
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
@@ -39,58 +42,54 @@ async def edit_plan(message: Message, state: FSMContext):
 
 
 @router.message(F.text == MENU["reminders"])
-async def reminders_menu(message: Message):
+async def reminders_menu(message: Message, user: UserProfile | None):
     """Меню настройки напоминаний"""
-    async with async_session_maker() as session:
-        user = await get_user_by_telegram_id(session, message.from_user.id)
-        
-        if not user:
-            await message.answer("Сначала заполните профиль: /start")
-            return
-        
-        enabled = user.reminder_enabled
-        time_info = f"\n\nТекущее время: {user.reminder_time}" if user.reminder_time else ""
-        
-        await message.answer(
-            REMINDERS["settings"] + time_info,
-            reply_markup=get_reminders_keyboard(enabled)
-        )
+    if not user:
+        await message.answer("Сначала заполните профиль: /start")
+        return
+    
+    enabled = user.reminder_enabled
+    time_info = f"\n\nТекущее время: {user.reminder_time}" if user.reminder_time else ""
+    
+    await message.answer(
+        REMINDERS["settings"] + time_info,
+        reply_markup=get_reminders_keyboard(enabled)
+    )
 
 
 @router.callback_query(F.data.startswith("reminder:"))
-async def handle_reminder_action(callback: CallbackQuery, state: FSMContext):
+async def handle_reminder_action(callback: CallbackQuery, state: FSMContext, user: UserProfile | None, session: AsyncSession):
     """Обработка действий с напоминаниями"""
     action = callback.data.split(":")[1]
     
-    async with async_session_maker() as session:
-        user = await get_user_by_telegram_id(session, callback.from_user.id)
-        
-        if not user:
-            await callback.answer("Профиль не найден", show_alert=True)
-            return
-        
-        if action == "enable":
-            # Просим выбрать дни недели
-            await state.set_state(ReminderStates.selecting_days)
-            await state.update_data(selected_days=[])
-            
-            await callback.message.edit_text(
-                REMINDERS["choose_days"],
-                reply_markup=get_days_selection_keyboard([])
-            )
-        
-        elif action == "disable":
-            await update_reminder_settings(session, callback.from_user.id, False)
-            await callback.message.edit_text(
-                REMINDERS["disabled"],
-                reply_markup=None
-            )
-            await callback.message.answer(
-                "✅ Готово",
-                reply_markup=get_main_menu_keyboard()
-            )
+    if not user:
+        await callback.answer("Профиль не найден", show_alert=True)
+        return
+    
+    if action == "enable":
+        # Просим выбрать дни недели
+        await state.set_state(ReminderStates.selecting_days)
+        await state.update_data(selected_days=[])
         
-        await callback.answer()
+        await callback.message.edit_text(
+            REMINDERS["choose_days"],
+            reply_markup=get_days_selection_keyboard([])
+        )
+    
+    elif action == "disable":
+        # Commit до ответа: пользователь не должен увидеть "готово" раньше записи
+        async with transaction(session):
+            await write(session, lambda s: update_reminder_settings(s, callback.from_user.id, False))
+        await callback.message.edit_text(
+            REMINDERS["disabled"],
+            reply_markup=None
+        )
+        await callback.message.answer(
+            "✅ Готово",
+            reply_markup=get_main_menu_keyboard()
+        )
+    
+    await callback.answer()
 
 
 @router.callback_query(F.data.startswith("day_toggle:"))
@@ -132,7 +131,7 @@ async def confirm_days_selection(callback: CallbackQuery, state: FSMContext):
 
 
 @router.message(ReminderStates.waiting_for_time)
-async def process_reminder_time(message: Message, state: FSMContext):
+async def process_reminder_time(message: Message, state: FSMContext, session: AsyncSession):
     """Обработка ввода времени напоминания"""
     is_valid, time_str, error = validate_time(message.text)
     
@@ -144,15 +143,15 @@ async def process_reminder_time(message: Message, state: FSMContext):
     data = await state.get_data()
     selected_days = data.get("selected_days", [])
     
-    async with async_session_maker() as session:
-        await update_reminder_settings(
-            session, 
+    async with transaction(session):
+        await write(session, lambda s: update_reminder_settings(
+            s, 
             message.from_user.id, 
             True, 
             time_str,
             selected_days
-        )
-    
+        ))
+
     await state.clear()
     
     # Форматируем список дней на казахском
@@ -16,21 +16,20 @@ from keyboards import (
 from texts_kk import ONBOARDING, BUTTONS
 from utils.validators import validate_age, validate_height, validate_weight
 from utils.formatters import format_profile
-from services.users import get_user_by_telegram_id, create_user, update_user
-from db.session import async_session_maker
+from services.users import create_user, update_user
+from services.user_cache import UserProfile
+from db.session import transaction
+from db.writer import write
 
 router = Router()
 
 
 @router.message(Command("start"))
-async def cmd_start(message: Message, state: FSMContext):
+async def cmd_start(message: Message, state: FSMContext, user: UserProfile | None):
     """Обработчик команды /start"""
     await state.clear()
     
-    # Проверяем, есть ли уже профиль
-    async with async_session_maker() as session:
-        user = await get_user_by_telegram_id(session, message.from_user.id)
-    
+    # Профиль (если есть) загружен user_profile_middleware
     if user and user.goal:
         # Пользователь уже зарегистрирован
         await message.answer(
@@ -162,7 +161,7 @@ async def process_workout_type(callback: CallbackQuery, state: FSMContext):
 
 
 @router.callback_query(StateFilter(OnboardingStates.confirm), F.data.startswith("confirm:"))
-async def process_confirm(callback: CallbackQuery, state: FSMContext):
+async def process_confirm(callback: CallbackQuery, state: FSMContext, user: UserProfile | None, session: AsyncSession):
     """Обработка подтверждения профиля"""
     action = callback.data.split(":")[1]
     
@@ -170,13 +169,12 @@ async def process_confirm(callback: CallbackQuery, state: FSMContext):
         # Сохраняем профиль в БД
         user_data = await state.get_data()
         
-        async with async_session_maker() as session:
-            existing_user = await get_user_by_telegram_id(session, callback.from_user.id)
-            
-            if existing_user:
-                await update_user(session, callback.from_user.id, user_data)
+        # Commit до ответа "профиль сохранен"
+        async with transaction(session):
+            if user:
+                await write(session, lambda s: update_user(s, callback.from_user.id, user_data))
             else:
-                await create_user(session, callback.from_user.id, user_data)
+                await write(session, lambda s: create_user(s, callback.from_user.id, user_data))
         
         await state.clear()
         await callback.message.edit_reply_markup(reply_markup=None)
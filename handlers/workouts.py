@@ -3,20 +3,23 @@
 """
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
 
 from keyboards import get_workout_actions_keyboard, get_feeling_keyboard, get_main_menu_keyboard
 from texts_kk import MENU, WORKOUTS, PROGRESS, ERRORS, AI
-from services.users import get_user_by_telegram_id
+from services.user_cache import UserProfile
 from services.workouts import (
     get_workout_for_user, 
-    mark_workout_completed, 
+    get_week_plan_for_user,
+    complete_workout_transaction,
     get_user_workout_stats
 )
 from services.ai_service import get_ai_advice
-from services.achievements import update_streak, check_and_award_achievements
+from services.outbox import Outbox
+from services.tasks import TaskQueue
 from utils.formatters import format_workout
-from db.session import async_session_maker
+from db.writer import write
 
 router = Router()
 
@@ -53,60 +56,57 @@ def get_workout_menu_keyboard() -> InlineKeyboardMarkup:
 
 
 @router.message(F.text == MENU["today_workout"])
-async def workout_menu(message: Message):
+async def workout_menu(message: Message, user: UserProfile | None, session: AsyncSession):
     """Показать меню тренировок"""
-    async with async_session_maker() as session:
-        user = await get_user_by_telegram_id(session, message.from_user.id)
-        
-        if not user or not user.goal:
-            await message.answer(ERRORS["no_profile"])
-            return
-        
-        today_index = datetime.now().weekday()
-        today_name = DAYS_KK[today_index]
-        
-        # Показываем недельный план сразу
-        text = f"""🏋️ *Апталық жаттығу жоспары*
+    if not user or not user.goal:
+        await message.answer(ERRORS["no_profile"])
+        return
+    
+    today_index = datetime.now().weekday()
+    today_name = DAYS_KK[today_index]
+    
+    # Показываем недельный план сразу
+    text = f"""🏋️ *Апталық жаттығу жоспары*
 
 📍 Бүгін: *{today_name}*
 
 """
-        
-        # Собираем план на неделю
-        has_workout_today = False
-        for day_index in range(7):
-            day_name = DAYS_KK[day_index]
-            workout = await get_workout_for_user(session, user, day_index)
-            
-            if day_index == today_index:
-                emoji = "➡️"
-                has_workout_today = workout is not None
-            else:
-                emoji = "📅"
-            
-            if workout:
-                # Показываем интенсивность
-                intensity = "💪" * (2 if "интенсив" in workout.title.lower() else 1)
-                text += f"{emoji} *{day_name}*: {workout.title} {intensity}\n"
-            else:
-                text += f"{emoji} {day_name}: 😴 Демалыс\n"
-        
-        text += "\n💡 3 жаттығу/апта - оңтайлы жүктеме!\n"
-        
-        # Кнопки
-        if has_workout_today:
-            keyboard = InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="🏋️ Бүгінгі жаттығуды бастау", callback_data=f"workout_day:{today_index}")],
-                [InlineKeyboardButton(text="📅 Басқа күн таңдау", callback_data="workout:select_day")],
-                [InlineKeyboardButton(text="◀️ Артқа", callback_data="back_to_menu")]
-            ])
+    
+    # Собираем план на неделю
+    week_plan = await get_week_plan_for_user(session, user)
+    has_workout_today = False
+    for day_index, workout in enumerate(week_plan):
+        day_name = DAYS_KK[day_index]
+        
+        if day_index == today_index:
+            emoji = "➡️"
+            has_workout_today = workout is not None
         else:
-            keyboard = InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="📅 Басқа күн таңдау", callback_data="workout:select_day")],
-                [InlineKeyboardButton(text="◀️ Артқа", callback_data="back_to_menu")]
-            ])
+            emoji = "📅"
         
-        await message.answer(text, reply_markup=keyboard, parse_mode="Markdown")
+        if workout:
+            # Показываем интенсивность
+            intensity = "💪" * (2 if "интенсив" in workout.title.lower() else 1)
+            text += f"{emoji} *{day_name}*: {workout.title} {intensity}\n"
+        else:
+            text += f"{emoji} {day_name}: 😴 Демалыс\n"
+    
+    text += "\n💡 3 жаттығу/апта - оңтайлы жүктеме!\n"
+    
+    # Кнопки
+    if has_workout_today:
+        keyboard = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="🏋️ Бүгінгі жаттығуды бастау", callback_data=f"workout_day:{today_index}")],
+            [InlineKeyboardButton(text="📅 Басқа күн таңдау", callback_data="workout:select_day")],
+            [InlineKeyboardButton(text="◀️ Артқа", callback_data="back_to_menu")]
+        ])
+    else:
+        keyboard = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="📅 Басқа күн таңдау", callback_data="workout:select_day")],
+            [InlineKeyboardButton(text="◀️ Артқа", callback_data="back_to_menu")]
+        ])
+    
+    await message.answer(text, reply_markup=keyboard, parse_mode="Markdown")
 
 
 @router.callback_query(F.data == "workout:select_day")
@@ -130,55 +130,52 @@ async def show_day_selection(callback: CallbackQuery):
 
 
 @router.callback_query(F.data.startswith("workout_day:"))
-async def show_workout_for_day(callback: CallbackQuery):
+async def show_workout_for_day(callback: CallbackQuery, user: UserProfile | None, session: AsyncSession):
     """Показать тренировку для выбранного дня"""
     day_index = int(callback.data.split(":")[1])
     day_name = DAYS_KK[day_index]
     today_index = datetime.now().weekday()
     
-    async with async_session_maker() as session:
-        user = await get_user_by_telegram_id(session, callback.from_user.id)
-        
-        if not user:
-            await callback.answer("Профиль табылмады", show_alert=True)
-            return
-        
-        workout = await get_workout_for_user(session, user, day_index)
+    if not user:
+        await callback.answer("Профиль табылмады", show_alert=True)
+        return
+    
+    workout = await get_workout_for_user(session, user, day_index)
+    
+    if workout:
+        # Считаем количество упражнений
+        exercises_count = len(workout.exercises_json)
         
-        if workout:
-            # Считаем количество упражнений
-            exercises_count = len(workout.exercises_json)
-            
-            workout_text = f"""📅 *{day_name}*
+        workout_text = f"""📅 *{day_name}*
 
 🏋️ *{workout.title}*
 📋 Жаттығулар: {exercises_count}
 
 {format_workout({"title": workout.title, "exercises": workout.exercises_json})}
 """
-            
-            # Кнопки зависят от дня
-            if day_index == today_index:
-                buttons = [
-                    [InlineKeyboardButton(text="✅ Орындадым", callback_data=f"complete:{workout.id}")],
-                    [InlineKeyboardButton(text="📅 Басқа күн", callback_data="workout:select_day")],
-                    [InlineKeyboardButton(text="◀️ Басты мәзір", callback_data="back_to_menu")]
-                ]
-            else:
-                buttons = [
-                    [InlineKeyboardButton(text="📅 Басқа күн", callback_data="workout:select_day")],
-                    [InlineKeyboardButton(text="◀️ Басты мәзір", callback_data="back_to_menu")]
-                ]
-            
-            await callback.message.edit_text(
-                workout_text,
-                reply_markup=InlineKeyboardMarkup(inline_keyboard=buttons),
-                parse_mode="Markdown"
-            )
+        
+        # Кнопки зависят от дня
+        if day_index == today_index:
+            buttons = [
+                [InlineKeyboardButton(text="✅ Орындадым", callback_data=f"complete:{workout.id}")],
+                [InlineKeyboardButton(text="📅 Басқа күн", callback_data="workout:select_day")],
+                [InlineKeyboardButton(text="◀️ Басты мәзір", callback_data="back_to_menu")]
+            ]
         else:
-            # Профессиональное сообщение об отдыхе
-            next_workout = _get_next_workout_day(day_index)
-            rest_text = f"""😴 *{day_name} - Демалыс күні*
+            buttons = [
+                [InlineKeyboardButton(text="📅 Басқа күн", callback_data="workout:select_day")],
+                [InlineKeyboardButton(text="◀️ Басты мәзір", callback_data="back_to_menu")]
+            ]
+        
+        await callback.message.edit_text(
+            workout_text,
+            reply_markup=InlineKeyboardMarkup(inline_keyboard=buttons),
+            parse_mode="Markdown"
+        )
+    else:
+        # Профессиональное сообщение об отдыхе
+        next_workout = _get_next_workout_day(day_index)
+        rest_text = f"""😴 *{day_name} - Демалыс күні*
 
 ✨ Бұл жоспарланған демалыс!
 
@@ -193,16 +190,16 @@ async def show_workout_for_day(callback: CallbackQuery):
 • Жақсы ұйықтау
 
 📅 Келесі жаттығу: {next_workout}"""
-            
-            await callback.message.edit_text(
-                rest_text,
-                reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                    [InlineKeyboardButton(text="📅 Басқа күн", callback_data="workout:select_day")],
-                    [InlineKeyboardButton(text="◀️ Басты мәзір", callback_data="back_to_menu")]
-                ]),
-                parse_mode="Markdown"
-            )
-    
+        
+        await callback.message.edit_text(
+            rest_text,
+            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
+                [InlineKeyboardButton(text="📅 Басқа күн", callback_data="workout:select_day")],
+                [InlineKeyboardButton(text="◀️ Басты мәзір", callback_data="back_to_menu")]
+            ]),
+            parse_mode="Markdown"
+        )
+
     await callback.answer()
 
 
@@ -220,33 +217,30 @@ def _get_next_workout_day(current_day: int) -> str:
 
 
 @router.callback_query(F.data == "workout:week")
-async def show_week_plan(callback: CallbackQuery):
+async def show_week_plan(callback: CallbackQuery, user: UserProfile | None, session: AsyncSession):
     """Показать план на неделю"""
-    async with async_session_maker() as session:
-        user = await get_user_by_telegram_id(session, callback.from_user.id)
-        
-        if not user:
-            await callback.answer("Профиль табылмады", show_alert=True)
-            return
-        
-        text = "📋 Апта жоспары:\n\n"
-        
-        for day_index in range(7):
-            day_name = DAYS_KK[day_index]
-            workout = await get_workout_for_user(session, user, day_index)
-            
-            if workout:
-                text += f"📅 {day_name}: {workout.title}\n"
-            else:
-                text += f"😴 {day_name}: Демалыс\n"
+    if not user:
+        await callback.answer("Профиль табылмады", show_alert=True)
+        return
+    
+    week_plan = await get_week_plan_for_user(session, user)
+
+    text = "📋 Апта жоспары:\n\n"
+    
+    for day_index, workout in enumerate(week_plan):
+        day_name = DAYS_KK[day_index]
         
-        await callback.message.edit_text(
-            text,
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="◀️ Артқа", callback_data="workout:select_day")]
-            ])
-        )
+        if workout:
+            text += f"📅 {day_name}: {workout.title}\n"
+        else:
+            text += f"😴 {day_name}: Демалыс\n"
     
+    await callback.message.edit_text(
+        text,
+        reply_markup=InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="◀️ Артқа", callback_data="workout:select_day")]
+        ])
+    )
     await callback.answer()
 
 
@@ -264,48 +258,46 @@ async def complete_workout(callback: CallbackQuery):
 
 
 @router.callback_query(F.data.startswith("feeling:"))
-async def process_feeling(callback: CallbackQuery):
+async def process_feeling(
+    callback: CallbackQuery,
+    outbox: Outbox,
+    tasks: TaskQueue,
+    session: AsyncSession,
+    user: UserProfile | None
+):
     """Обработка оценки самочувствия"""
     parts = callback.data.split(":")
     workout_id = int(parts[1])
     feeling = parts[2]
     
-    streak_info = None
-    new_achievements = []
+    if not user:
+        await callback.answer("Профиль табылмады", show_alert=True)
+        return
     
-    async with async_session_maker() as session:
-        user = await get_user_by_telegram_id(session, callback.from_user.id)
-        
-        if not user:
-            await callback.answer("Профиль табылмады", show_alert=True)
-            return
-        
-        # Сохраняем выполненную тренировку
-        user_workout = await mark_workout_completed(
-            session,
-            user.id,
-            workout_id,
-            feeling=feeling
-        )
-        
-        # Обновляем streak
-        streak_info = await update_streak(session, user)
-        
-        # Проверяем достижения
-        new_achievements = await check_and_award_achievements(session, user)
-        
-        # Получаем название тренировки для AI
-        from db.models import Workout
-        workout = await session.get(Workout, workout_id)
-        workout_title = workout.title if workout else "Жаттығу"
-        
-        # Формируем профиль для AI
-        user_profile = {
-            "gender": user.gender,
-            "age": user.age,
-            "goal": user.goal,
-            "level": user.level
-        }
+    # Сразу снимаем "часики" с кнопки - дальше только быстрые операции с БД
+    await callback.answer()
+    
+    # Тренировка, streak и достижения - одной транзакцией; commit до ответов
+    # в Telegram: открытая транзакция записи на SQLite не дает писать остальным
+    completion = await write(
+        session,
+        lambda s: complete_workout_transaction(s, user.id, workout_id, feeling)
+    )
+    if completion is None:
+        return
+    
+    streak_info = completion.streak
+    new_achievements = completion.new_achievements
+    workout_title = completion.workout_title
+    
+    # Формируем профиль для AI
+    user_id = user.id
+    user_profile = {
+        "gender": completion.profile.gender,
+        "age": completion.profile.age,
+        "goal": completion.profile.goal,
+        "level": completion.profile.level
+    }
     
     await callback.message.edit_reply_markup(reply_markup=None)
     
@@ -332,21 +324,34 @@ async def process_feeling(callback: CallbackQuery):
         parse_mode="Markdown"
     )
     
-    # Получаем AI-совет (асинхронно)
-    try:
-        ai_advice = await get_ai_advice(user_profile, workout_title, feeling)
+    # AI-совет приходит отдельным сообщением из фоновой очереди
+    chat_id = callback.message.chat.id
+    if not tasks.submit(
+        lambda: send_ai_advice(outbox, chat_id, user_id, user_profile, workout_title, feeling)
+    ):
         await callback.message.answer(
-            AI["ai_advice"].format(advice=ai_advice),
+            "💪 Жалғастыра беріңіз!",
             reply_markup=get_main_menu_keyboard()
         )
+
+
+async def send_ai_advice(
+    outbox: Outbox,
+    chat_id: int,
+    user_id: int,
+    user_profile: dict,
+    workout_title: str,
+    feeling: str
+):
+    """Фоновая задача: получить AI-совет и отправить его следующим сообщением"""
+    try:
+        ai_advice = await get_ai_advice(user_profile, workout_title, feeling, user_id)
+        text = AI["ai_advice"].format(advice=ai_advice)
     except Exception:
         # Если AI недоступен, просто показываем меню
-        await callback.message.answer(
-            "💪 Жалғастыра беріңіз!",
-            reply_markup=get_main_menu_keyboard()
-        )
+        text = "💪 Жалғастыра беріңіз!"
     
-    await callback.answer()
+    await outbox.send(chat_id, text, reply_markup=get_main_menu_keyboard())
 
 
 @router.callback_query(F.data == "skip")
@@ -361,49 +366,46 @@ async def skip_workout(callback: CallbackQuery):
 
 
 @router.message(F.text == MENU["my_progress"])
-async def show_progress(message: Message):
+async def show_progress(message: Message, user: UserProfile | None, session: AsyncSession):
     """Показать прогресс пользователя"""
-    async with async_session_maker() as session:
-        user = await get_user_by_telegram_id(session, message.from_user.id)
-        
-        if not user:
-            await message.answer(ERRORS["no_profile"])
-            return
-        
-        # Получаем статистику
-        stats = await get_user_workout_stats(session, user.id, days=30)
-        
-        if stats["total"] == 0:
-            await message.answer(
-                PROGRESS["no_workouts"],
-                reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                    [InlineKeyboardButton(text="🏋️ Жаттығуға бастау", callback_data="workout:menu")],
-                    [InlineKeyboardButton(text="◀️ Артқа", callback_data="back_to_menu")]
-                ])
-            )
-            return
-        
-        # Форматируем статистику
-        feeling_map = {
-            "easy": "😊 Жеңіл",
-            "normal": "💪 Қалыпты",
-            "hard": "😅 Қиын",
-            None: "—"
-        }
-        
-        avg_feeling_text = feeling_map.get(stats["average_feeling"], "—")
-        
-        # Визуальный прогресс бар
-        progress_percent = min(stats["last_7_days"] / 4 * 100, 100)
-        filled = int(progress_percent / 10)
-        bar = "🟩" * filled + "⬜" * (10 - filled)
-        
-        # Streak info
-        current_streak = user.current_streak or 0
-        best_streak = user.best_streak or 0
-        fire = "🔥" * min(current_streak, 5) if current_streak > 0 else ""
-        
-        progress_text = f"""📊 *Менің нәтижелерім*
+    if not user:
+        await message.answer(ERRORS["no_profile"])
+        return
+    
+    # Получаем статистику
+    stats = await get_user_workout_stats(session, user.id, days=30)
+    
+    if stats["total"] == 0:
+        await message.answer(
+            PROGRESS["no_workouts"],
+            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
+                [InlineKeyboardButton(text="🏋️ Жаттығуға бастау", callback_data="workout:menu")],
+                [InlineKeyboardButton(text="◀️ Артқа", callback_data="back_to_menu")]
+            ])
+        )
+        return
+    
+    # Форматируем статистику
+    feeling_map = {
+        "easy": "😊 Жеңіл",
+        "normal": "💪 Қалыпты",
+        "hard": "😅 Қиын",
+        None: "—"
+    }
+    
+    avg_feeling_text = feeling_map.get(stats["average_feeling"], "—")
+    
+    # Визуальный прогресс бар
+    progress_percent = min(stats["last_7_days"] / 4 * 100, 100)
+    filled = int(progress_percent / 10)
+    bar = "🟩" * filled + "⬜" * (10 - filled)
+    
+    # Streak info
+    current_streak = user.current_streak or 0
+    best_streak = user.best_streak or 0
+    fire = "🔥" * min(current_streak, 5) if current_streak > 0 else ""
+    
+    progress_text = f"""📊 *Менің нәтижелерім*
 
 {fire} *Серия: {current_streak} күн*
 🏆 Рекорд: {best_streak} күн
@@ -419,131 +421,125 @@ _Мақсат: 4 жаттығу/апта_
 
 💪 Жалғастыра беріңіз!
 """
-        
-        await message.answer(
-            progress_text,
-            parse_mode="Markdown",
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="🏆 Жетістіктерім", callback_data="achievements")],
-                [InlineKeyboardButton(text="📜 Тарих", callback_data="workout:history")],
-                [InlineKeyboardButton(text="🏋️ Жаттығуға", callback_data="workout:menu")],
-                [InlineKeyboardButton(text="◀️ Артқа", callback_data="back_to_menu")]
-            ])
-        )
+    
+    await message.answer(
+        progress_text,
+        parse_mode="Markdown",
+        reply_markup=InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="🏆 Жетістіктерім", callback_data="achievements")],
+            [InlineKeyboardButton(text="📜 Тарих", callback_data="workout:history")],
+            [InlineKeyboardButton(text="🏋️ Жаттығуға", callback_data="workout:menu")],
+            [InlineKeyboardButton(text="◀️ Артқа", callback_data="back_to_menu")]
+        ])
+    )
 
 
 @router.callback_query(F.data == "achievements")
-async def show_achievements(callback: CallbackQuery):
+async def show_achievements(callback: CallbackQuery, user: UserProfile | None, session: AsyncSession):
     """Показать достижения пользователя"""
-    from services.achievements import get_user_achievements, format_achievements_text
+    from services.achievements import (
+        get_user_achievements, format_achievements_text, get_achievement_registry
+    )
     
-    async with async_session_maker() as session:
-        user = await get_user_by_telegram_id(session, callback.from_user.id)
-        
-        if not user:
-            await callback.answer("Профиль табылмады", show_alert=True)
-            return
-        
-        achievements = await get_user_achievements(session, user.id)
-        text = await format_achievements_text(achievements)
-        
-        # Показываем количество достижений
-        total_achievements = 9  # Всего достижений в системе
-        earned_count = len(achievements)
-        
-        header = f"🏆 *Жетістіктер: {earned_count}/{total_achievements}*\n\n"
-        
-        await callback.message.edit_text(
-            header + text,
-            parse_mode="Markdown",
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="📊 Нәтижелерге", callback_data="progress")],
-                [InlineKeyboardButton(text="◀️ Артқа", callback_data="back_to_menu")]
-            ])
-        )
+    if not user:
+        await callback.answer("Профиль табылмады", show_alert=True)
+        return
+    
+    achievements = await get_user_achievements(session, user.id)
+    text = await format_achievements_text(achievements)
+    
+    # Показываем количество достижений
+    registry = await get_achievement_registry(session)
+    total_achievements = len(registry)
+    earned_count = len(achievements)
     
+    header = f"🏆 *Жетістіктер: {earned_count}/{total_achievements}*\n\n"
+    
+    await callback.message.edit_text(
+        header + text,
+        parse_mode="Markdown",
+        reply_markup=InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="📊 Нәтижелерге", callback_data="progress")],
+            [InlineKeyboardButton(text="◀️ Артқа", callback_data="back_to_menu")]
+        ])
+    )
+
     await callback.answer()
 
 
 @router.callback_query(F.data == "workout:history")
-async def show_workout_history(callback: CallbackQuery):
+async def show_workout_history(callback: CallbackQuery, user: UserProfile | None, session: AsyncSession):
     """Показать историю тренировок за последние 30 дней"""
     from sqlalchemy import select
     from db.models import UserWorkout, Workout
     from datetime import date, timedelta
     
-    async with async_session_maker() as session:
-        user = await get_user_by_telegram_id(session, callback.from_user.id)
-        
-        if not user:
-            await callback.answer("Профиль табылмады", show_alert=True)
-            return
-        
-        # Получаем тренировки за 30 дней
-        start_date = date.today() - timedelta(days=30)
-        result = await session.execute(
-            select(UserWorkout, Workout)
-            .join(Workout)
-            .where(
-                UserWorkout.user_id == user.id,
-                UserWorkout.date >= start_date
-            )
-            .order_by(UserWorkout.date.desc())
-            .limit(15)
-        )
-        
-        workouts = result.all()
-        
-        if not workouts:
-            text = "📜 *Тарих*\n\nСоңғы 30 күнде жаттығу жоқ."
-        else:
-            text = "📜 *Соңғы жаттығулар:*\n\n"
-            
-            for uw, w in workouts:
-                feeling_emoji = {"easy": "😊", "normal": "💪", "hard": "😅"}.get(uw.feeling, "")
-                text += f"📅 *{uw.date.strftime('%d.%m')}* - {w.title} {feeling_emoji}\n"
-        
-        await callback.message.edit_text(
-            text,
-            parse_mode="Markdown",
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="📊 Нәтижелерге", callback_data="progress")],
-                [InlineKeyboardButton(text="◀️ Артқа", callback_data="back_to_menu")]
-            ])
+    if not user:
+        await callback.answer("Профиль табылмады", show_alert=True)
+        return
+    
+    # Получаем тренировки за 30 дней
+    start_date = date.today() - timedelta(days=30)
+    result = await session.execute(
+        select(UserWorkout, Workout)
+        .join(Workout)
+        .where(
+            UserWorkout.user_id == user.id,
+            UserWorkout.date >= start_date
         )
+        .order_by(UserWorkout.date.desc())
+        .limit(15)
+    )
+    
+    workouts = result.all()
+    
+    if not workouts:
+        text = "📜 *Тарих*\n\nСоңғы 30 күнде жаттығу жоқ."
+    else:
+        text = "📜 *Соңғы жаттығулар:*\n\n"
+        
+        for uw, w in workouts:
+            feeling_emoji = {"easy": "😊", "normal": "💪", "hard": "😅"}.get(uw.feeling, "")
+            text += f"📅 *{uw.date.strftime('%d.%m')}* - {w.title} {feeling_emoji}\n"
     
+    await callback.message.edit_text(
+        text,
+        parse_mode="Markdown",
+        reply_markup=InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="📊 Нәтижелерге", callback_data="progress")],
+            [InlineKeyboardButton(text="◀️ Артқа", callback_data="back_to_menu")]
+        ])
+    )
+
     await callback.answer()
 
 
 @router.callback_query(F.data == "progress")
-async def back_to_progress(callback: CallbackQuery):
+async def back_to_progress(callback: CallbackQuery, user: UserProfile | None, session: AsyncSession):
     """Вернуться к прогрессу через callback"""
-    async with async_session_maker() as session:
-        user = await get_user_by_telegram_id(session, callback.from_user.id)
-        
-        if not user:
-            await callback.answer("Профиль табылмады", show_alert=True)
-            return
-        
-        stats = await get_user_workout_stats(session, user.id, days=30)
-        
-        feeling_map = {
-            "easy": "😊 Жеңіл",
-            "normal": "💪 Қалыпты", 
-            "hard": "😅 Қиын",
-            None: "—"
-        }
-        
-        avg_feeling_text = feeling_map.get(stats["average_feeling"], "—")
-        progress_percent = min(stats["last_7_days"] / 4 * 100, 100)
-        filled = int(progress_percent / 10)
-        bar = "🟩" * filled + "⬜" * (10 - filled)
-        
-        current_streak = user.current_streak or 0
-        best_streak = user.best_streak or 0
-        fire = "🔥" * min(current_streak, 5) if current_streak > 0 else ""
-        
-        progress_text = f"""📊 *Менің нәтижелерім*
+    if not user:
+        await callback.answer("Профиль табылмады", show_alert=True)
+        return
+    
+    stats = await get_user_workout_stats(session, user.id, days=30)
+    
+    feeling_map = {
+        "easy": "😊 Жеңіл",
+        "normal": "💪 Қалыпты", 
+        "hard": "😅 Қиын",
+        None: "—"
+    }
+    
+    avg_feeling_text = feeling_map.get(stats["average_feeling"], "—")
+    progress_percent = min(stats["last_7_days"] / 4 * 100, 100)
+    filled = int(progress_percent / 10)
+    bar = "🟩" * filled + "⬜" * (10 - filled)
+    
+    current_streak = user.current_streak or 0
+    best_streak = user.best_streak or 0
+    fire = "🔥" * min(current_streak, 5) if current_streak > 0 else ""
+    
+    progress_text = f"""📊 *Менің нәтижелерім*
 
 {fire} *Серия: {current_streak} күн*
 🏆 Рекорд: {best_streak} күн
@@ -556,16 +552,16 @@ async def back_to_progress(callback: CallbackQuery):
 
 💪 Жалғастыра беріңіз!
 """
-        
-        await callback.message.edit_text(
-            progress_text,
-            parse_mode="Markdown",
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="🏆 Жетістіктерім", callback_data="achievements")],
-                [InlineKeyboardButton(text="📜 Тарих", callback_data="workout:history")],
-                [InlineKeyboardButton(text="🏋️ Жаттығуға", callback_data="workout:menu")],
-                [InlineKeyboardButton(text="◀️ Артқа", callback_data="back_to_menu")]
-            ])
-        )
     
+    await callback.message.edit_text(
+        progress_text,
+        parse_mode="Markdown",
+        reply_markup=InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="🏆 Жетістіктерім", callback_data="achievements")],
+            [InlineKeyboardButton(text="📜 Тарих", callback_data="workout:history")],
+            [InlineKeyboardButton(text="🏋️ Жаттығуға", callback_data="workout:menu")],
+            [InlineKeyboardButton(text="◀️ Артқа", callback_data="back_to_menu")]
+        ])
+    )
+
     await callback.answer()
@@ -4,6 +4,7 @@
 """
 import asyncio
 from db.session import async_session_maker, init_db
+from services.workout_catalog import catalog_reload_notice
 from services.workouts import create_workout_template
 
 # ===== ДОМАШНИЕ ТРЕНИРОВКИ =====
@@ -445,6 +446,7 @@ async def load_workouts():
     print(f"\n✅ Загружено: {loaded}")
     print(f"⏭ Пропущено (уже есть): {skipped}")
     print(f"📊 Всего: {loaded + skipped}")
+    print(catalog_reload_notice())
 
 
 if __name__ == "__main__":
@@ -3,12 +3,24 @@
 """
 import asyncio
 import logging
+import signal
+import time
+from aiohttp import web
 from aiogram import Bot, Dispatcher
 from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 
 from config import config
-from db.session import init_db, async_session_maker
+from db.fsm_storage import SQLStorage
+from db.session import init_db, async_session_maker, session_middleware
+from db.writer import start_db_writer, stop_db_writer
 from handlers import onboarding, menu, workouts, ai_handler, video_workouts, contacts
+from services.ai_service import start_ai_client, close_ai_client
+from services.ai_usage import get_token_ledger
+from services.outbox import Outbox
+from services.reminders import ReminderDispatcher
+from services.tasks import TaskQueue
+from services.user_cache import get_user_profile_cache, user_profile_middleware
 
 # Настройка логирования
 logging.basicConfig(
@@ -28,6 +40,7 @@ async def init_data():
     from services.achievements import init_achievements
     from load_workouts import generate_all_templates
     from services.workouts import create_workout_template
+    from services.workout_catalog import load_workout_catalog
     from sqlalchemy import select
     from db.models import Workout
     
@@ -53,10 +66,104 @@ async def init_data():
                     pass
             logger.info(f"Загружено {len(templates)} тренировок")
         
+        # Каталог тренировок в памяти (подбор плана без запросов к БД)
+        catalog = await load_workout_catalog(session)
+        logger.info(f"Каталог тренировок: {len(catalog.templates)} шаблонов")
+        
         # Инициализация достижений
         await init_achievements(session)
 
 
+class WebhookRequestHandler(SimpleRequestHandler):
+    """
+    SimpleRequestHandler с фоновой обработкой обновлений: Telegram получает
+    ответ сразу, а задачи обработки хранятся в handler_tasks, чтобы при
+    остановке дождаться их до остановки фоновой очереди и outbox.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, **kwargs):
+        super().__init__(dispatcher=dispatcher, bot=bot, handle_in_background=True, **kwargs)
+        self.handler_tasks: set[asyncio.Task] = set()
+
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        update = await request.json(loads=bot.session.json_loads)
+        task = asyncio.create_task(self._background_feed_update(bot=bot, update=update))
+        self.handler_tasks.add(task)
+        task.add_done_callback(self.handler_tasks.discard)
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    async def drain(self, timeout: float):
+        """Дождаться обработки принятых обновлений, не дольше timeout секунд"""
+        if not self.handler_tasks:
+            return
+        _, pending = await asyncio.wait(set(self.handler_tasks), timeout=timeout)
+        if pending:
+            logger.warning(f"Webhook: не дождались обработки {len(pending)} обновлений, отменяю")
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+
+async def run_webhook(bot: Bot, dp: Dispatcher, outbox: Outbox):
+    """
+    Прием обновлений через webhook (aiohttp-сервер).
+    Запросы без правильного секрета отклоняются, GET HEALTH_PATH - проверка
+    для балансировщика. Останавливается по SIGINT/SIGTERM: сервер сначала
+    дожидается обработки уже принятых обновлений.
+    """
+    started = time.monotonic()
+    
+    async def health(request: web.Request) -> web.Response:
+        return web.json_response({
+            "status": "ok",
+            "uptime": int(time.monotonic() - started),
+            "outbox_pending": outbox.pending(),
+            "user_cache_hit_rate": round(get_user_profile_cache().hit_rate(), 3)
+        })
+    
+    app = web.Application()
+    request_handler = WebhookRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=config.WEBHOOK_SECRET
+    )
+    request_handler.register(app, path=config.WEBHOOK_PATH)
+    app.router.add_get(config.HEALTH_PATH, health)
+    setup_application(app, dp, bot=bot)
+    
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, config.WEBAPP_HOST, config.WEBAPP_PORT)
+    await site.start()
+    
+    await bot.set_webhook(
+        config.WEBHOOK_URL.rstrip("/") + config.WEBHOOK_PATH,
+        secret_token=config.WEBHOOK_SECRET,
+        allowed_updates=dp.resolve_used_update_types(),
+        max_connections=config.WEBHOOK_MAX_CONNECTIONS
+    )
+    logger.info(f"Webhook: слушаю {config.WEBAPP_HOST}:{config.WEBAPP_PORT}{config.WEBHOOK_PATH}")
+    
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            # Windows: остается KeyboardInterrupt
+            pass
+    
+    try:
+        await stop.wait()
+    finally:
+        if config.WEBHOOK_DELETE_ON_SHUTDOWN:
+            await bot.delete_webhook()
+        await runner.cleanup()
+        # Новые обновления больше не принимаются - дорабатываем принятые
+        # (main() после этого останавливает фоновую очередь и outbox)
+        await request_handler.drain(config.WEBHOOK_DRAIN_TIMEOUT)
+
+
 async def main():
     """Основная функция запуска бота"""
     # Валидация конфигурации
@@ -75,10 +182,33 @@ async def main():
     await init_data()
     logger.info("Данные инициализированы")
     
+    # Общий HTTP-клиент AI (пул соединений на всё время работы)
+    await start_ai_client()
+    
+    # Учет токенов AI (расход за сегодня, периодическая запись в БД)
+    token_ledger = get_token_ledger()
+    await token_ledger.start()
+    
+    # Один писатель SQLite: записи хендлеров - через очередь с групповым commit,
+    # сессии апдейтов - из пула только для чтения
+    if config.DB_WRITE_MODE == "queue":
+        await start_db_writer()
+    
     # Создание бота и диспетчера
     bot = Bot(token=config.BOT_TOKEN)
-    storage = MemoryStorage()
+    if config.FSM_STORAGE == "db":
+        # Состояния диалогов в БД: переживают перезапуск, общие для воркеров
+        storage = SQLStorage()
+        await storage.start()
+    else:
+        storage = MemoryStorage()
     dp = Dispatcher(storage=storage)
+    if isinstance(storage, SQLStorage):
+        dp.update.outer_middleware(storage.flush_middleware)
+    # Сессия БД на апдейт (аргумент session): commit один раз в конце апдейта
+    dp.update.outer_middleware(session_middleware)
+    # Профиль отправителя - один раз на апдейт (в хендлерах аргумент user)
+    dp.update.outer_middleware(user_profile_middleware)
     
     # Подключение роутеров
     dp.include_router(onboarding.router)
@@ -88,12 +218,39 @@ async def main():
     dp.include_router(video_workouts.router)
     dp.include_router(contacts.router)
     
+    # Очередь исходящих сообщений (доступна в хендлерах как аргумент outbox)
+    outbox = Outbox(bot)
+    outbox.start()
+    dp["outbox"] = outbox
+    
+    # Фоновые задачи (AI-совет после тренировки), аргумент tasks в хендлерах
+    tasks = TaskQueue()
+    tasks.start()
+    dp["tasks"] = tasks
+    
+    # Планировщик напоминаний (при нескольких воркерах - только в одном)
+    reminders = ReminderDispatcher(outbox)
+    if config.SCHEDULER_ENABLED:
+        reminders.start()
+    
     logger.info("Бот запускается...")
     
     try:
-        # Запуск polling
-        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+        if config.WEBHOOK_URL:
+            await run_webhook(bot, dp, outbox)
+        else:
+            # Запуск polling (снимаем webhook, если он был установлен)
+            await bot.delete_webhook()
+            await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
     finally:
+        await reminders.shutdown()
+        # Сначала дорабатывают фоновые задачи - они отправляют через outbox
+        await tasks.stop()
+        await outbox.stop()
+        await stop_db_writer()
+        await token_ledger.stop()
+        await storage.close()
+        await close_ai_client()
         await bot.session.close()
         logger.info("Бот остановлен")
 
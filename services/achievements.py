@@ -1,41 +1,127 @@
 """
 Сервис для работы с достижениями и streak
 """
-from sqlalchemy import select, func
+from dataclasses import dataclass
+from types import MappingProxyType
+from sqlalchemy import select, func, insert
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.asyncio import AsyncSession
 from db.models import User, UserWorkout, Achievement, UserAchievement
+from db.session import after_commit, commit
+from services.user_cache import get_user_profile_cache
 from datetime import date, timedelta
 
 
 # Определение достижений
+# metric/threshold - декларативное правило выдачи: значение метрики >= порога
 ACHIEVEMENTS = [
-    {"code": "first_workout", "title": "Бірінші жаттығу", "emoji": "🎯", "description": "Алғашқы жаттығуды аяқтадың!"},
-    {"code": "streak_3", "title": "3 күн серия", "emoji": "🔥", "description": "3 күн қатарынан жаттықтың!"},
-    {"code": "streak_7", "title": "7 күн серия", "emoji": "🔥🔥", "description": "Бір апта серия! Тамаша!"},
-    {"code": "streak_14", "title": "2 апта серия", "emoji": "🔥🔥🔥", "description": "2 апта қатарынан!"},
-    {"code": "streak_30", "title": "30 күн серия", "emoji": "👑", "description": "Бір ай! Сен чемпионсың!"},
-    {"code": "workouts_10", "title": "10 жаттығу", "emoji": "💪", "description": "10 жаттығу орындадың!"},
-    {"code": "workouts_25", "title": "25 жаттығу", "emoji": "💪💪", "description": "25 жаттығу! Жарайсың!"},
-    {"code": "workouts_50", "title": "50 жаттығу", "emoji": "🏆", "description": "50 жаттығу - үлкен жетістік!"},
-    {"code": "workouts_100", "title": "100 жаттығу", "emoji": "🥇", "description": "100 жаттығу! Керемет!"},
+    {"code": "first_workout", "title": "Бірінші жаттығу", "emoji": "🎯", "description": "Алғашқы жаттығуды аяқтадың!", "metric": "workouts", "threshold": 1},
+    {"code": "streak_3", "title": "3 күн серия", "emoji": "🔥", "description": "3 күн қатарынан жаттықтың!", "metric": "streak", "threshold": 3},
+    {"code": "streak_7", "title": "7 күн серия", "emoji": "🔥🔥", "description": "Бір апта серия! Тамаша!", "metric": "streak", "threshold": 7},
+    {"code": "streak_14", "title": "2 апта серия", "emoji": "🔥🔥🔥", "description": "2 апта қатарынан!", "metric": "streak", "threshold": 14},
+    {"code": "streak_30", "title": "30 күн серия", "emoji": "👑", "description": "Бір ай! Сен чемпионсың!", "metric": "streak", "threshold": 30},
+    {"code": "workouts_10", "title": "10 жаттығу", "emoji": "💪", "description": "10 жаттығу орындадың!", "metric": "workouts", "threshold": 10},
+    {"code": "workouts_25", "title": "25 жаттығу", "emoji": "💪💪", "description": "25 жаттығу! Жарайсың!", "metric": "workouts", "threshold": 25},
+    {"code": "workouts_50", "title": "50 жаттығу", "emoji": "🏆", "description": "50 жаттығу - үлкен жетістік!", "metric": "workouts", "threshold": 50},
+    {"code": "workouts_100", "title": "100 жаттығу", "emoji": "🥇", "description": "100 жаттығу! Керемет!", "metric": "workouts", "threshold": 100},
 ]
 
 
-async def init_achievements(session: AsyncSession):
-    """Инициализировать достижения в БД"""
-    for ach_data in ACHIEVEMENTS:
-        result = await session.execute(
-            select(Achievement).where(Achievement.code == ach_data["code"])
+@dataclass(frozen=True, slots=True)
+class AchievementDef:
+    """Неизменяемое определение достижения (строка achievements + правило)"""
+    id: int
+    code: str
+    title: str
+    emoji: str | None
+    description: str | None
+    metric: str | None = None  # workouts - всего тренировок, streak - текущая серия
+    threshold: int | None = None
+
+
+class AchievementRegistry:
+    """Реестр достижений процесса: code -> id и id -> определение"""
+    
+    def __init__(self, definitions: list[AchievementDef]):
+        self.definitions = tuple(sorted(definitions, key=lambda d: d.id))
+        self.by_code = MappingProxyType({d.code: d for d in self.definitions})
+        self.by_id = MappingProxyType({d.id: d for d in self.definitions})
+        self.ids_by_code = MappingProxyType({d.code: d.id for d in self.definitions})
+        # Только достижения с правилом выдачи
+        self.rules = tuple(d for d in self.definitions if d.metric is not None)
+    
+    def __len__(self) -> int:
+        return len(self.definitions)
+
+
+_registry: AchievementRegistry | None = None
+
+
+async def _load_registry(session: AsyncSession) -> AchievementRegistry:
+    """Прочитать таблицу achievements одним запросом и установить реестр"""
+    global _registry
+    rules = {a["code"]: a for a in ACHIEVEMENTS}
+    result = await session.execute(select(Achievement))
+    _registry = AchievementRegistry([
+        AchievementDef(
+            id=ach.id,
+            code=ach.code,
+            title=ach.title,
+            emoji=ach.emoji,
+            description=ach.description,
+            metric=rules.get(ach.code, {}).get("metric"),
+            threshold=rules.get(ach.code, {}).get("threshold"),
+        )
+        for ach in result.scalars()
+    ])
+    return _registry
+
+
+async def get_achievement_registry(session: AsyncSession) -> AchievementRegistry:
+    """Получить реестр достижений (загружается при первом обращении)"""
+    if _registry is not None:
+        return _registry
+    return await _load_registry(session)
+
+
+async def init_achievements(session: AsyncSession) -> AchievementRegistry:
+    """
+    Инициализировать достижения в БД одним bulk upsert
+    и заполнить реестр процесса.
+    """
+    rows = [
+        {
+            "code": a["code"],
+            "title": a["title"],
+            "emoji": a["emoji"],
+            "description": a["description"]
+        }
+        for a in ACHIEVEMENTS
+    ]
+    
+    dialect = session.bind.dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        dialect_insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+        stmt = dialect_insert(Achievement).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Achievement.code],
+            set_={
+                "title": stmt.excluded.title,
+                "emoji": stmt.excluded.emoji,
+                "description": stmt.excluded.description
+            }
         )
-        if not result.scalar_one_or_none():
-            achievement = Achievement(
-                code=ach_data["code"],
-                title=ach_data["title"],
-                emoji=ach_data["emoji"],
-                description=ach_data["description"]
-            )
-            session.add(achievement)
+        await session.execute(stmt)
+    else:
+        # Без ON CONFLICT: вставляем только отсутствующие коды
+        result = await session.execute(select(Achievement.code))
+        existing = set(result.scalars())
+        missing = [row for row in rows if row["code"] not in existing]
+        if missing:
+            await session.execute(insert(Achievement), missing)
     await session.commit()
+    
+    return await _load_registry(session)
 
 
 async def update_streak(session: AsyncSession, user: User) -> dict:
@@ -73,7 +159,8 @@ async def update_streak(session: AsyncSession, user: User) -> dict:
         user.best_streak = user.current_streak
         new_record = True
     
-    await session.commit()
+    await commit(session)
+    after_commit(session, lambda: get_user_profile_cache().update(user))
     
     return {
         "streak": user.current_streak,
@@ -86,74 +173,63 @@ async def update_streak(session: AsyncSession, user: User) -> dict:
 async def check_and_award_achievements(
     session: AsyncSession, 
     user: User
-) -> list[Achievement]:
+) -> list[AchievementDef]:
     """
     Проверить и наградить пользователя достижениями.
     Возвращает список новых достижений.
+    
+    Правила берутся из реестра: полученные достижения читаются одним
+    запросом, новые вычисляются в памяти и вставляются одним INSERT.
     """
-    new_achievements = []
+    registry = await get_achievement_registry(session)
     
     # Получаем статистику
     total_workouts = await session.execute(
         select(func.count(UserWorkout.id)).where(UserWorkout.user_id == user.id)
     )
-    total_count = total_workouts.scalar() or 0
-    
-    # Определяем какие достижения нужно проверить
-    checks = [
-        ("first_workout", total_count >= 1),
-        ("workouts_10", total_count >= 10),
-        ("workouts_25", total_count >= 25),
-        ("workouts_50", total_count >= 50),
-        ("workouts_100", total_count >= 100),
-        ("streak_3", (user.current_streak or 0) >= 3),
-        ("streak_7", (user.current_streak or 0) >= 7),
-        ("streak_14", (user.current_streak or 0) >= 14),
-        ("streak_30", (user.current_streak or 0) >= 30),
+    metrics = {
+        "workouts": total_workouts.scalar() or 0,
+        "streak": user.current_streak or 0,
+    }
+    
+    qualified = [
+        d for d in registry.rules
+        if metrics.get(d.metric, 0) >= d.threshold
     ]
+    if not qualified:
+        return []
     
-    for code, condition in checks:
-        if condition:
-            # Проверяем, есть ли уже это достижение
-            existing = await session.execute(
-                select(UserAchievement).join(Achievement).where(
-                    UserAchievement.user_id == user.id,
-                    Achievement.code == code
-                )
-            )
-            if not existing.scalar_one_or_none():
-                # Находим достижение
-                ach_result = await session.execute(
-                    select(Achievement).where(Achievement.code == code)
-                )
-                achievement = ach_result.scalar_one_or_none()
-                
-                if achievement:
-                    # Награждаем
-                    user_ach = UserAchievement(
-                        user_id=user.id,
-                        achievement_id=achievement.id
-                    )
-                    session.add(user_ach)
-                    new_achievements.append(achievement)
+    result = await session.execute(
+        select(UserAchievement.achievement_id).where(UserAchievement.user_id == user.id)
+    )
+    earned_ids = set(result.scalars())
+    new_achievements = [d for d in qualified if d.id not in earned_ids]
     
     if new_achievements:
-        await session.commit()
+        # OR IGNORE - на случай параллельного нажатия (уникальный индекс)
+        await session.execute(
+            insert(UserAchievement).prefix_with("OR IGNORE", dialect="sqlite"),
+            [{"user_id": user.id, "achievement_id": d.id} for d in new_achievements]
+        )
+        await commit(session)
     
     return new_achievements
 
 
 async def get_user_achievements(session: AsyncSession, user_id: int) -> list[dict]:
     """Получить все достижения пользователя"""
+    registry = await get_achievement_registry(session)
     result = await session.execute(
-        select(Achievement, UserAchievement.earned_at)
-        .join(UserAchievement)
+        select(UserAchievement.achievement_id, UserAchievement.earned_at)
         .where(UserAchievement.user_id == user_id)
         .order_by(UserAchievement.earned_at.desc())
     )
     
     achievements = []
-    for ach, earned_at in result:
+    for achievement_id, earned_at in result:
+        ach = registry.by_id.get(achievement_id)
+        if not ach:
+            continue
         achievements.append({
             "code": ach.code,
             "title": ach.title,
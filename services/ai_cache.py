@@ -0,0 +1,166 @@
+"""
+Кэш ответов AI для детерминированных промптов.
+
+Ключ - хэш нормализованного промпта. В памяти: TTL + LRU.
+Опционально записи дублируются в отдельный SQLite-файл (не основная БД),
+чтобы попадания переживали перезапуск. На один ключ хранится несколько
+вариантов ответа, чтобы повторные ответы не выглядели одинаково.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import sqlite3
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Entry:
+    answers: list[str]
+    expires_at: float = field(default=0.0)
+
+
+def make_cache_key(messages: list, max_tokens: int) -> str:
+    """Хэш промпта: регистр и лишние пробелы не влияют на ключ"""
+    normalized = [
+        {"role": m["role"], "content": " ".join(m["content"].lower().split())}
+        for m in messages
+    ]
+    raw = json.dumps([normalized, max_tokens], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class AIResponseCache:
+    """TTL/LRU-кэш ответов с пулом вариантов и опциональным SQLite на диске"""
+
+    def __init__(
+        self,
+        max_entries: int | None = None,
+        ttl: float | None = None,
+        variants: int | None = None,
+        path: str | None = None
+    ):
+        self.max_entries = max_entries or config.AI_CACHE_SIZE
+        self.ttl = ttl or config.AI_CACHE_TTL
+        self.variants = variants or config.AI_CACHE_VARIANTS
+        self.path = config.AI_CACHE_PATH if path is None else path
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "fills": 0, "evictions": 0}
+
+        if self.path:
+            self._load()
+
+    def get(self, key: str) -> str | None:
+        """
+        Вернуть случайный вариант ответа или None.
+        Пока пул вариантов не заполнен, возвращается None - вызывающий
+        запросит еще один вариант у AI (считается в fills, а не в misses).
+        """
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at < time.time():
+            del self._entries[key]
+            entry = None
+
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+        if len(entry.answers) < self.variants:
+            self.stats["fills"] += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.stats["hits"] += 1
+        return random.choice(entry.answers)
+
+    def peek(self, key: str) -> str | None:
+        """Любой сохраненный вариант, даже если пул не заполнен (для деградации)"""
+        entry = self._entries.get(key)
+        if entry is None or not entry.answers or entry.expires_at < time.time():
+            return None
+        return random.choice(entry.answers)
+    
+    def add(self, key: str, answer: str):
+        """Добавить вариант ответа в пул ключа"""
+        entry = self._entries.get(key)
+        if entry is None or entry.expires_at < time.time():
+            entry = self._entries[key] = _Entry([], time.time() + self.ttl)
+        if answer in entry.answers or len(entry.answers) >= self.variants:
+            return
+        entry.answers.append(answer)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+        if self.path:
+            self._schedule_persist(key, entry)
+
+    def hit_rate(self) -> float:
+        """Доля обращений, обслуженных из кэша (дозаполнение пула - не попадание)"""
+        total = self.stats["hits"] + self.stats["misses"] + self.stats["fills"]
+        return self.stats["hits"] / total if total else 0.0
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS ai_cache ("
+            "key TEXT PRIMARY KEY, answers TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        return conn
+
+    def _load(self):
+        """Прочитать непросроченные записи с диска (при запуске)"""
+        try:
+            with self._connect() as conn:
+                now = time.time()
+                conn.execute("DELETE FROM ai_cache WHERE expires_at < ?", (now,))
+                rows = conn.execute(
+                    "SELECT key, answers, expires_at FROM ai_cache "
+                    "ORDER BY expires_at DESC LIMIT ?",
+                    (self.max_entries,)
+                ).fetchall()
+            conn.close()
+        except sqlite3.Error as e:
+            logger.error(f"AI cache load error: {e}")
+            return
+
+        for key, answers, expires_at in reversed(rows):
+            self._entries[key] = _Entry(json.loads(answers), expires_at)
+        logger.info(f"AI cache: загружено {len(rows)} записей из {self.path}")
+
+    def _schedule_persist(self, key: str, entry: _Entry):
+        row = (key, json.dumps(entry.answers, ensure_ascii=False), entry.expires_at)
+        try:
+            asyncio.get_running_loop().run_in_executor(None, self._persist, row)
+        except RuntimeError:
+            self._persist(row)
+
+    def _persist(self, row: tuple):
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO ai_cache (key, answers, expires_at) VALUES (?, ?, ?)",
+                    row
+                )
+            conn.close()
+        except sqlite3.Error as e:
+            logger.error(f"AI cache persist error: {e}")
+
+
+_cache: AIResponseCache | None = None
+
+
+def get_ai_cache() -> AIResponseCache:
+    """Общий кэш процесса"""
+    global _cache
+    if _cache is None:
+        _cache = AIResponseCache()
+    return _cache
@@ -0,0 +1,249 @@
+"""
+Память диалога с AI-тренером.
+
+На пользователя хранится кольцевой буфер последних AI_MEMORY_TURNS
+обменов (вопрос, ответ) и краткое содержание более старой части.
+Когда история становится длиннее AI_MEMORY_SUMMARY_TOKENS, старые
+обмены сворачиваются в краткое содержание (через AI или, если AI
+недоступен, простым сокращением).
+
+Диалоги без активности дольше AI_MEMORY_IDLE_TTL удаляются, всего
+в памяти не больше AI_MEMORY_MAX_USERS диалогов (LRU). Для переживания
+перезапуска диалоги дублируются в отдельный SQLite-файл (не основная БД).
+"""
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable
+
+from config import config
+from services.ai_usage import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Сколько последних обменов оставлять дословно при сворачивании
+_KEEP_TURNS = 2
+
+
+@dataclass
+class Conversation:
+    """Диалог одного пользователя"""
+    turns: deque
+    summary: str = ""
+    last_active: float = field(default_factory=time.time)
+    summarizing: bool = False
+
+    def tokens(self) -> int:
+        return estimate_tokens(self.summary) + sum(
+            estimate_tokens(question) + estimate_tokens(answer)
+            for question, answer in self.turns
+        )
+
+
+Summarizer = Callable[[str, list], Awaitable[str | None]]
+
+
+class ConversationStore:
+    """LRU диалогов с вытеснением по простою и копией на диске"""
+
+    def __init__(
+        self,
+        max_turns: int | None = None,
+        max_users: int | None = None,
+        idle_ttl: float | None = None,
+        path: str | None = None
+    ):
+        self.max_turns = max_turns or config.AI_MEMORY_TURNS
+        self.max_users = max_users or config.AI_MEMORY_MAX_USERS
+        self.idle_ttl = idle_ttl or config.AI_MEMORY_IDLE_TTL
+        self.path = config.AI_MEMORY_PATH if path is None else path
+        self._conversations: OrderedDict[int, Conversation] = OrderedDict()
+        # Один поток записи: снимки одного диалога пишутся по порядку
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ai-memory")
+        self.stats = {"summarized": 0, "evicted": 0}
+
+        if self.path:
+            self._load()
+
+    def get(self, user_id: int) -> Conversation | None:
+        """
+        Текущий диалог пользователя (None - начинаем заново).
+        Чтение тоже активность: last_active обновляется вместе с позицией
+        в LRU, иначе порядок разошелся бы с last_active и _evict_idle,
+        идущий от начала до первого свежего диалога, пропускал бы брошенные.
+        """
+        self._evict_idle()
+        conversation = self._conversations.get(user_id)
+        if conversation is not None:
+            conversation.last_active = time.time()
+            self._conversations.move_to_end(user_id)
+        return conversation
+
+    def add_turn(self, user_id: int, question: str, answer: str) -> Conversation:
+        """Добавить обмен в буфер; вытесняемый обмен попадает в краткое содержание"""
+        conversation = self.get(user_id)
+        if conversation is None:
+            conversation = self._conversations[user_id] = Conversation(deque(maxlen=self.max_turns))
+
+        if len(conversation.turns) == self.max_turns:
+            conversation.summary = self._fold(conversation.summary, [conversation.turns[0]])
+        conversation.turns.append((
+            question[:config.AI_MEMORY_TURN_CHARS],
+            answer[:config.AI_MEMORY_TURN_CHARS]
+        ))
+        conversation.last_active = time.time()
+
+        while len(self._conversations) > self.max_users:
+            evicted, _ = self._conversations.popitem(last=False)
+            self.stats["evicted"] += 1
+            self._schedule_write(self._delete, evicted)
+
+        self._save_later(user_id, conversation)
+        return conversation
+
+    def clear(self, user_id: int):
+        """Забыть диалог пользователя"""
+        if self._conversations.pop(user_id, None) is not None:
+            self._schedule_write(self._delete, user_id)
+
+    def needs_summary(self, conversation: Conversation) -> bool:
+        return (
+            not conversation.summarizing
+            and len(conversation.turns) > _KEEP_TURNS
+            and conversation.tokens() > config.AI_MEMORY_SUMMARY_TOKENS
+        )
+
+    async def summarize(self, user_id: int, conversation: Conversation, summarizer: Summarizer):
+        """
+        Свернуть все обмены, кроме последних _KEEP_TURNS, в краткое содержание.
+        summarizer(старое содержание, обмены) -> новое содержание или None
+        """
+        conversation.summarizing = True
+        try:
+            folded = list(conversation.turns)[:-_KEEP_TURNS]
+            summary = None
+            try:
+                summary = await summarizer(conversation.summary, folded)
+            except Exception as e:
+                logger.error(f"AI memory summarize error: {e}")
+            if not summary:
+                summary = self._fold(conversation.summary, folded)
+
+            # Пока ждали AI, буфер мог сдвинуться - убираем только то, что свернули
+            for turn in folded:
+                if conversation.turns and conversation.turns[0] == turn:
+                    conversation.turns.popleft()
+            conversation.summary = summary[-config.AI_MEMORY_SUMMARY_CHARS:]
+            self.stats["summarized"] += 1
+            if self._conversations.get(user_id) is conversation:
+                self._save_later(user_id, conversation)
+        finally:
+            conversation.summarizing = False
+
+    @staticmethod
+    def _fold(summary: str, turns: list) -> str:
+        """Сокращение без AI: к содержанию добавляются заданные вопросы"""
+        questions = "; ".join(question[:150] for question, _ in turns)
+        folded = f"{summary}; {questions}" if summary else questions
+        return folded[-config.AI_MEMORY_SUMMARY_CHARS:]
+
+    def _evict_idle(self):
+        """Удалить диалоги без активности дольше idle_ttl (самые старые - в начале)"""
+        cutoff = time.time() - self.idle_ttl
+        evicted = False
+        while self._conversations:
+            user_id, conversation = next(iter(self._conversations.items()))
+            if conversation.last_active >= cutoff:
+                break
+            del self._conversations[user_id]
+            self.stats["evicted"] += 1
+            evicted = True
+        if evicted:
+            self._schedule_write(self._prune, cutoff)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS conversations ("
+            "user_id INTEGER PRIMARY KEY, summary TEXT NOT NULL, "
+            "turns TEXT NOT NULL, last_active REAL NOT NULL)"
+        )
+        return conn
+
+    def _load(self):
+        """Прочитать активные диалоги с диска (при запуске)"""
+        cutoff = time.time() - self.idle_ttl
+        try:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM conversations WHERE last_active < ?", (cutoff,))
+                rows = conn.execute(
+                    "SELECT user_id, summary, turns, last_active FROM conversations "
+                    "ORDER BY last_active DESC LIMIT ?",
+                    (self.max_users,)
+                ).fetchall()
+            conn.close()
+        except sqlite3.Error as e:
+            logger.error(f"AI memory load error: {e}")
+            return
+
+        for user_id, summary, turns, last_active in reversed(rows):
+            self._conversations[user_id] = Conversation(
+                deque((tuple(turn) for turn in json.loads(turns)), maxlen=self.max_turns),
+                summary,
+                last_active
+            )
+        logger.info(f"AI memory: загружено {len(rows)} диалогов из {self.path}")
+
+    def _save_later(self, user_id: int, conversation: Conversation):
+        """Записать снимок диалога в фоне"""
+        self._schedule_write(self._persist, (
+            user_id,
+            conversation.summary,
+            json.dumps(list(conversation.turns), ensure_ascii=False),
+            conversation.last_active
+        ))
+
+    def _schedule_write(self, write, *args):
+        if not self.path:
+            return
+        try:
+            asyncio.get_running_loop().run_in_executor(self._writer, write, *args)
+        except RuntimeError:
+            write(*args)
+
+    def _execute(self, sql: str, params: tuple):
+        try:
+            with self._connect() as conn:
+                conn.execute(sql, params)
+            conn.close()
+        except sqlite3.Error as e:
+            logger.error(f"AI memory write error: {e}")
+
+    def _persist(self, row: tuple):
+        self._execute(
+            "INSERT OR REPLACE INTO conversations (user_id, summary, turns, last_active) "
+            "VALUES (?, ?, ?, ?)",
+            row
+        )
+
+    def _delete(self, user_id: int):
+        self._execute("DELETE FROM conversations WHERE user_id = ?", (user_id,))
+
+    def _prune(self, cutoff: float):
+        self._execute("DELETE FROM conversations WHERE last_active < ?", (cutoff,))
+
+
+_store: ConversationStore | None = None
+
+
+def get_conversation_store() -> ConversationStore:
+    """Общее хранилище диалогов процесса"""
+    global _store
+    if _store is None:
+        _store = ConversationStore()
+    return _store
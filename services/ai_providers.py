@@ -0,0 +1,468 @@
+"""
+Провайдеры AI за общим интерфейсом.
+
+Все провайдеры умеют chat() (полный ответ, "" при ошибке) и chat_stream()
+(фрагменты ответа) и объявляют is_local (шаблоны без модели) и cacheable
+(ответы можно класть в кэш). Выбор провайдера - config.AI_PROVIDER:
+  groq   - Groq API
+  openai - любой OpenAI-совместимый endpoint (AI_API_URL, AI_API_KEY, AI_MODEL)
+  local  - шаблонные ответы без сети (nutrition_kk, texts_kk)
+  auto   - groq, если задан GROQ_API_KEY, иначе local
+"""
+import aiohttp
+import asyncio
+import hashlib
+import json
+import logging
+import time
+
+from config import config
+from nutrition_kk import NUTRITION_TIPS
+from texts_kk import GOALS, WORKOUTS
+from services.ai_usage import estimate_tokens
+from services.ai_resilience import (
+    AIRequestError,
+    CircuitBreaker,
+    LatencyTracker,
+    backoff_delay,
+    parse_retry_after,
+)
+
+logger = logging.getLogger(__name__)
+
+GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
+
+
+class OpenAICompatibleClient:
+    """
+    Долгоживущий HTTP-клиент chat/completions в формате OpenAI: один
+    ClientSession с пулом соединений (keep-alive, лимит на хост, кэш DNS),
+    чтобы не делать новый TLS handshake на каждый вызов.
+
+    Ошибки 429/5xx/сети повторяются с backoff (с учетом Retry-After),
+    медленный запрос можно продублировать после p95 задержки (hedging),
+    а после серии ошибок circuit breaker сразу отдает пустой ответ.
+    """
+
+    name = "openai"
+    # Настоящая модель по сети (не шаблоны)
+    is_local = False
+    # Ответы модели можно класть в кэш ответов
+    cacheable = True
+
+    def __init__(
+        self,
+        api_url: str | None = None,
+        api_key: str | None = None,
+        model: str | None = None,
+        limit_per_host: int | None = None,
+        timeout: float | None = None
+    ):
+        self.api_url = api_url or config.AI_API_URL
+        self.api_key = config.AI_API_KEY if api_key is None else api_key
+        self.model = model or config.AI_MODEL
+        self.limit_per_host = limit_per_host or config.AI_CONNECTION_LIMIT
+        self.timeout_seconds = timeout or config.AI_TIMEOUT
+        self.timeout = aiohttp.ClientTimeout(total=self.timeout_seconds)
+        self._session: aiohttp.ClientSession | None = None
+        self.breaker = CircuitBreaker(self.name)
+        self.latency = LatencyTracker()
+        self.stats = {"requests": 0, "retries": 0, "hedged": 0, "failures": 0}
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """Сессия создается при первом использовании (внутри event loop)"""
+        return self.open()
+
+    def open(self) -> aiohttp.ClientSession:
+        """Создать сессию с пулом соединений, если ее еще нет"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=config.AI_KEEPALIVE_TIMEOUT,
+                ttl_dns_cache=config.AI_DNS_CACHE_TTL
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=self.timeout,
+                headers={"Content-Type": "application/json"}
+            )
+        return self._session
+
+    async def close(self):
+        """Закрыть сессию и все соединения пула"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def _payload(self, messages: list, max_tokens: int, stream: bool = False) -> dict:
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": 0.8  # Больше креативности
+        }
+        if stream:
+            payload["stream"] = True
+        return payload
+
+    def _headers(self) -> dict:
+        return {"Authorization": f"Bearer {self.api_key}"}
+
+    async def _post_once(self, messages: list, max_tokens: int) -> tuple[str, dict]:
+        """Один HTTP-запрос -> (текст, usage); ошибки поднимаются как AIRequestError"""
+        self.stats["requests"] += 1
+        started = time.monotonic()
+        try:
+            async with self.session.post(
+                self.api_url,
+                headers=self._headers(),
+                json=self._payload(messages, max_tokens)
+            ) as response:
+                if response.status != 200:
+                    raise await self._response_error(response)
+                data = await response.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise AIRequestError(f"{type(e).__name__}: {e}", retryable=True) from e
+
+        self.latency.add(time.monotonic() - started)
+        return data["choices"][0]["message"]["content"].strip(), data.get("usage") or {}
+
+    @staticmethod
+    async def _response_error(response: aiohttp.ClientResponse) -> AIRequestError:
+        error = await response.text()
+        return AIRequestError(
+            f"{response.status} - {error[:500]}",
+            retryable=response.status == 429 or response.status >= 500,
+            retry_after=parse_retry_after(response.headers.get("Retry-After"))
+        )
+
+    async def _attempt(self, messages: list, max_tokens: int) -> tuple[str, dict]:
+        """
+        Попытка с hedging: если ответа нет дольше p95 задержки,
+        отправляется второй такой же запрос, побеждает первый успешный
+        """
+        hedge_after = self.latency.percentile(0.95) if config.AI_HEDGE_ENABLED else None
+        first = asyncio.ensure_future(self._post_once(messages, max_tokens))
+        if hedge_after is None:
+            return await first
+
+        tasks = {first}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=max(hedge_after, config.AI_HEDGE_MIN_DELAY))
+            if not done:
+                self.stats["hedged"] += 1
+                tasks.add(asyncio.ensure_future(self._post_once(messages, max_tokens)))
+
+            error = None
+            pending = tasks
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def chat(
+        self,
+        messages: list,
+        max_tokens: int = 1000,
+        timeout: float | None = None,
+        usage: dict | None = None
+    ) -> str:
+        """
+        Запрос chat/completions; при ошибке возвращает пустую строку.
+        timeout - бюджет времени этого вызова (по умолчанию AI_TIMEOUT)
+        usage - сюда записывается расход токенов (prompt_tokens, completion_tokens)
+        """
+        if not self.breaker.allow():
+            return ""
+        trial = self.breaker.state == CircuitBreaker.HALF_OPEN
+        try:
+            return await self._chat(messages, max_tokens, timeout, usage)
+        finally:
+            if trial:
+                # Пробный запрос отменен (таймаут шлюза, сброс нагрузки) без
+                # вердикта - иначе breaker навсегда остался бы в half_open
+                self.breaker.release()
+
+    async def _chat(self, messages: list, max_tokens: int, timeout: float | None, usage: dict | None) -> str:
+        # Общий бюджет времени на все попытки, чтобы повторы не удлиняли ожидание
+        deadline = time.monotonic() + (timeout or self.timeout_seconds)
+        for attempt in range(1, config.AI_MAX_RETRIES + 2):
+            try:
+                result, response_usage = await asyncio.wait_for(
+                    self._attempt(messages, max_tokens),
+                    deadline - time.monotonic()
+                )
+            except asyncio.TimeoutError:
+                logger.error(f"{self.name} API timeout (попытка {attempt})")
+                self.breaker.record_failure()
+                break
+            except AIRequestError as e:
+                logger.error(f"{self.name} API Error (попытка {attempt}): {e}")
+                delay = backoff_delay(attempt, e.retry_after)
+                if not e.retryable:
+                    # Ошибка запроса, а не сервиса - breaker не трогаем
+                    self.breaker.release()
+                    break
+                if (attempt > config.AI_MAX_RETRIES
+                        or delay > config.AI_RETRY_AFTER_MAX
+                        or time.monotonic() + delay >= deadline):
+                    self.breaker.record_failure()
+                    break
+                self.stats["retries"] += 1
+                await asyncio.sleep(delay)
+            except Exception as e:
+                logger.error(f"{self.name} Exception: {e}")
+                self.breaker.release()
+                break
+            else:
+                self.breaker.record_success()
+                if usage is not None:
+                    usage.update(self._usage(messages, result, response_usage))
+                return result
+
+        self.stats["failures"] += 1
+        return ""
+
+    async def chat_stream(
+        self,
+        messages: list,
+        max_tokens: int = 1000,
+        timeout: float | None = None,
+        usage: dict | None = None
+    ):
+        """
+        Потоковый chat/completions (SSE, формат OpenAI): отдает фрагменты
+        текста по мере генерации. При ошибке поток просто заканчивается.
+        Повтор возможен только до первого полученного фрагмента.
+        """
+        if not self.breaker.allow():
+            return
+        trial = self.breaker.state == CircuitBreaker.HALF_OPEN
+        try:
+            async for delta in self._chat_stream(messages, max_tokens, timeout, usage):
+                yield delta
+        finally:
+            if trial:
+                # Потребитель бросил поток или его отменили до вердикта
+                self.breaker.release()
+
+    async def _chat_stream(self, messages: list, max_tokens: int, timeout: float | None, usage: dict | None):
+        request_timeout = aiohttp.ClientTimeout(total=timeout) if timeout else self.timeout
+        received = False
+        text = []
+        stream_usage = {}
+        for attempt in range(1, config.AI_MAX_RETRIES + 2):
+            self.stats["requests"] += 1
+            try:
+                async with self.session.post(
+                    self.api_url,
+                    headers=self._headers(),
+                    json=self._payload(messages, max_tokens, stream=True),
+                    timeout=request_timeout
+                ) as response:
+                    if response.status != 200:
+                        raise await self._response_error(response)
+
+                    # Каждое событие - строка "data: {...}", конец - "data: [DONE]"
+                    async for raw_line in response.content:
+                        line = raw_line.decode("utf-8").strip()
+                        if not line.startswith("data:"):
+                            continue
+                        data = line[5:].strip()
+                        if data == "[DONE]":
+                            break
+                        try:
+                            chunk = json.loads(data)
+                        except ValueError:
+                            continue
+                        # usage приходит в последнем событии (Groq - внутри x_groq)
+                        stream_usage = (
+                            chunk.get("usage")
+                            or chunk.get("x_groq", {}).get("usage")
+                            or stream_usage
+                        )
+                        choices = chunk.get("choices") or [{}]
+                        delta = choices[0].get("delta", {}).get("content")
+                        if delta:
+                            received = True
+                            text.append(delta)
+                            yield delta
+            except (AIRequestError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if received and usage is not None:
+                    usage.update(self._usage(messages, "".join(text), stream_usage))
+                logger.error(f"{self.name} stream error (попытка {attempt}): {e}")
+                retryable = getattr(e, "retryable", True)
+                delay = backoff_delay(attempt, getattr(e, "retry_after", None))
+                if not retryable:
+                    self.breaker.release()
+                    return
+                if received or attempt > config.AI_MAX_RETRIES or delay > config.AI_RETRY_AFTER_MAX:
+                    self.breaker.record_failure()
+                    self.stats["failures"] += 1
+                    return
+                self.stats["retries"] += 1
+                await asyncio.sleep(delay)
+            except Exception as e:
+                logger.error(f"{self.name} Exception: {e}")
+                self.breaker.release()
+                return
+            else:
+                self.breaker.record_success()
+                if usage is not None:
+                    usage.update(self._usage(messages, "".join(text), stream_usage))
+                return
+
+    @staticmethod
+    def _usage(messages: list, answer: str, reported: dict) -> dict:
+        """usage из ответа; если провайдер его не прислал - оценка по длине текста"""
+        if reported.get("prompt_tokens") is not None:
+            return {
+                "prompt_tokens": reported["prompt_tokens"],
+                "completion_tokens": reported.get("completion_tokens", 0),
+            }
+        return {
+            "prompt_tokens": estimate_tokens("".join(m["content"] for m in messages)),
+            "completion_tokens": estimate_tokens(answer),
+        }
+
+
+class GroqClient(OpenAICompatibleClient):
+    """Groq (быстрый и бесплатный) - OpenAI-совместимый API"""
+
+    name = "groq"
+
+    def __init__(
+        self,
+        api_url: str = GROQ_API_URL,
+        api_key: str | None = None,
+        model: str | None = None,
+        limit_per_host: int | None = None,
+        timeout: float | None = None
+    ):
+        super().__init__(
+            api_url=api_url,
+            api_key=config.GROQ_API_KEY if api_key is None else api_key,
+            model=model or config.GROQ_MODEL,
+            limit_per_host=limit_per_host,
+            timeout=timeout
+        )
+
+
+# Шаблоны локального провайдера по самочувствию после тренировки
+_FEELING_ADVICE = {
+    "easy": (
+        "Керемет! Жаттығу жеңіл болса, келесі жолы қайталау санын "
+        "немесе салмақты сәл көбейтіңіз."
+    ),
+    "normal": (
+        "Жақсы нәтиже! Осы қарқынды сақтаңыз, ұйқы мен демалысқа "
+        "көңіл бөліңіз."
+    ),
+    "hard": (
+        "Қиын болса да, сіз аяқтадыңыз - бұл үлкен жетістік! Келесі жолы "
+        "қарқынды сәл азайтып, техникаға назар аударыңыз."
+    ),
+}
+
+
+class LocalClient:
+    """
+    Локальный провайдер без сети: детерминированные ответы из шаблонов
+    (nutrition_kk.NUTRITION_TIPS, texts_kk). Нулевая задержка - для работы
+    без ключа и нагрузочного тестирования всего бота офлайн.
+    """
+
+    name = "local"
+    # Шаблоны без модели: например, краткое содержание диалога им не доверяем
+    is_local = True
+    # Шаблонные ответы не кладем в кэш, чтобы не вытеснять ответы модели
+    cacheable = False
+
+    def __init__(self):
+        self.stats = {"requests": 0, "retries": 0, "hedged": 0, "failures": 0}
+
+    def open(self):
+        return None
+
+    async def close(self):
+        pass
+
+    @staticmethod
+    def _pick(items: list, seed: str, count: int) -> list:
+        """Выбрать count элементов, одинаково для одинакового seed"""
+        start = int(hashlib.sha256(seed.encode()).hexdigest(), 16) % len(items)
+        return [items[(start + i) % len(items)] for i in range(min(count, len(items)))]
+
+    @staticmethod
+    def _goal(prompt: str) -> str:
+        return next((goal for goal in NUTRITION_TIPS if goal in GOALS and goal in prompt), "stay_fit")
+
+    def answer(self, messages: list) -> str:
+        """Ответ по последнему сообщению пользователя"""
+        prompt = messages[-1]["content"]
+        goal = self._goal(prompt)
+        tips = NUTRITION_TIPS[goal]
+
+        # Совет после тренировки: "Менің сезімім: easy|normal|hard"
+        if "сезімім:" in prompt:
+            feeling = prompt.split("сезімім:", 1)[1].split()[0]
+            label = WORKOUTS.get(f"feeling_{feeling}", "")
+            lines = [label, _FEELING_ADVICE.get(feeling, _FEELING_ADVICE["normal"])]
+            lines += self._pick(tips["tips"], prompt, 2)
+            return "\n\n".join(line for line in lines if line)
+
+        # План питания: заголовок, советы и пример меню по цели
+        if "тамақтану жоспары" in prompt:
+            return "\n".join([tips["title"], "", *tips["tips"], tips["meal_example"].rstrip()])
+
+        # Вопрос тренеру: общие советы по цели пользователя
+        return "\n".join([
+            f"🎯 {GOALS[goal]}",
+            "",
+            *self._pick(tips["tips"], prompt, 3),
+        ])
+
+    async def chat(
+        self,
+        messages: list,
+        max_tokens: int = 1000,
+        timeout: float | None = None,
+        usage: dict | None = None
+    ) -> str:
+        self.stats["requests"] += 1
+        return self.answer(messages)
+
+    async def chat_stream(
+        self,
+        messages: list,
+        max_tokens: int = 1000,
+        timeout: float | None = None,
+        usage: dict | None = None
+    ):
+        self.stats["requests"] += 1
+        for line in self.answer(messages).splitlines(keepends=True):
+            yield line
+
+
+def create_ai_client(provider: str | None = None):
+    """Создать клиент провайдера из config.AI_PROVIDER"""
+    provider = (provider or config.AI_PROVIDER).lower()
+    if provider == "auto":
+        provider = "groq" if config.GROQ_API_KEY else "local"
+
+    if provider == "groq":
+        return GroqClient()
+    if provider == "openai":
+        if not config.AI_API_URL:
+            raise ValueError("AI_PROVIDER=openai требует AI_API_URL")
+        return OpenAICompatibleClient()
+    if provider == "local":
+        return LocalClient()
+    raise ValueError(f"Неизвестный AI_PROVIDER: {provider}")
@@ -0,0 +1,117 @@
+"""
+Устойчивость вызовов AI: повтор с backoff, hedging и circuit breaker
+"""
+import logging
+import random
+import time
+from collections import deque
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+
+class AIRequestError(Exception):
+    """Ошибка запроса к AI; retryable - имеет смысл повторить (429, 5xx, сеть)"""
+
+    def __init__(self, message: str, retryable: bool = False, retry_after: float | None = None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Заголовок Retry-After в секундах (формат HTTP-даты не используется Groq)"""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        return None
+
+
+def backoff_delay(attempt: int, retry_after: float | None = None) -> float:
+    """
+    Пауза перед повтором attempt (с 1): full jitter от экспоненты,
+    но не меньше Retry-After, если сервер его прислал
+    """
+    delay = random.uniform(0, min(config.AI_BACKOFF_MAX, config.AI_BACKOFF_BASE * 2 ** (attempt - 1)))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+class LatencyTracker:
+    """Скользящее окно задержек успешных запросов для порога hedging"""
+
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        self._samples: deque[float] = deque(maxlen=size)
+        self.min_samples = min_samples
+
+    def add(self, latency: float):
+        self._samples.append(latency)
+
+    def percentile(self, q: float) -> float | None:
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+class CircuitBreaker:
+    """
+    closed -> (failure_threshold ошибок подряд) -> open
+    open -> (через cooldown) -> half_open: пропускается один пробный запрос
+    half_open -> успех -> closed, ошибка -> open
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int | None = None, cooldown: float | None = None):
+        self.name = name
+        self.failure_threshold = failure_threshold or config.AI_BREAKER_THRESHOLD
+        self.cooldown = cooldown or config.AI_BREAKER_COOLDOWN
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self.stats = {"opened": 0, "half_opened": 0, "closed": 0, "rejected": 0}
+
+    def _transition(self, state: str):
+        logger.warning(f"Circuit breaker {self.name}: {self.state} -> {state}")
+        self.state = state
+        self.stats[{self.OPEN: "opened", self.HALF_OPEN: "half_opened", self.CLOSED: "closed"}[state]] += 1
+
+    def allow(self) -> bool:
+        """Можно ли выполнить запрос сейчас"""
+        if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+            self._transition(self.HALF_OPEN)
+            self._trial_in_flight = False
+
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.HALF_OPEN and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+
+        self.stats["rejected"] += 1
+        return False
+
+    def record_success(self):
+        self._failures = 0
+        if self.state != self.CLOSED:
+            self._transition(self.CLOSED)
+
+    def record_failure(self):
+        self._failures += 1
+        if self.state == self.HALF_OPEN or (
+            self.state == self.CLOSED and self._failures >= self.failure_threshold
+        ):
+            self._opened_at = time.monotonic()
+            self._transition(self.OPEN)
+
+    def release(self):
+        """Запрос завершился без вердикта (например, 400) - снять пробный флаг"""
+        self._trial_in_flight = False
@@ -1,55 +1,212 @@
 """
-Сервис для работы с AI (Groq - быстрый и бесплатный)
+Сервис для работы с AI (провайдер выбирается в config.AI_PROVIDER)
 """
-import aiohttp
+import asyncio
+import hashlib
 import json
 import logging
 from config import config
+from services.ai_cache import get_ai_cache, make_cache_key
+from services.ai_memory import Conversation, get_conversation_store
+from services.ai_providers import OpenAICompatibleClient, LocalClient, create_ai_client
+from services.ai_usage import choose_max_tokens, get_token_ledger
+from texts_kk import AI
 
 logger = logging.getLogger(__name__)
 
-GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
-GROQ_MODEL = "llama-3.3-70b-versatile"  # Мощная модель с лучшей поддержкой казахского
+_client: OpenAICompatibleClient | LocalClient | None = None
 
 
-async def _call_groq(messages: list, max_tokens: int = 1000) -> str:
-    """Вызов Groq API"""
-    try:
-        async with aiohttp.ClientSession() as session:
-            headers = {
-                "Authorization": f"Bearer {config.GROQ_API_KEY}",
-                "Content-Type": "application/json"
-            }
-            
-            payload = {
-                "model": GROQ_MODEL,
-                "messages": messages,
-                "max_tokens": max_tokens,
-                "temperature": 0.8  # Больше креативности
-            }
-            
-            async with session.post(
-                GROQ_API_URL,
-                headers=headers,
-                json=payload,
-                timeout=aiohttp.ClientTimeout(total=30)
-            ) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    return data["choices"][0]["message"]["content"].strip()
-                else:
-                    error = await response.text()
-                    logger.error(f"Groq API Error: {response.status} - {error}")
-                    return ""
-    except Exception as e:
-        logger.error(f"Groq Exception: {e}")
-        return ""
+def get_ai_client() -> OpenAICompatibleClient | LocalClient:
+    """Общий клиент процесса (создается при первом обращении)"""
+    global _client
+    if _client is None:
+        _client = create_ai_client()
+        logger.info(f"AI провайдер: {_client.name}")
+    return _client
+
+
+async def start_ai_client() -> OpenAICompatibleClient | LocalClient:
+    """Создать общий клиент и открыть пул соединений (при запуске бота)"""
+    client = get_ai_client()
+    client.open()
+    return client
+
+
+async def close_ai_client():
+    """Закрыть общий клиент (при остановке бота)"""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+
+class AIGateway:
+    """
+    Шлюз к AI: не больше max_concurrency запросов одновременно и не больше
+    max_waiting в очереди ожидания. Когда очередь полна, запрос сразу
+    отклоняется (пустой ответ -> вызывающая функция вернет fallback-текст).
+    Одинаковые запросы, которые уже выполняются, не дублируются:
+    все ждущие получают ответ одного вызова.
+    """
+    
+    def __init__(self, max_concurrency: int | None = None, max_waiting: int | None = None):
+        self.max_concurrency = max_concurrency or config.AI_MAX_CONCURRENCY
+        self.max_waiting = config.AI_MAX_WAITING if max_waiting is None else max_waiting
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._waiting = 0
+        self._in_flight: dict[str, asyncio.Future] = {}
+        self.stats = {"calls": 0, "coalesced": 0, "shed": 0}
+    
+    @staticmethod
+    def _key(messages: list, max_tokens: int) -> str:
+        raw = json.dumps([messages, max_tokens], ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(raw.encode()).hexdigest()
+    
+    async def call(
+        self,
+        messages: list,
+        max_tokens: int = 1000,
+        timeout: float | None = None,
+        usage: dict | None = None
+    ) -> str:
+        """usage заполняется только у реально выполненного запроса (не у объединенных)"""
+        key = self._key(messages, max_tokens)
+        
+        # Такой же запрос уже выполняется - ждем его результат
+        leader = self._in_flight.get(key)
+        if leader is not None:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(leader)
+        
+        # Все слоты заняты и очередь полна - сбрасываем нагрузку
+        if self._semaphore.locked() and self._waiting >= self.max_waiting:
+            self.stats["shed"] += 1
+            logger.warning("AI gateway: очередь заполнена, запрос отклонен")
+            return ""
+        
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        result = ""
+        try:
+            self._waiting += 1
+            try:
+                await self._semaphore.acquire()
+            finally:
+                self._waiting -= 1
+            try:
+                self.stats["calls"] += 1
+                result = await get_ai_client().chat(messages, max_tokens, timeout, usage)
+            finally:
+                self._semaphore.release()
+            return result
+        finally:
+            # Ждущие получают результат (или "" при отмене/ошибке лидера)
+            del self._in_flight[key]
+            future.set_result(result)
+    
+    async def stream(
+        self,
+        messages: list,
+        max_tokens: int = 1000,
+        timeout: float | None = None,
+        usage: dict | None = None
+    ):
+        """Потоковый запрос под тем же лимитом параллельности (без объединения)"""
+        if self._semaphore.locked() and self._waiting >= self.max_waiting:
+            self.stats["shed"] += 1
+            logger.warning("AI gateway: очередь заполнена, запрос отклонен")
+            return
+        
+        self._waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+        try:
+            self.stats["calls"] += 1
+            async for chunk in get_ai_client().chat_stream(messages, max_tokens, timeout, usage):
+                yield chunk
+        finally:
+            self._semaphore.release()
+
+
+_gateway: AIGateway | None = None
+
+
+def get_ai_gateway() -> AIGateway:
+    """Общий шлюз процесса"""
+    global _gateway
+    if _gateway is None:
+        _gateway = AIGateway()
+    return _gateway
+
+
+# Шаблонные ответы для пользователей, исчерпавших дневную квоту
+_offline = LocalClient()
+
+
+def _over_quota_answer(messages: list, cache_key: str | None = None) -> str:
+    """Ответ без вызова модели: вариант из кэша или шаблонный офлайн-ответ"""
+    get_token_ledger().stats["degraded"] += 1
+    if cache_key:
+        cached = get_ai_cache().peek(cache_key)
+        if cached:
+            return cached
+    return f"{AI['quota_exceeded']}\n\n{_offline.answer(messages)}"
+
+
+async def _call_ai(
+    messages: list,
+    feature: str,
+    user_id: int | None = None,
+    max_tokens: int | None = None,
+    cache: bool = False,
+    timeout: float | None = None,
+    key_messages: list | None = None
+) -> str:
+    """
+    Вызов AI через шлюз (лимит параллельности, объединение запросов)
+    feature: advice | nutrition | trainer - для учета токенов и подбора max_tokens
+    user_id: чья дневная квота расходуется
+    cache: промпт детерминирован - ответ берется из/кладется в кэш ответов
+    timeout: бюджет времени вызова (по умолчанию AI_TIMEOUT)
+    key_messages: огрубленный промпт только для ключа кэша (модель получает messages)
+    """
+    ledger = get_token_ledger()
+    max_tokens = max_tokens or choose_max_tokens(feature)
+    cache = cache and get_ai_client().cacheable
+    key = make_cache_key(key_messages or messages, max_tokens) if cache else None
+    
+    if ledger.over_quota(user_id):
+        return _over_quota_answer(messages, key)
+    
+    if cache:
+        cached = get_ai_cache().get(key)
+        if cached:
+            return cached
+    
+    usage = {}
+    response = await get_ai_gateway().call(messages, max_tokens, timeout, usage)
+    if usage:
+        ledger.record(user_id, feature, usage)
+    if cache and response:
+        get_ai_cache().add(key, response)
+    return response
+
+
+def _bucket(value, step: int):
+    """Округлить значение до шага (вес/рост в ключе кэша -> меньше разных ключей)"""
+    if not value:
+        return value
+    return int(round(float(value) / step) * step)
 
 
 async def get_ai_advice(
     user_profile: dict,
     workout_title: str,
-    feeling: str
+    feeling: str,
+    user_id: int | None = None
 ) -> str:
     """Получить AI-совет после тренировки"""
     messages = [
@@ -69,17 +226,15 @@ async def get_ai_advice(
         }
     ]
     
-    response = await _call_groq(messages, max_tokens=800)
+    response = await _call_ai(
+        messages, "advice", user_id, cache=True, timeout=config.AI_ADVICE_TIMEOUT
+    )
     return response if response else "Тамаша жұмыс! Жалғастыра беріңіз! 💪🔥"
 
 
-async def get_nutrition_advice(user_profile: dict) -> str:
-    """Получить AI-совет по питанию"""
-    goal = user_profile.get('goal', 'белгісіз')
-    weight = user_profile.get('weight_kg', '')
-    height = user_profile.get('height_cm', '')
-    
-    messages = [
+def _nutrition_messages(goal, weight, height) -> list:
+    """Промпт для совета по питанию"""
+    return [
         {
             "role": "system",
             "content": (
@@ -100,17 +255,48 @@ async def get_nutrition_advice(user_profile: dict) -> str:
             )
         }
     ]
+
+
+async def get_nutrition_advice(user_profile: dict, user_id: int | None = None) -> str:
+    """Получить AI-совет по питанию"""
+    goal = user_profile.get('goal', 'белгісіз')
+    weight = user_profile.get('weight_kg', '')
+    height = user_profile.get('height_cm', '')
+    
+    # Модель получает точные вес и рост, округляются они только в ключе кэша
+    messages = _nutrition_messages(goal, weight, height)
+    key_messages = _nutrition_messages(
+        goal, _bucket(weight, config.AI_CACHE_WEIGHT_STEP), _bucket(height, 5)
+    )
     
-    response = await _call_groq(messages, max_tokens=1200)
+    response = await _call_ai(
+        messages, "nutrition", user_id, cache=True,
+        timeout=config.AI_NUTRITION_TIMEOUT, key_messages=key_messages
+    )
     return response if response else "Қазір кеңес алу мүмкін емес."
 
 
-async def ask_ai_trainer(question: str, user_profile: dict) -> str:
-    """Задать вопрос AI-тренеру"""
+def _trainer_messages(
+    question: str,
+    user_profile: dict,
+    conversation: Conversation | None = None
+) -> list:
+    """Промпт для вопроса AI-тренеру (с историей диалога, если она есть)"""
     goal = user_profile.get('goal', '')
     level = user_profile.get('level', '')
     
-    messages = [
+    history = []
+    if conversation is not None:
+        if conversation.summary:
+            history.append({
+                "role": "system",
+                "content": f"Алдыңғы әңгіменің қысқаша мазмұны: {conversation.summary}"
+            })
+        for previous_question, previous_answer in conversation.turns:
+            history.append({"role": "user", "content": previous_question})
+            history.append({"role": "assistant", "content": previous_answer})
+    
+    return [
         {
             "role": "system", 
             "content": (
@@ -120,6 +306,7 @@ async def ask_ai_trainer(question: str, user_profile: dict) -> str:
                 "Егер сұрақ жаттығу техникасы туралы болса - қадамдық нұсқаулық беріңіз."
             )
         },
+        *history,
         {
             "role": "user",
             "content": (
@@ -129,6 +316,102 @@ async def ask_ai_trainer(question: str, user_profile: dict) -> str:
             )
         }
     ]
+
+
+async def ask_ai_trainer(question: str, user_profile: dict, user_id: int | None = None) -> str:
+    """Задать вопрос AI-тренеру"""
+    messages = _trainer_messages(question, user_profile)
     
-    response = await _call_groq(messages, max_tokens=1000)
+    response = await _call_ai(
+        messages,
+        "trainer",
+        user_id,
+        max_tokens=choose_max_tokens("trainer", question),
+        timeout=config.AI_TRAINER_TIMEOUT
+    )
     return response if response else "Қазір жауап алу мүмкін емес."
+
+
+async def _summarize_conversation(user_id: int, summary: str, turns: list) -> str | None:
+    """Краткое содержание старой части диалога (None - свернуть без AI)"""
+    ledger = get_token_ledger()
+    # Шаблонный провайдер не умеет пересказывать - сворачиваем без AI
+    if get_ai_client().is_local or ledger.over_quota(user_id):
+        return None
+    
+    dialog = "\n".join(f"- {question}\n  {answer}" for question, answer in turns)
+    messages = [
+        {
+            "role": "system",
+            "content": (
+                "Әңгімені қазақ тілінде 3-4 сөйлеммен қысқаша түйіндеңіз: "
+                "пайдаланушының мақсаты, мәселелері және берілген негізгі кеңестер."
+            )
+        },
+        {
+            "role": "user",
+            "content": f"Бұрынғы түйін: {summary or '-'}\n\nӘңгіме:\n{dialog}"
+        }
+    ]
+    usage = {}
+    response = await get_ai_gateway().call(
+        messages, config.AI_MEMORY_SUMMARY_MAX_TOKENS, config.AI_TRAINER_TIMEOUT, usage
+    )
+    if usage:
+        ledger.record(user_id, "memory", usage)
+    return response or None
+
+
+# Фоновые сворачивания диалогов (ссылки, чтобы задачи не собрал GC)
+_summary_tasks: set[asyncio.Task] = set()
+
+
+async def stream_ai_trainer(
+    question: str,
+    user_profile: dict,
+    user_id: int | None = None,
+    remember: bool = False
+):
+    """
+    Задать вопрос AI-тренеру в потоковом режиме: отдает фрагменты ответа.
+    remember: вести диалог - в промпт идет история пользователя,
+    а вопрос и ответ сохраняются в память диалога
+    """
+    store = get_conversation_store() if remember and user_id else None
+    conversation = store.get(user_id) if store else None
+    messages = _trainer_messages(question, user_profile, conversation)
+    
+    ledger = get_token_ledger()
+    if ledger.over_quota(user_id):
+        yield _over_quota_answer(messages)
+        return
+    
+    answer = []
+    usage = {}
+    try:
+        async for chunk in get_ai_gateway().stream(
+            messages,
+            max_tokens=choose_max_tokens("trainer", question),
+            timeout=config.AI_TRAINER_TIMEOUT,
+            usage=usage
+        ):
+            answer.append(chunk)
+            yield chunk
+    finally:
+        if usage:
+            ledger.record(user_id, "trainer", usage)
+    
+    if not answer:
+        yield "Қазір жауап алу мүмкін емес."
+        return
+    
+    if store:
+        conversation = store.add_turn(user_id, question, "".join(answer))
+        if store.needs_summary(conversation):
+            task = asyncio.create_task(store.summarize(
+                user_id,
+                conversation,
+                lambda summary, turns: _summarize_conversation(user_id, summary, turns)
+            ))
+            _summary_tasks.add(task)
+            task.add_done_callback(_summary_tasks.discard)
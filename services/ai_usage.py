@@ -0,0 +1,271 @@
+"""
+Учет токенов AI: расход по пользователям и функциям, дневные квоты,
+подбор max_tokens и отчет по расходу.
+
+Счетчики копятся в памяти и периодически одним upsert сбрасываются
+в таблицу ai_token_usage (строка на день x пользователь x функция).
+Дни старше AI_USAGE_RETENTION_DAYS удаляются.
+"""
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import date, timedelta
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import config
+from db.models import AITokenUsage
+from db.session import async_session_maker
+
+logger = logging.getLogger(__name__)
+
+# Вопросы, на которые нужен развернутый ответ (техника, план, причины)
+_DETAILED_KEYWORDS = (
+    "қалай", "неге", "техника", "жоспар", "бағдарлама", "кесте",
+    "как", "почему", "техник", "план", "программ",
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """Грубая оценка токенов, когда провайдер не прислал usage"""
+    return max(1, len(text) // 3) if text else 0
+
+
+def choose_max_tokens(feature: str, question: str | None = None) -> int:
+    """
+    Лимит ответа для вызова. Для AI-тренера зависит от вопроса:
+    короткий простой вопрос - короткий ответ, вопрос о технике
+    или плане (или длинный вопрос) - полный лимит.
+    """
+    if feature == "advice":
+        return config.AI_MAX_TOKENS_ADVICE
+    if feature == "nutrition":
+        return config.AI_MAX_TOKENS_NUTRITION
+
+    cap = config.AI_MAX_TOKENS_TRAINER
+    if not question:
+        return cap
+    text = question.lower()
+    words = len(text.split())
+    if words > 25 or any(keyword in text for keyword in _DETAILED_KEYWORDS):
+        share = 1.0
+    elif words <= 6:
+        share = 0.4
+    else:
+        share = 0.7
+    return max(100, int(cap * share) // 50 * 50)
+
+
+class TokenLedger:
+    """Счетчики токенов за сегодня в памяти + отложенная запись в БД"""
+
+    def __init__(self, quota: int | None = None, flush_interval: float | None = None):
+        self.quota = config.AI_DAILY_TOKEN_QUOTA if quota is None else quota
+        self.flush_interval = flush_interval or config.AI_USAGE_FLUSH_INTERVAL
+        self._day = date.today()
+        self._user_tokens: dict[int, int] = defaultdict(int)
+        # (день, user_id, функция) -> [запросы, prompt, completion] еще не в БД
+        self._pending: dict[tuple, list[int]] = defaultdict(lambda: [0, 0, 0])
+        self._pruned_day: date | None = None
+        self._task: asyncio.Task | None = None
+        self.stats = {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "degraded": 0}
+
+    def _roll_day(self):
+        today = date.today()
+        if today != self._day:
+            self._day = today
+            self._user_tokens.clear()
+
+    def record(self, user_id: int | None, feature: str, usage: dict):
+        """Учесть один вызов; usage - поле usage ответа провайдера"""
+        self._roll_day()
+        prompt = usage.get("prompt_tokens", 0)
+        completion = usage.get("completion_tokens", 0)
+
+        row = self._pending[(self._day, user_id or 0, feature)]
+        row[0] += 1
+        row[1] += prompt
+        row[2] += completion
+
+        if user_id:
+            self._user_tokens[user_id] += prompt + completion
+        self.stats["requests"] += 1
+        self.stats["prompt_tokens"] += prompt
+        self.stats["completion_tokens"] += completion
+
+    def used_today(self, user_id: int) -> int:
+        self._roll_day()
+        return self._user_tokens.get(user_id, 0)
+
+    def over_quota(self, user_id: int | None) -> bool:
+        """Пользователь исчерпал дневную квоту"""
+        if not user_id or not self.quota:
+            return False
+        return self.used_today(user_id) >= self.quota
+
+    async def load(self, session: AsyncSession):
+        """Поднять расход за сегодня (после перезапуска квоты не обнуляются)"""
+        self._day = date.today()
+        result = await session.execute(
+            select(
+                AITokenUsage.user_id,
+                func.sum(AITokenUsage.prompt_tokens + AITokenUsage.completion_tokens)
+            )
+            .where(AITokenUsage.day == self._day, AITokenUsage.user_id != 0)
+            .group_by(AITokenUsage.user_id)
+        )
+        self._user_tokens = defaultdict(int, {user_id: total for user_id, total in result.all()})
+
+    async def flush(self, session: AsyncSession):
+        """Записать накопленные счетчики одним upsert и удалить старые дни"""
+        pending, self._pending = self._pending, defaultdict(lambda: [0, 0, 0])
+        try:
+            if pending:
+                await self._upsert(session, [
+                    {
+                        "day": day,
+                        "user_id": user_id,
+                        "feature": feature,
+                        "requests": counts[0],
+                        "prompt_tokens": counts[1],
+                        "completion_tokens": counts[2],
+                    }
+                    for (day, user_id, feature), counts in pending.items()
+                ])
+            if self._pruned_day != self._day:
+                await session.execute(
+                    delete(AITokenUsage).where(
+                        AITokenUsage.day < self._day - timedelta(days=config.AI_USAGE_RETENTION_DAYS)
+                    )
+                )
+            await session.commit()
+        except Exception:
+            # Не записалось - вернем счетчики, попробуем в следующий раз
+            for key, counts in pending.items():
+                row = self._pending[key]
+                for i, value in enumerate(counts):
+                    row[i] += value
+            raise
+        self._pruned_day = self._day
+
+    @staticmethod
+    async def _upsert(session: AsyncSession, rows: list[dict]):
+        dialect = session.bind.dialect.name
+        if dialect in ("sqlite", "postgresql"):
+            dialect_insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+            stmt = dialect_insert(AITokenUsage).values(rows)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[AITokenUsage.day, AITokenUsage.user_id, AITokenUsage.feature],
+                set_={
+                    "requests": AITokenUsage.requests + stmt.excluded.requests,
+                    "prompt_tokens": AITokenUsage.prompt_tokens + stmt.excluded.prompt_tokens,
+                    "completion_tokens": AITokenUsage.completion_tokens + stmt.excluded.completion_tokens,
+                }
+            )
+            await session.execute(stmt)
+            return
+
+        # Без ON CONFLICT: прибавляем к существующим строкам по одной
+        for row in rows:
+            existing = await session.get(
+                AITokenUsage, (row["day"], row["user_id"], row["feature"])
+            )
+            if existing is None:
+                session.add(AITokenUsage(**row))
+            else:
+                existing.requests += row["requests"]
+                existing.prompt_tokens += row["prompt_tokens"]
+                existing.completion_tokens += row["completion_tokens"]
+
+    async def start(self):
+        """Загрузить расход за сегодня и запустить периодическую запись"""
+        async with async_session_maker() as session:
+            await self.load(session)
+        self._task = asyncio.create_task(self._flush_loop(), name="ai-usage")
+
+    async def stop(self):
+        """Остановить запись и сохранить остаток"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self._flush_once()
+
+    async def _flush_once(self):
+        try:
+            async with async_session_maker() as session:
+                await self.flush(session)
+        except Exception as e:
+            logger.error(f"AI usage flush error: {e}")
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self._flush_once()
+
+
+_ledger: TokenLedger | None = None
+
+
+def get_token_ledger() -> TokenLedger:
+    """Общий учет токенов процесса"""
+    global _ledger
+    if _ledger is None:
+        _ledger = TokenLedger()
+    return _ledger
+
+
+async def get_token_usage_report(session: AsyncSession, days: int = 7, top: int = 10) -> dict:
+    """Расход токенов по функциям и самые активные пользователи за days дней"""
+    since = date.today() - timedelta(days=days - 1)
+    tokens = AITokenUsage.prompt_tokens + AITokenUsage.completion_tokens
+
+    by_feature = await session.execute(
+        select(
+            AITokenUsage.feature,
+            func.sum(AITokenUsage.requests),
+            func.sum(AITokenUsage.prompt_tokens),
+            func.sum(AITokenUsage.completion_tokens),
+        )
+        .where(AITokenUsage.day >= since)
+        .group_by(AITokenUsage.feature)
+        .order_by(func.sum(tokens).desc())
+    )
+    top_users = await session.execute(
+        select(AITokenUsage.user_id, func.sum(tokens))
+        .where(AITokenUsage.day >= since, AITokenUsage.user_id != 0)
+        .group_by(AITokenUsage.user_id)
+        .order_by(func.sum(tokens).desc())
+        .limit(top)
+    )
+    return {
+        "since": since,
+        "features": [
+            {"feature": feature, "requests": requests, "prompt_tokens": prompt, "completion_tokens": completion}
+            for feature, requests, prompt, completion in by_feature.all()
+        ],
+        "top_users": top_users.all(),
+    }
+
+
+def render_token_usage_report(report: dict) -> str:
+    """Текст отчета для оператора"""
+    lines = [f"Расход токенов AI с {report['since']:%d.%m.%Y}", ""]
+    total = sum(f["prompt_tokens"] + f["completion_tokens"] for f in report["features"])
+    for f in report["features"]:
+        tokens = f["prompt_tokens"] + f["completion_tokens"]
+        share = tokens / total * 100 if total else 0
+        per_request = tokens // f["requests"] if f["requests"] else 0
+        lines.append(
+            f"{f['feature']:<10} запросов {f['requests']:>7}  "
+            f"prompt {f['prompt_tokens']:>10}  completion {f['completion_tokens']:>10}  "
+            f"{share:5.1f}%  ~{per_request}/запрос"
+        )
+    lines.append(f"Всего токенов: {total}")
+
+    if report["top_users"]:
+        lines += ["", "Пользователи с наибольшим расходом:"]
+        lines += [f"  user_id={user_id}: {tokens}" for user_id, tokens in report["top_users"]]
+    return "\n".join(lines)
@@ -0,0 +1,268 @@
+"""
+Очередь исходящих сообщений с учетом лимитов Telegram.
+
+Telegram ограничивает рассылку примерно 30 сообщениями в секунду на бота
+и 1 сообщением в секунду на чат. Массовые отправки (напоминания, отчеты)
+идут через Outbox: приоритетная очередь + token bucket (общий и на чат),
+повтор после RetryAfter и учет результатов доставки по чатам.
+"""
+import asyncio
+import itertools
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramAPIError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты: меньше - раньше. Ответы пользователю идут вперед рассылок
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 10
+
+
+class TokenBucket:
+    """Token bucket: rate токенов в секунду, не больше capacity в запасе"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        """Забрать токен; вернуть, сколько секунд подождать до его появления"""
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+    def is_full(self) -> bool:
+        self._refill(time.monotonic())
+        return self.tokens >= self.capacity
+
+
+@dataclass
+class DeliveryResult:
+    """Результат последней доставки в чат"""
+    ok: bool
+    attempts: int
+    error: str | None = None
+    at: float = field(default_factory=time.time)
+
+
+@dataclass(order=True)
+class _Envelope:
+    priority: int
+    seq: int
+    chat_id: int = field(compare=False)
+    text: str = field(compare=False)
+    kwargs: dict = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+    attempts: int = field(default=0, compare=False)
+    chat_ready: bool = field(default=False, compare=False)
+
+
+class Outbox:
+    """
+    Приоритетная очередь исходящих сообщений с ограничением скорости.
+
+    Диспетчер сначала дожидается общего токена и только потом берет из
+    очереди сообщение с наивысшим приоритетом, поэтому ответ пользователю
+    обгоняет уже поставленную рассылку. Сообщение в "занятый" чат
+    откладывается таймером и не задерживает остальные чаты.
+    """
+
+    # Сколько бакетов чатов держать до очистки восстановившихся
+    MAX_CHAT_BUCKETS = 10000
+    # Сколько последних результатов доставки хранить (LRU по чатам)
+    MAX_RESULTS = 10000
+
+    def __init__(
+        self,
+        bot: Bot,
+        global_rate: float | None = None,
+        chat_rate: float | None = None,
+        chat_burst: int | None = None,
+        workers: int | None = None,
+        max_attempts: int = 3
+    ):
+        self.bot = bot
+        self.chat_rate = chat_rate or config.TELEGRAM_CHAT_RATE
+        self.chat_burst = chat_burst or config.TELEGRAM_CHAT_BURST
+        self.workers = workers or config.OUTBOX_WORKERS
+        self.max_attempts = max_attempts
+
+        rate = global_rate or config.TELEGRAM_GLOBAL_RATE
+        self._global = TokenBucket(rate, rate)
+        self._chats: dict[int, TokenBucket] = {}
+        self._paused_until = 0.0
+
+        self._queue: asyncio.PriorityQueue[_Envelope] = asyncio.PriorityQueue()
+        self._seq = itertools.count()
+        self._in_flight = asyncio.Semaphore(self.workers)
+        self._pending: set[asyncio.Future] = set()
+        self._deliveries: set[asyncio.Task] = set()
+        self._dispatcher: asyncio.Task | None = None
+
+        self.results: OrderedDict[int, DeliveryResult] = OrderedDict()
+        self.stats = {"sent": 0, "failed": 0, "retried": 0}
+
+    def start(self):
+        """Запустить диспетчер отправки"""
+        self._dispatcher = asyncio.create_task(self._dispatch(), name="outbox")
+
+    async def stop(self, drain: bool = True):
+        """Остановить диспетчер (по умолчанию дождавшись всех сообщений)"""
+        if drain and self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+        if self._dispatcher:
+            self._dispatcher.cancel()
+            await asyncio.gather(self._dispatcher, return_exceptions=True)
+            self._dispatcher = None
+
+    def enqueue(
+        self,
+        chat_id: int,
+        text: str,
+        priority: int = PRIORITY_BULK,
+        **kwargs
+    ) -> asyncio.Future:
+        """Поставить сообщение в очередь, не дожидаясь отправки"""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.add(future)
+        future.add_done_callback(self._pending.discard)
+        self._queue.put_nowait(
+            _Envelope(priority, next(self._seq), chat_id, text, kwargs, future)
+        )
+        return future
+
+    async def send(
+        self,
+        chat_id: int,
+        text: str,
+        priority: int = PRIORITY_INTERACTIVE,
+        **kwargs
+    ):
+        """
+        Отправить сообщение через очередь и дождаться результата.
+        Возвращает Message или None, если доставить не удалось.
+        """
+        return await self.enqueue(chat_id, text, priority, **kwargs)
+
+    def pending(self) -> int:
+        """Сколько сообщений еще не доставлено"""
+        return len(self._pending)
+
+    def _requeue(self, envelope: _Envelope, delay: float):
+        """Вернуть сообщение в очередь через delay секунд"""
+        asyncio.get_running_loop().call_later(delay, self._queue.put_nowait, envelope)
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self.MAX_CHAT_BUCKETS:
+                # Удаляем бакеты чатов, которые успели полностью восстановиться
+                self._chats = {
+                    cid: b for cid, b in self._chats.items() if not b.is_full()
+                }
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    async def _dispatch(self):
+        while True:
+            # Пауза после 429 и общий лимит - до выбора сообщения
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+            delay = self._global.reserve()
+            if delay:
+                await asyncio.sleep(delay)
+
+            envelope = await self._queue.get()
+            if envelope.future.done():
+                self._global.tokens += 1
+                continue
+
+            if not envelope.chat_ready:
+                delay = self._chat_bucket(envelope.chat_id).reserve()
+                envelope.chat_ready = True
+                if delay:
+                    # Чат исчерпал лимит: токен возвращаем, сообщение откладываем
+                    self._global.tokens += 1
+                    self._requeue(envelope, delay)
+                    continue
+
+            await self._in_flight.acquire()
+            task = asyncio.create_task(self._deliver(envelope))
+            self._deliveries.add(task)
+            task.add_done_callback(self._deliveries.discard)
+
+    async def _deliver(self, envelope: _Envelope):
+        """Отправить одно сообщение; при временной ошибке - вернуть в очередь"""
+        envelope.attempts += 1
+        envelope.chat_ready = False
+        try:
+            message = await self.bot.send_message(
+                envelope.chat_id, envelope.text, **envelope.kwargs
+            )
+        except TelegramRetryAfter as e:
+            # Flood control: приостанавливаем всю очередь на retry_after
+            self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+            logger.warning(f"Telegram RetryAfter {e.retry_after}с (чат {envelope.chat_id})")
+            self._retry_or_fail(envelope, str(e), e.retry_after)
+        except (TelegramNetworkError, TelegramServerError) as e:
+            self._retry_or_fail(envelope, str(e), 2 ** (envelope.attempts - 1))
+        except TelegramAPIError as e:
+            # Бот заблокирован, чат не найден и т.п. - повтор не поможет
+            self._fail(envelope, str(e))
+        except Exception as e:
+            # Неожиданная ошибка (неверные kwargs, ошибка клиента): future
+            # должен завершиться, иначе send() и stop(drain=True) зависнут
+            logger.error(f"Outbox delivery error (чат {envelope.chat_id}): {e!r}")
+            self._fail(envelope, repr(e))
+        else:
+            self.stats["sent"] += 1
+            self._record(envelope.chat_id, DeliveryResult(ok=True, attempts=envelope.attempts))
+            if not envelope.future.done():
+                envelope.future.set_result(message)
+        finally:
+            self._in_flight.release()
+
+    def _record(self, chat_id: int, result: DeliveryResult):
+        """Запомнить результат доставки; самые давние чаты вытесняются"""
+        self.results[chat_id] = result
+        self.results.move_to_end(chat_id)
+        while len(self.results) > self.MAX_RESULTS:
+            self.results.popitem(last=False)
+
+    def _retry_or_fail(self, envelope: _Envelope, error: str, delay: float):
+        if envelope.attempts >= self.max_attempts:
+            self._fail(envelope, error)
+            return
+        self.stats["retried"] += 1
+        self._requeue(envelope, delay)
+
+    def _fail(self, envelope: _Envelope, error: str):
+        self.stats["failed"] += 1
+        self._record(envelope.chat_id, DeliveryResult(
+            ok=False, attempts=envelope.attempts, error=error
+        ))
+        logger.warning(f"Сообщение в чат {envelope.chat_id} не доставлено: {error}")
+        if not envelope.future.done():
+            envelope.future.set_result(None)
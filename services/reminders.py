@@ -0,0 +1,104 @@
+"""
+Рассылки по расписанию (APScheduler): напоминания и недельные отчеты
+"""
+import asyncio
+import logging
+from datetime import datetime
+
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.cron import CronTrigger
+
+from config import config
+from db.session import async_session_maker
+from services.outbox import Outbox, PRIORITY_BULK
+from services.reports import (
+    WEEKDAYS,
+    get_reminder_recipients,
+    get_reminder_message,
+    send_weekly_reports,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class ReminderDispatcher:
+    """
+    Раз в минуту выбирает пользователей слота (HH:MM, день недели)
+    и ставит напоминания в очередь Outbox с низким приоритетом.
+
+    Тик только читает получателей и запускает рассылку фоновой задачей,
+    поэтому долгая рассылка одного слота не сдвигает следующий.
+    Раз в неделю на том же планировщике рассылаются недельные отчеты.
+    """
+
+    def __init__(self, outbox: Outbox):
+        self.outbox = outbox
+        self.scheduler = AsyncIOScheduler()
+        self._tasks: set[asyncio.Task] = set()
+
+    def start(self):
+        """Запустить планировщик (ровно в 00 секунд каждой минуты)"""
+        self.scheduler.add_job(
+            self.tick,
+            CronTrigger(second=0),
+            id="reminders",
+            max_instances=1,
+            coalesce=True,
+            misfire_grace_time=30
+        )
+        hour, minute = config.WEEKLY_REPORT_TIME.split(":")
+        self.scheduler.add_job(
+            self.weekly_reports,
+            CronTrigger(day_of_week=config.WEEKLY_REPORT_DAY, hour=int(hour), minute=int(minute)),
+            id="weekly_reports",
+            max_instances=1,
+            coalesce=True,
+            misfire_grace_time=3600
+        )
+        self.scheduler.start()
+        logger.info("Планировщик напоминаний запущен")
+
+    async def shutdown(self):
+        """Остановить планировщик и дождаться текущих рассылок"""
+        if self.scheduler.running:
+            self.scheduler.shutdown(wait=False)
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        logger.info("Планировщик напоминаний остановлен")
+
+    async def tick(self, now: datetime | None = None):
+        """Обработать один минутный слот"""
+        # Слот считается от начала минуты, даже если тик немного опоздал
+        slot = (now or datetime.now()).replace(second=0, microsecond=0)
+
+        async with async_session_maker() as session:
+            recipients = await get_reminder_recipients(
+                session,
+                slot.strftime("%H:%M"),
+                WEEKDAYS[slot.weekday()]
+            )
+
+        if not recipients:
+            return
+
+        task = asyncio.create_task(self._fan_out(slot, recipients))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _fan_out(self, slot: datetime, recipients: list):
+        """Разослать напоминания всем получателям слота"""
+        results = await asyncio.gather(*(
+            self.outbox.enqueue(
+                r.telegram_id,
+                get_reminder_message(r),
+                priority=PRIORITY_BULK
+            )
+            for r in recipients
+        ))
+        sent = sum(1 for message in results if message is not None)
+        logger.info(f"Напоминания {slot:%H:%M}: отправлено {sent}/{len(recipients)}")
+
+    async def weekly_reports(self):
+        """Разослать недельные отчеты всем активным пользователям"""
+        delivered = await send_weekly_reports(self.outbox)
+        logger.info(f"Недельные отчеты: доставлено {delivered}")
@@ -1,36 +1,50 @@
 """
 Сервис для отчетов и улучшенных напоминаний
 """
-from sqlalchemy import select, func
+import asyncio
+from sqlalchemy import select, func, or_, cast, case, String
 from sqlalchemy.ext.asyncio import AsyncSession
 from db.models import User, UserWorkout
-from datetime import date, timedelta
+from db.session import async_session_maker
+from services.outbox import Outbox, PRIORITY_BULK
+from datetime import date, datetime, timedelta
+
+# Ключи дней недели, как в get_days_selection_keyboard (не зависят от локали)
+WEEKDAYS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+
+
+def _weekly_counts(week_start: date):
+    """Условные COUNT за эту и прошлую неделю (для одного или всех пользователей)"""
+    return (
+        func.count(case((UserWorkout.date >= week_start, UserWorkout.id))).label("this_week"),
+        func.count(case((UserWorkout.date < week_start, UserWorkout.id))).label("last_week"),
+    )
 
 
 async def generate_weekly_report(session: AsyncSession, user: User) -> str:
     """Генерировать недельный отчет для пользователя"""
-    
-    # Статистика за эту неделю
     week_start = date.today() - timedelta(days=7)
-    result = await session.execute(
-        select(func.count(UserWorkout.id)).where(
-            UserWorkout.user_id == user.id,
-            UserWorkout.date >= week_start
-        )
-    )
-    this_week = result.scalar() or 0
-    
-    # Статистика за прошлую неделю
     prev_week_start = week_start - timedelta(days=7)
+    
+    # Эта и прошлая неделя одним запросом
     result = await session.execute(
-        select(func.count(UserWorkout.id)).where(
+        select(*_weekly_counts(week_start)).where(
             UserWorkout.user_id == user.id,
-            UserWorkout.date >= prev_week_start,
-            UserWorkout.date < week_start
+            UserWorkout.date >= prev_week_start
         )
     )
-    last_week = result.scalar() or 0
+    this_week, last_week = result.one()
     
+    return render_weekly_report(
+        this_week or 0,
+        last_week or 0,
+        user.current_streak or 0,
+        user.best_streak or 0
+    )
+
+
+def render_weekly_report(this_week: int, last_week: int, streak: int, best_streak: int) -> str:
+    """Сформировать текст недельного отчета"""
     # Сравнение
     if this_week > last_week:
         comparison = f"📈 Өткен аптадан +{this_week - last_week} жаттығу көп!"
@@ -40,7 +54,6 @@ async def generate_weekly_report(session: AsyncSession, user: User) -> str:
         comparison = "📊 Өткен аптамен бірдей"
     
     # Streak info
-    streak = user.current_streak or 0
     fire = "🔥" * min(streak, 5) if streak > 0 else ""
     
     # Прогресс бар
@@ -59,7 +72,7 @@ async def generate_weekly_report(session: AsyncSession, user: User) -> str:
 {comparison}
 
 {fire} Серия: *{streak} күн*
-🏆 Рекорд: {user.best_streak or 0} күн
+🏆 Рекорд: {best_streak} күн
 
 💪 Келесі апта да жалғастыр!
 """
@@ -67,6 +80,75 @@ async def generate_weekly_report(session: AsyncSession, user: User) -> str:
     return report
 
 
+async def get_weekly_report_batch(
+    session: AsyncSession,
+    after_user_id: int = 0,
+    limit: int = 500
+) -> list:
+    """
+    Одна страница данных для недельных отчетов (keyset по users.id).
+    Активные пользователи - те, у кого есть тренировки за последние 2 недели.
+    Возвращает строки (id, telegram_id, current_streak, best_streak, this_week, last_week).
+    """
+    week_start = date.today() - timedelta(days=7)
+    prev_week_start = week_start - timedelta(days=7)
+    
+    result = await session.execute(
+        select(
+            User.id,
+            User.telegram_id,
+            User.current_streak,
+            User.best_streak,
+            *_weekly_counts(week_start)
+        )
+        .join(
+            UserWorkout,
+            (UserWorkout.user_id == User.id) & (UserWorkout.date >= prev_week_start)
+        )
+        .where(User.id > after_user_id)
+        .group_by(User.id)
+        .order_by(User.id)
+        .limit(limit)
+    )
+    return list(result.all())
+
+
+async def send_weekly_reports(outbox: Outbox, batch_size: int = 500) -> int:
+    """
+    Разослать недельные отчеты всем активным пользователям.
+    Пользователи читаются страницами (keyset), каждая страница в своей
+    короткой сессии и отправляется через Outbox до чтения следующей,
+    поэтому память не растет с числом пользователей.
+    Возвращает количество доставленных отчетов.
+    """
+    delivered = 0
+    last_id = 0
+    while True:
+        async with async_session_maker() as session:
+            rows = await get_weekly_report_batch(session, last_id, batch_size)
+        if not rows:
+            break
+        last_id = rows[-1].id
+        
+        results = await asyncio.gather(*(
+            outbox.enqueue(
+                row.telegram_id,
+                render_weekly_report(
+                    row.this_week,
+                    row.last_week,
+                    row.current_streak or 0,
+                    row.best_streak or 0
+                ),
+                priority=PRIORITY_BULK,
+                parse_mode="Markdown"
+            )
+            for row in rows
+        ))
+        delivered += sum(1 for message in results if message is not None)
+    
+    return delivered
+
+
 def get_reminder_message(user: User) -> str:
     """Получить контекстное сообщение напоминания"""
     
@@ -111,28 +193,48 @@ def get_reminder_message(user: User) -> str:
     return message
 
 
-async def get_users_for_reminder(session: AsyncSession) -> list[User]:
+def _reminder_slot_filter(reminder_time: str, weekday: str):
+    """
+    Условие выборки для минутного слота: индекс ix_users_reminder_slot
+    сужает до reminder_time, день недели проверяется в SQL по JSON-тексту.
+    """
+    days_text = cast(User.reminder_days, String)
+    return (
+        User.reminder_time == reminder_time,
+        User.reminder_enabled == True,
+        or_(
+            # Если дни не выбраны - напоминаем каждый день
+            User.reminder_days.is_(None),
+            days_text.in_(("null", "[]")),
+            days_text.like(f'%"{weekday}"%')
+        )
+    )
+
+
+async def get_reminder_recipients(
+    session: AsyncSession,
+    reminder_time: str,
+    weekday: str
+) -> list:
+    """
+    Получить получателей напоминания для слота (reminder_time, weekday).
+    Возвращает легкие строки (telegram_id, current_streak, goal),
+    которых достаточно для get_reminder_message.
+    """
+    result = await session.execute(
+        select(User.telegram_id, User.current_streak, User.goal)
+        .where(*_reminder_slot_filter(reminder_time, weekday))
+    )
+    return list(result.all())
+
+
+async def get_users_for_reminder(session: AsyncSession, now: datetime | None = None) -> list[User]:
     """Получить пользователей для напоминания в текущее время"""
-    from datetime import datetime
-    
-    current_time = datetime.now().strftime("%H:%M")
-    current_day = datetime.now().strftime("%A").lower()
+    now = now or datetime.now()
     
     result = await session.execute(
         select(User).where(
-            User.reminder_enabled == True,
-            User.reminder_time == current_time
+            *_reminder_slot_filter(now.strftime("%H:%M"), WEEKDAYS[now.weekday()])
         )
     )
-    
-    users = []
-    for user in result.scalars():
-        # Проверяем день недели
-        if user.reminder_days:
-            if current_day in user.reminder_days:
-                users.append(user)
-        else:
-            # Если дни не выбраны - напоминаем каждый день
-            users.append(user)
-    
-    return users
+    return list(result.scalars().all())
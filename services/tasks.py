@@ -0,0 +1,78 @@
+"""
+Фоновая очередь задач с ограниченным числом воркеров.
+
+Медленная работа (например, генерация AI-совета) выполняется вне
+обработчика апдейта: обработчик сразу отвечает пользователю, а результат
+приходит отдельным сообщением. При остановке бота очередь дорабатывает,
+но не дольше BACKGROUND_DRAIN_TIMEOUT секунд.
+"""
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+
+class TaskQueue:
+    """Ограниченная очередь корутин с фиксированным числом воркеров"""
+
+    def __init__(self, workers: int | None = None, max_size: int | None = None):
+        self.workers = workers or config.BACKGROUND_WORKERS
+        self._queue: asyncio.Queue[Callable[[], Awaitable]] = asyncio.Queue(
+            max_size or config.BACKGROUND_QUEUE_SIZE
+        )
+        self._tasks: list[asyncio.Task] = []
+        self._running = 0
+        self.stats = {"done": 0, "failed": 0, "rejected": 0}
+
+    def start(self):
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"tasks-{i}")
+            for i in range(self.workers)
+        ]
+
+    async def stop(self, drain: bool = True, timeout: float | None = None):
+        """
+        Остановить воркеры, по умолчанию дождавшись всех задач, но не дольше
+        timeout (BACKGROUND_DRAIN_TIMEOUT) секунд - зависшая задача не должна
+        блокировать остановку бота.
+        """
+        if drain:
+            timeout = config.BACKGROUND_DRAIN_TIMEOUT if timeout is None else timeout
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        dropped = self._queue.qsize() + self._running
+        if dropped:
+            logger.warning(f"Фоновая очередь остановлена, отменено задач: {dropped}")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, job: Callable[[], Awaitable]) -> bool:
+        """Поставить задачу; False - очередь переполнена"""
+        try:
+            self._queue.put_nowait(job)
+            return True
+        except asyncio.QueueFull:
+            self.stats["rejected"] += 1
+            logger.warning("Фоновая очередь переполнена, задача отклонена")
+            return False
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            self._running += 1
+            try:
+                await job()
+                self.stats["done"] += 1
+            except Exception as e:
+                self.stats["failed"] += 1
+                logger.error(f"Фоновая задача завершилась ошибкой: {e}")
+            finally:
+                self._running -= 1
+                self._queue.task_done()
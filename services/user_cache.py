@@ -0,0 +1,150 @@
+"""
+Кэш профилей пользователей.
+
+Профиль - неизменяемый снимок строки users (UserProfile), безопасный для
+использования после закрытия сессии. Кэш ограничен по размеру (LRU)
+и времени жизни записи; функции services.users и update_streak после
+записи кладут в кэш свежий снимок (write-through).
+"""
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date
+from typing import Any, Awaitable, Callable, Dict
+
+from config import config
+from db.models import User
+from db.session import read_session_maker
+
+
+@dataclass(frozen=True)
+class UserProfile:
+    """Снимок профиля пользователя"""
+    id: int
+    telegram_id: int
+    gender: str | None
+    age: int | None
+    height_cm: int | None
+    weight_kg: float | None
+    goal: str | None
+    level: str | None
+    workout_type: str | None
+    reminder_enabled: bool
+    reminder_time: str | None
+    reminder_days: tuple[str, ...]
+    current_streak: int
+    best_streak: int
+    last_workout_date: date | None
+
+    @classmethod
+    def from_model(cls, user: User) -> "UserProfile":
+        return cls(
+            id=user.id,
+            telegram_id=user.telegram_id,
+            gender=user.gender,
+            age=user.age,
+            height_cm=user.height_cm,
+            weight_kg=user.weight_kg,
+            goal=user.goal,
+            level=user.level,
+            workout_type=user.workout_type,
+            reminder_enabled=bool(user.reminder_enabled),
+            reminder_time=user.reminder_time,
+            reminder_days=tuple(user.reminder_days or ()),
+            current_streak=user.current_streak or 0,
+            best_streak=user.best_streak or 0,
+            last_workout_date=user.last_workout_date,
+        )
+
+
+_MISSING = object()
+
+
+class UserProfileCache:
+    """
+    TTL/LRU-кэш telegram_id -> UserProfile | None.
+    None тоже кэшируется: незарегистрированный пользователь проходит
+    онбординг, и create_user сразу заменит запись.
+    """
+
+    def __init__(self, max_entries: int | None = None, ttl: float | None = None):
+        self.max_entries = max_entries or config.USER_CACHE_SIZE
+        self.ttl = config.USER_CACHE_TTL if ttl is None else ttl
+        self._entries: OrderedDict[int, tuple[UserProfile | None, float]] = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "updates": 0, "evictions": 0}
+
+    def get(self, telegram_id: int):
+        """Профиль, None (пользователя нет) или _MISSING (нет в кэше)"""
+        entry = self._entries.get(telegram_id)
+        if entry is None or entry[1] < time.monotonic():
+            self.stats["misses"] += 1
+            return _MISSING
+        self._entries.move_to_end(telegram_id)
+        self.stats["hits"] += 1
+        return entry[0]
+
+    def put(self, telegram_id: int, profile: UserProfile | None):
+        self._entries[telegram_id] = (profile, time.monotonic() + self.ttl)
+        self._entries.move_to_end(telegram_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def update(self, user: User):
+        """Запись после изменения пользователя в БД"""
+        self.stats["updates"] += 1
+        self.put(user.telegram_id, UserProfile.from_model(user))
+
+    def invalidate(self, telegram_id: int):
+        self._entries.pop(telegram_id, None)
+
+    def hit_rate(self) -> float:
+        total = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / total if total else 0.0
+
+
+_cache: UserProfileCache | None = None
+
+
+def get_user_profile_cache() -> UserProfileCache:
+    """Общий кэш профилей процесса"""
+    global _cache
+    if _cache is None:
+        _cache = UserProfileCache()
+    return _cache
+
+
+async def get_user_profile(session_maker, telegram_id: int) -> UserProfile | None:
+    """
+    Профиль из кэша; при промахе - один запрос к БД.
+    session_maker вызывается только при промахе, чтобы не брать соединение зря.
+    """
+    from services.users import get_user_by_telegram_id
+
+    cache = get_user_profile_cache()
+    profile = cache.get(telegram_id)
+    if profile is not _MISSING:
+        return profile
+
+    async with session_maker() as session:
+        user = await get_user_by_telegram_id(session, telegram_id)
+    profile = UserProfile.from_model(user) if user else None
+    cache.put(telegram_id, profile)
+    return profile
+
+
+async def user_profile_middleware(
+    handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]],
+    event: Any,
+    data: Dict[str, Any]
+) -> Any:
+    """
+    Outer middleware апдейта: профиль отправителя загружается один раз
+    и передается обработчикам аргументом user (UserProfile или None).
+    Промах читается из пула только для чтения (DB_WRITE_MODE=queue), чтобы
+    не занимать соединения основного движка, на котором пишет db.writer.
+    """
+    from_user = data.get("event_from_user")
+    if from_user is not None:
+        data["user"] = await get_user_profile(read_session_maker(), from_user.id)
+    return await handler(event, data)
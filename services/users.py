@@ -4,6 +4,8 @@
 from sqlalchemy import select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from db.models import User
+from db.session import after_commit, commit
+from services.user_cache import get_user_profile_cache
 from datetime import datetime
 
 
@@ -28,8 +30,9 @@ async def create_user(session: AsyncSession, telegram_id: int, user_data: dict)
         workout_type=user_data.get("workout_type"),
     )
     session.add(user)
-    await session.commit()
+    await commit(session)
     await session.refresh(user)
+    after_commit(session, lambda: get_user_profile_cache().update(user))
     return user
 
 
@@ -45,8 +48,9 @@ async def update_user(session: AsyncSession, telegram_id: int, user_data: dict)
             setattr(user, key, value)
     
     user.updated_at = datetime.utcnow()
-    await session.commit()
+    await commit(session)
     await session.refresh(user)
+    after_commit(session, lambda: get_user_profile_cache().update(user))
     return user
 
 
@@ -69,8 +73,9 @@ async def update_reminder_settings(
         user.reminder_days = days
     
     user.updated_at = datetime.utcnow()
-    await session.commit()
+    await commit(session)
     await session.refresh(user)
+    after_commit(session, lambda: get_user_profile_cache().update(user))
     return user
 
 
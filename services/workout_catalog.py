@@ -0,0 +1,171 @@
+"""
+Каталог шаблонов тренировок в памяти процесса.
+
+Все строки Workout загружаются одним запросом, а ответ fallback-логики
+(goal -> workout_type -> level -> любой день) заранее вычисляется для каждой
+комбинации (level, workout_type, goal, day_index). После загрузки подбор
+тренировки не делает ни одного запроса к БД.
+"""
+import asyncio
+import time
+from dataclasses import dataclass
+from itertools import product
+from types import MappingProxyType
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import config
+from db.models import Workout
+
+
+@dataclass(frozen=True, slots=True)
+class WorkoutTemplate:
+    """
+    Неизменяемая копия шаблона тренировки (не привязана к сессии).
+    Упражнения - кортеж read-only словарей: шаблон общий для всех апдейтов,
+    и изменение в одном обработчике не должно попасть в ответы другим.
+    """
+    id: int
+    code: str
+    title: str
+    level: str
+    workout_type: str
+    goal: str
+    day_index: int
+    exercises_json: tuple
+
+    @classmethod
+    def from_model(cls, workout: Workout) -> "WorkoutTemplate":
+        return cls(
+            id=workout.id,
+            code=workout.code,
+            title=workout.title,
+            level=workout.level,
+            workout_type=workout.workout_type,
+            goal=workout.goal,
+            day_index=workout.day_index,
+            exercises_json=tuple(
+                MappingProxyType(dict(exercise)) for exercise in workout.exercises_json or ()
+            ),
+        )
+
+
+class WorkoutCatalog:
+    """Скомпилированный каталог с O(1) разрешением fallback"""
+
+    def __init__(self, templates: list[WorkoutTemplate]):
+        # Сортируем по id, чтобы fallback был детерминированным
+        # (раньше LIMIT 1 без ORDER BY возвращал произвольную строку)
+        templates = sorted(templates, key=lambda t: t.id)
+        self.templates = tuple(templates)
+        self.by_id = {t.id: t for t in templates}
+
+        # Уровни fallback: первый попавшийся шаблон побеждает
+        self._exact: dict[tuple, WorkoutTemplate] = {}
+        self._by_type: dict[tuple, WorkoutTemplate] = {}
+        self._by_level: dict[tuple, WorkoutTemplate] = {}
+        self._by_day: dict[int, WorkoutTemplate] = {}
+        for t in templates:
+            self._exact.setdefault((t.level, t.workout_type, t.goal, t.day_index), t)
+            self._by_type.setdefault((t.level, t.workout_type, t.day_index), t)
+            self._by_level.setdefault((t.level, t.day_index), t)
+            self._by_day.setdefault(t.day_index, t)
+
+        # Готовые ответы для всех известных комбинаций
+        levels = {t.level for t in templates}
+        workout_types = {t.workout_type for t in templates}
+        goals = {t.goal for t in templates}
+        self._resolved: dict[tuple, WorkoutTemplate | None] = {
+            key: self._fallback(*key)
+            for key in product(levels, workout_types, goals, range(7))
+        }
+
+        self.loaded_at = time.monotonic()
+
+    def _fallback(
+        self,
+        level: str | None,
+        workout_type: str | None,
+        goal: str | None,
+        day_index: int
+    ) -> WorkoutTemplate | None:
+        """Четыре уровня fallback, как в исходных SQL-запросах"""
+        return (
+            self._exact.get((level, workout_type, goal, day_index))
+            or self._by_type.get((level, workout_type, day_index))
+            or self._by_level.get((level, day_index))
+            or self._by_day.get(day_index)
+        )
+
+    def resolve(
+        self,
+        level: str | None,
+        workout_type: str | None,
+        goal: str | None,
+        day_index: int
+    ) -> WorkoutTemplate | None:
+        """Получить тренировку на день с учетом fallback"""
+        key = (level, workout_type, goal, day_index)
+        try:
+            return self._resolved[key]
+        except KeyError:
+            # Профиль с неизвестными значениями (например, пустой goal)
+            return self._fallback(*key)
+
+    def week_plan(
+        self,
+        level: str | None,
+        workout_type: str | None,
+        goal: str | None
+    ) -> tuple[WorkoutTemplate | None, ...]:
+        """План на неделю: 7 элементов, индекс = day_index, None - день отдыха"""
+        return tuple(
+            self.resolve(level, workout_type, goal, day_index)
+            for day_index in range(7)
+        )
+
+    def is_stale(self) -> bool:
+        """Истек ли TTL (шаблоны могли добавить из другого процесса)"""
+        ttl = config.WORKOUT_CATALOG_TTL
+        return ttl > 0 and time.monotonic() - self.loaded_at > ttl
+
+
+_catalog: WorkoutCatalog | None = None
+_catalog_lock = asyncio.Lock()
+
+
+async def load_workout_catalog(session: AsyncSession) -> WorkoutCatalog:
+    """Загрузить все шаблоны одним запросом и установить каталог"""
+    global _catalog
+    result = await session.execute(select(Workout))
+    _catalog = WorkoutCatalog(
+        [WorkoutTemplate.from_model(w) for w in result.scalars()]
+    )
+    return _catalog
+
+
+async def get_workout_catalog(session: AsyncSession) -> WorkoutCatalog:
+    """Получить каталог, загрузив его при первом обращении или по TTL"""
+    catalog = _catalog
+    if catalog is not None and not catalog.is_stale():
+        return catalog
+
+    async with _catalog_lock:
+        # Пока ждали блокировку, каталог мог загрузить другой обработчик
+        if _catalog is not None and not _catalog.is_stale():
+            return _catalog
+        return await load_workout_catalog(session)
+
+
+def invalidate_workout_catalog():
+    """Сбросить каталог (перезагрузится при следующем обращении)"""
+    global _catalog
+    _catalog = None
+
+
+def catalog_reload_notice() -> str:
+    """Когда запущенный бот увидит шаблоны, загруженные отдельным скриптом"""
+    if config.WORKOUT_CATALOG_TTL > 0:
+        return f"🔄 Бот подхватит изменения в течение {config.WORKOUT_CATALOG_TTL} сек"
+    return "🔄 WORKOUT_CATALOG_TTL=0: перезапустите бота, чтобы подхватить изменения"
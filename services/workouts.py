@@ -1,9 +1,14 @@
 """
 Сервис для работы с тренировками
 """
-from sqlalchemy import select, func, and_
+from dataclasses import dataclass
+from sqlalchemy import select, func, and_, case
 from sqlalchemy.ext.asyncio import AsyncSession
 from db.models import Workout, UserWorkout, User
+from db.session import commit, transaction
+from services.achievements import AchievementDef, update_streak, check_and_award_achievements
+from services.user_cache import UserProfile
+from services.workout_catalog import WorkoutTemplate, get_workout_catalog, invalidate_workout_catalog
 from datetime import datetime, date, timedelta
 import json
 
@@ -12,7 +17,7 @@ async def get_workout_for_user(
     session: AsyncSession, 
     user: User, 
     day_index: int
-) -> Workout | None:
+) -> WorkoutTemplate | None:
     """
     Получить тренировку для пользователя на конкретный день
     day_index: 0-6 (понедельник-воскресенье)
@@ -22,54 +27,25 @@ async def get_workout_for_user(
     2. Если нет - по level + workout_type + day_index
     3. Если нет - по level + day_index
     4. Если нет - любая тренировка на этот день
-    """
-    # 1. Точное совпадение
-    result = await session.execute(
-        select(Workout).where(
-            and_(
-                Workout.level == user.level,
-                Workout.workout_type == user.workout_type,
-                Workout.goal == user.goal,
-                Workout.day_index == day_index
-            )
-        )
-    )
-    workout = result.scalar_one_or_none()
-    if workout:
-        return workout
-    
-    # 2. Без учета goal
-    result = await session.execute(
-        select(Workout).where(
-            and_(
-                Workout.level == user.level,
-                Workout.workout_type == user.workout_type,
-                Workout.day_index == day_index
-            )
-        )
-    )
-    workout = result.scalar_one_or_none()
-    if workout:
-        return workout
     
-    # 3. Только level + day
-    result = await session.execute(
-        select(Workout).where(
-            and_(
-                Workout.level == user.level,
-                Workout.day_index == day_index
-            )
-        ).limit(1)
-    )
-    workout = result.scalar_one_or_none()
-    if workout:
-        return workout
-    
-    # 4. Любая тренировка на этот день
-    result = await session.execute(
-        select(Workout).where(Workout.day_index == day_index).limit(1)
-    )
-    return result.scalar_one_or_none()
+    Ответ берется из каталога в памяти (services.workout_catalog),
+    запрос к БД выполняется только при первой загрузке каталога.
+    """
+    catalog = await get_workout_catalog(session)
+    return catalog.resolve(user.level, user.workout_type, user.goal, day_index)
+
+
+async def get_week_plan_for_user(
+    session: AsyncSession,
+    user: User
+) -> tuple[WorkoutTemplate | None, ...]:
+    """
+    Получить план пользователя на всю неделю за один вызов
+    Возвращает 7 элементов (понедельник-воскресенье) с учетом fallback,
+    None - день отдыха. Записи неизменяемые и не требуют открытой сессии.
+    """
+    catalog = await get_workout_catalog(session)
+    return catalog.week_plan(user.level, user.workout_type, user.goal)
 
 
 async def mark_workout_completed(
@@ -89,21 +65,106 @@ async def mark_workout_completed(
         comment=comment
     )
     session.add(user_workout)
-    await session.commit()
+    await commit(session)
     await session.refresh(user_workout)
     return user_workout
 
 
-async def get_user_workout_stats(session: AsyncSession, user_id: int, days: int = 30) -> dict:
+@dataclass(frozen=True, slots=True)
+class WorkoutCompletion:
+    """Результат complete_workout_transaction (не требует открытой сессии)"""
+    user_workout_id: int
+    workout_title: str
+    profile: UserProfile
+    streak: dict
+    new_achievements: tuple[AchievementDef, ...]
+
+
+async def complete_workout_transaction(
+    session: AsyncSession,
+    user_id: int,
+    workout_id: int,
+    feeling: str | None = None
+) -> WorkoutCompletion | None:
+    """
+    Завершение тренировки одной транзакцией: запись тренировки, streak,
+    достижения и название тренировки - с одним commit в конце.
+    Название берется из каталога в памяти, без отдельного запроса.
+    None - пользователь не найден.
+    """
+    async with transaction(session):
+        user = await session.get(User, user_id)
+        if user is None:
+            return None
+        
+        user_workout = UserWorkout(
+            user_id=user_id,
+            workout_id=workout_id,
+            date=date.today(),
+            completed=True,
+            feeling=feeling
+        )
+        session.add(user_workout)
+        
+        # Внутри transaction сервисы не фиксируют, а только отправляют изменения
+        streak_info = await update_streak(session, user)
+        new_achievements = await check_and_award_achievements(session, user)
+        
+        catalog = await get_workout_catalog(session)
+        template = catalog.by_id.get(workout_id)
+        if template is None:
+            workout = await session.get(Workout, workout_id)
+            workout_title = workout.title if workout else "Жаттығу"
+        else:
+            workout_title = template.title
+    
+    return WorkoutCompletion(
+        user_workout_id=user_workout.id,
+        workout_title=workout_title,
+        profile=UserProfile.from_model(user),
+        streak=streak_info,
+        new_achievements=tuple(new_achievements)
+    )
+
+
+async def get_user_workout_stats(
+    session: AsyncSession,
+    user_id: int,
+    days: int = 30,
+    windows: list[int] | None = None
+) -> dict:
     """
     Получить статистику тренировок пользователя
-    days: количество дней для анализа
+    days: количество дней для анализа (total и средняя оценка)
+    windows: дополнительные окна, например [90, 365] -> ключи last_N_days
+             (last_7_days и last_30_days есть всегда)
+    
+    Все считается одним агрегатным запросом (условный COUNT по окнам и
+    AVG по CASE для оценки), без загрузки строк в Python.
     """
-    start_date = date.today() - timedelta(days=days)
+    today = date.today()
+    windows = sorted(set(windows or ()) | {7, 30, days})
+    start_date = today - timedelta(days=windows[-1])
+    period_start = today - timedelta(days=days)
+    
+    # Условный COUNT для каждого окна
+    window_columns = [
+        func.count(case((UserWorkout.date >= today - timedelta(days=n), 1))).label(f"last_{n}_days")
+        for n in windows
+    ]
+    
+    # Средняя оценка: easy=1, normal=2, hard=3, прочие непустые значения = 2
+    feeling_value = case(
+        (UserWorkout.date < period_start, None),
+        (UserWorkout.feeling.is_(None), None),
+        (UserWorkout.feeling == "", None),
+        (UserWorkout.feeling == "easy", 1),
+        (UserWorkout.feeling == "hard", 3),
+        else_=2
+    )
     
-    # Получаем все выполненные тренировки за период
     result = await session.execute(
-        select(UserWorkout).where(
+        select(*window_columns, func.avg(feeling_value).label("avg_feeling")).where(
             and_(
                 UserWorkout.user_id == user_id,
                 UserWorkout.date >= start_date,
@@ -111,21 +172,11 @@ async def get_user_workout_stats(session: AsyncSession, user_id: int, days: int
             )
         )
     )
-    workouts = list(result.scalars().all())
+    row = result.one()._mapping
     
-    # Подсчет статистики
-    total_count = len(workouts)
-    
-    # Последние 7 дней
-    last_7_days = date.today() - timedelta(days=7)
-    count_7_days = len([w for w in workouts if w.date >= last_7_days])
-    
-    # Средняя оценка
-    feelings = [w.feeling for w in workouts if w.feeling]
     avg_feeling = None
-    if feelings:
-        feeling_map = {"easy": 1, "normal": 2, "hard": 3}
-        avg_value = sum(feeling_map.get(f, 2) for f in feelings) / len(feelings)
+    avg_value = row["avg_feeling"]
+    if avg_value is not None:
         if avg_value < 1.5:
             avg_feeling = "easy"
         elif avg_value < 2.5:
@@ -133,12 +184,11 @@ async def get_user_workout_stats(session: AsyncSession, user_id: int, days: int
         else:
             avg_feeling = "hard"
     
-    return {
-        "total": total_count,
-        "last_7_days": count_7_days,
-        "last_30_days": total_count,
-        "average_feeling": avg_feeling
-    }
+    stats = {"total": row[f"last_{days}_days"]}
+    for n in windows:
+        stats[f"last_{n}_days"] = row[f"last_{n}_days"]
+    stats["average_feeling"] = avg_feeling
+    return stats
 
 
 async def create_workout_template(
@@ -164,6 +214,9 @@ async def create_workout_template(
     session.add(workout)
     await session.commit()
     await session.refresh(workout)
+    
+    # Каталог в памяти устарел - перезагрузится при следующем обращении
+    invalidate_workout_catalog()
     return workout
 
 
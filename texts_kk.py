@@ -149,6 +149,7 @@ AI = {
     "nutrition_loading": "🥗 Сіз үшін тамақтану кеңесін дайындап жатырмын...",
     "ai_loading": "🤖 Жауапты дайындап жатырмын...",
     "ai_advice": "🤖 AI кеңесі:\n\n{advice}",
+    "quota_exceeded": "ℹ️ Бүгінгі AI лимиті таусылды, сондықтан қысқа кеңес беремін. Ертең толық жауап аласыз.",
 }
 
 # Видео жаттығулар